@@ -8,6 +8,7 @@ from app.core import security
 from app.core.config import settings
 # Placeholder para lógica OAuth com Google
 from urllib.parse import urlencode
+from datetime import datetime, timedelta
 
 router = APIRouter()
 
@@ -73,6 +74,7 @@ async def google_callback(code: Optional[str] = None, error: Optional[str] = Non
     google_user_id = "google_user_id_123"
     google_access_token = "mock_google_access_token"
     google_refresh_token = "mock_google_refresh_token" # Se scope 'offline' foi pedido
+    google_token_expires_at = datetime.utcnow() + timedelta(seconds=3600) # "expires_in" da resposta do token endpoint
 
     user = db.query(models.User).filter(models.User.google_user_id == google_user_id).first()
     if not user:
@@ -86,6 +88,7 @@ async def google_callback(code: Optional[str] = None, error: Optional[str] = Non
                 google_user_id=google_user_id,
                 google_auth_token=google_access_token,
                 google_refresh_token=google_refresh_token,
+                google_token_expires_at=google_token_expires_at,
                 # hashed_password="", # Ou gere uma senha aleatória e improvável
                 full_name="User From Google" # Obter nome do userinfo
             )
@@ -94,9 +97,11 @@ async def google_callback(code: Optional[str] = None, error: Optional[str] = Non
             user.google_user_id = google_user_id
             user.google_auth_token = google_access_token
             user.google_refresh_token = google_refresh_token
+            user.google_token_expires_at = google_token_expires_at
     else: # Usuário já existe com este Google ID, atualizar tokens
         user.google_auth_token = google_access_token
         user.google_refresh_token = google_refresh_token
+        user.google_token_expires_at = google_token_expires_at
 
     db.commit()
     db.refresh(user)
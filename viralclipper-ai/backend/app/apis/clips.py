@@ -1,12 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlalchemy.orm import Session
-from typing import List, Optional # Adicionado Optional
+from typing import List, Optional, Literal # Adicionado Optional
 
 from app.db import models, database
+from app.db.pagination import paginate, InvalidCursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER
 from app.schemas import clips as clip_schemas
 from app.schemas import common as common_schemas # Para Msg de resposta
 from app.core import security
 from app.workers.tasks import process_video_clip_task # Importar a nova task
+from app.services.scene_index import snap_clip_bounds
+from app.services.youtube_analyzer import CLIP_MIN_DURATION_SECONDS
+from app.services.task_leases import render_lease_key, render_params_hash, lease_in_flight
 
 router = APIRouter()
 
@@ -14,8 +18,11 @@ router = APIRouter()
 @router.get("/project/{project_id}", response_model=List[clip_schemas.SuggestedClipResponse])
 def list_clips_for_project(
     project_id: int,
+    response: Response,
     db: Session = Depends(database.get_db),
-    current_user_id: str = Depends(security.decode_access_token)
+    current_user_id: str = Depends(security.decode_access_token),
+    cursor: Optional[str] = None, # Valor de X-Next-Cursor da página anterior
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
 ):
     if current_user_id is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
@@ -24,7 +31,13 @@ def list_clips_for_project(
     if not project or project.owner_id != int(current_user_id):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found or access denied")
 
-    clips = db.query(models.SuggestedClip).filter(models.SuggestedClip.project_id == project_id).order_by(models.SuggestedClip.timestamp_inicio_segundos).all()
+    query = db.query(models.SuggestedClip).filter(models.SuggestedClip.project_id == project_id)
+    try:
+        clips, next_cursor = paginate(query, [models.SuggestedClip.timestamp_inicio_segundos, models.SuggestedClip.id], limit, cursor)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     return clips
 
 # POST endpoint para aprovar e opcionalmente atualizar um clipe
@@ -32,6 +45,7 @@ def list_clips_for_project(
 def approve_and_process_clip(
     clip_id: int,
     clip_update_data: Optional[clip_schemas.SuggestedClipUpdate] = None, # Dados para micro-ajustes
+    render_mode: Literal["vertical", "straight_cut"] = "vertical", # straight_cut: corte sem crop (stream copy)
     db: Session = Depends(database.get_db),
     current_user_id: str = Depends(security.decode_access_token)
 ):
@@ -47,8 +61,22 @@ def approve_and_process_clip(
         update_data = clip_update_data.model_dump(exclude_unset=True)
         for key, value in update_data.items():
             setattr(clip, key, value)
+        if {"timestamp_inicio_segundos", "timestamp_fim_segundos"} & update_data.keys():
+            # Micro-ajuste manual: alinhar aos cortes de cena para não precisar de outro ajuste/render
+            clip.timestamp_inicio_segundos, clip.timestamp_fim_segundos = snap_clip_bounds(
+                clip.timestamp_inicio_segundos, clip.timestamp_fim_segundos, clip.project.scene_cuts_json,
+                min_duration=CLIP_MIN_DURATION_SECONDS
+            )
 
     clip.status_aprovacao = "approved"
+    params_hash = render_params_hash(clip.timestamp_inicio_segundos, clip.timestamp_fim_segundos, render_mode)
+    # Com outros limites/modo o render em andamento fica obsoleto: enfileirar, a task espera a lease do clipe
+    if lease_in_flight(db, render_lease_key(clip.id), params_hash):
+        # Duplo clique: o mesmo render já está em andamento; não reenfileirar nem resetar o status dele
+        db.commit()
+        db.refresh(clip)
+        return clip
+
     # Resetar status de processamento caso já tenha sido processado e está sendo re-aprovado com mudanças
     clip.processing_status = "pending_approval_processing"
     clip.processed_clip_path = None
@@ -58,7 +86,7 @@ def approve_and_process_clip(
     db.refresh(clip)
 
     # Disparar a tarefa de processamento do clipe
-    process_video_clip_task.delay(clip.id)
+    process_video_clip_task.delay(clip.id, render_mode=render_mode)
 
     return clip
 
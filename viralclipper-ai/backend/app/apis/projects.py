@@ -1,11 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlalchemy.orm import Session
-from typing import List # Adicionar List
+from typing import List, Optional # Adicionar List
 from app.db import models, database
+from app.db.pagination import paginate, InvalidCursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER
 from app.schemas import projects as project_schemas
+from app.schemas import common as common_schemas
 from app.core import security
-from celery import chain
-from app.workers.tasks import download_youtube_video_task, analyze_retention_task
+from celery import chain, chord
+from app.core.config import settings
+from app.services.source_store import release_source
+from app.workers.tasks import (
+    download_youtube_video_task, analyze_retention_task, process_project_clips_task,
+    fetch_video_metadata_task, download_clip_segments_task, finalize_project_pipeline_task
+)
 
 router = APIRouter()
 
@@ -38,6 +45,7 @@ def create_project(
         title_base=project_in.title_base,
         description_base=project_in.description_base, # Novo
         hashtags_base=project_in.hashtags_base,       # Novo
+        auto_render_top_n=settings.AUTO_RENDER_TOP_N if project_in.auto_render_top_n is None else project_in.auto_render_top_n,
         owner_id=user.id,
         status="pending_download"
     )
@@ -45,11 +53,24 @@ def create_project(
     db.commit()
     db.refresh(db_project)
 
-    # Create a Celery chain to ensure tasks run sequentially
-    processing_chain = chain(
-        download_youtube_video_task.s(db_project.id, str(db_project.youtube_url)),
-        analyze_retention_task.s()
-    )
+    # Create the Celery pipeline for the configured download strategy
+    if settings.DOWNLOAD_STRATEGY == "segments":
+        # Analisar primeiro (só metadados) e baixar apenas os trechos dos picos detectados
+        processing_chain = chain(
+            fetch_video_metadata_task.s(db_project.id, str(db_project.youtube_url)),
+            analyze_retention_task.s(),
+            download_clip_segments_task.s()
+        )
+    else:
+        # Metadados em segundos; a análise (só precisa de URL e duração) roda em paralelo ao download
+        # e o chord junta os dois ramos antes de liberar os clipes aprovados para render
+        processing_chain = chain(
+            fetch_video_metadata_task.s(db_project.id, str(db_project.youtube_url)),
+            chord(
+                [download_youtube_video_task.si(db_project.id, str(db_project.youtube_url)), analyze_retention_task.s()],
+                finalize_project_pipeline_task.s()
+            )
+        )
     processing_chain.apply_async()
 
     return db_project
@@ -57,15 +78,23 @@ def create_project(
 # NOVO: GET /api/v1/projects/ - Listar todos os projetos do usuário
 @router.get("/", response_model=List[project_schemas.ProjectResponse])
 def list_user_projects(
+    response: Response,
     db: Session = Depends(database.get_db),
     current_user_id: str = Depends(security.decode_access_token),
-    skip: int = 0, # Adicionar paginação básica
-    limit: int = 100 # Adicionar paginação básica
+    cursor: Optional[str] = None, # Valor de X-Next-Cursor da página anterior
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
 ):
     if current_user_id is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
 
-    projects = db.query(models.Project)        .filter(models.Project.owner_id == int(current_user_id))        .order_by(models.Project.created_at.desc())        .offset(skip)        .limit(limit)        .all()
+    # Keyset em (created_at, id), servido por ix_projects_owner_created: páginas profundas não varrem as anteriores
+    query = db.query(models.Project).filter(models.Project.owner_id == int(current_user_id))
+    try:
+        projects, next_cursor = paginate(query, [models.Project.created_at, models.Project.id], limit, cursor, descending=True)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     return projects
 
 # GET /api/v1/projects/{project_id} - Detalhes de um projeto (Existente)
@@ -82,3 +111,45 @@ def get_project_details(
     if not project:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found or not owned by user")
     return project
+
+# POST /api/v1/projects/{project_id}/render - Renderizar todos os clipes aprovados em uma única passada
+@router.post("/{project_id}/render", response_model=common_schemas.Msg, status_code=status.HTTP_202_ACCEPTED)
+def render_approved_clips(
+    project_id: int,
+    db: Session = Depends(database.get_db),
+    current_user_id: str = Depends(security.decode_access_token)
+):
+    if current_user_id is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+    project = db.query(models.Project).filter(models.Project.id == project_id, models.Project.owner_id == int(current_user_id)).first()
+    if not project:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found or not owned by user")
+
+    approved_count = db.query(models.SuggestedClip).filter(
+        models.SuggestedClip.project_id == project_id,
+        models.SuggestedClip.status_aprovacao == "approved"
+    ).count()
+    if approved_count == 0:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Project has no approved clips to render.")
+
+    process_project_clips_task.delay(project_id)
+    return {"message": f"Batch render of {approved_count} approved clips queued."}
+
+# DELETE /api/v1/projects/{project_id} - Remover projeto e liberar a referência ao vídeo compartilhado
+@router.delete("/{project_id}", response_model=common_schemas.Msg)
+def delete_project(
+    project_id: int,
+    db: Session = Depends(database.get_db),
+    current_user_id: str = Depends(security.decode_access_token)
+):
+    if current_user_id is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+    project = db.query(models.Project).filter(models.Project.id == project_id, models.Project.owner_id == int(current_user_id)).first()
+    if not project:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found or not owned by user")
+
+    # O arquivo só é apagado quando nenhum outro projeto aponta para ele
+    release_source(db, project)
+    db.delete(project)
+    db.commit()
+    return {"message": "Project deleted successfully"}
@@ -1,14 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
 
 from app.db import models, database
+from app.db.pagination import paginate, InvalidCursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER
 from app.schemas import publications as publication_schemas
 from app.schemas import common as common_schemas # Import for Msg
 from app.core import security
-from app.workers.tasks import publish_scheduled_video_task # Adicionar
-from datetime import datetime # Já deve estar lá
+from app.services.publication_scheduler import to_utc_naive
 
 router = APIRouter()
 
@@ -45,24 +45,33 @@ def schedule_clip_publication(
     db_publication = models.ScheduledPublication(
         suggested_clip_id=publication_in.suggested_clip_id,
         plataforma_destino=publication_in.plataforma_destino,
-        data_agendamento=publication_in.data_agendamento,
-        status_publicacao="pending" # Status inicial
+        data_agendamento=to_utc_naive(publication_in.data_agendamento),
+        status_publicacao="pending" # Status inicial; schedule_due_publications_task despacha no horário
     )
     db.add(db_publication)
     db.commit()
     db.refresh(db_publication)
 
-    # Disparar a tarefa de publicação (simulação no MVP ignora data_agendamento real)
-    print(f"MVP: Triggering immediate (simulated) publication for publication ID: {db_publication.id}")
-    publish_scheduled_video_task.delay(db_publication.id)
-
     return db_publication
 
+def _paginate_schedules(query, response: Response, limit: int, cursor: Optional[str]):
+    """One page of publications in schedule order (data_agendamento, id); sets X-Next-Cursor."""
+    try:
+        schedules, next_cursor = paginate(query, [models.ScheduledPublication.data_agendamento, models.ScheduledPublication.id], limit, cursor)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return schedules
+
 @router.get("/clip/{clip_id}", response_model=List[publication_schemas.ScheduledPublicationResponse])
 def list_schedules_for_clip(
     clip_id: int,
+    response: Response,
     db: Session = Depends(database.get_db),
-    current_user_id: str = Depends(security.decode_access_token)
+    current_user_id: str = Depends(security.decode_access_token),
+    cursor: Optional[str] = None, # Valor de X-Next-Cursor da página anterior
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
 ):
     if current_user_id is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
@@ -72,14 +81,17 @@ def list_schedules_for_clip(
     if not clip_check:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Clip not found or access denied")
 
-    schedules = db.query(models.ScheduledPublication)        .filter(models.ScheduledPublication.suggested_clip_id == clip_id)        .order_by(models.ScheduledPublication.data_agendamento)        .all()
-    return schedules
+    query = db.query(models.ScheduledPublication).filter(models.ScheduledPublication.suggested_clip_id == clip_id)
+    return _paginate_schedules(query, response, limit, cursor)
 
 @router.get("/project/{project_id}", response_model=List[publication_schemas.ScheduledPublicationResponse])
 def list_schedules_for_project(
     project_id: int,
+    response: Response,
     db: Session = Depends(database.get_db),
-    current_user_id: str = Depends(security.decode_access_token)
+    current_user_id: str = Depends(security.decode_access_token),
+    cursor: Optional[str] = None, # Valor de X-Next-Cursor da página anterior
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
 ):
     if current_user_id is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
@@ -88,8 +100,8 @@ def list_schedules_for_project(
     if not project_check:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found or access denied")
 
-    schedules = db.query(models.ScheduledPublication)        .join(models.SuggestedClip)        .filter(models.SuggestedClip.project_id == project_id)        .order_by(models.ScheduledPublication.data_agendamento)        .all()
-    return schedules
+    query = db.query(models.ScheduledPublication).join(models.SuggestedClip).filter(models.SuggestedClip.project_id == project_id)
+    return _paginate_schedules(query, response, limit, cursor)
 
 @router.delete("/{publication_id}", response_model=common_schemas.Msg)
 def delete_scheduled_publication(
@@ -105,8 +117,8 @@ def delete_scheduled_publication(
     if not publication:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Scheduled publication not found or access denied")
 
-    if publication.status_publicacao == "published" or publication.status_publicacao == "publishing":
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cannot delete a publication that is already published or currently publishing.")
+    if publication.status_publicacao in ("queued", "publishing", "published"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cannot delete a publication that is already queued, publishing or published.")
 
     db.delete(publication)
     db.commit()
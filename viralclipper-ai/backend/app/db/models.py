@@ -1,5 +1,5 @@
 # Modelos SQLAlchemy serão definidos aqui posteriormente
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, JSON, Float, Boolean # Adicionar Float, Boolean
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Text, ForeignKey, JSON, Float, Boolean, Index, func # Adicionar Float, Boolean
 from sqlalchemy.orm import relationship # Adicionar relationship
 from .database import Base
 from datetime import datetime # Adicionar datetime
@@ -15,11 +15,16 @@ class User(Base):
     google_user_id = Column(String, unique=True, index=True, nullable=True)
     google_auth_token = Column(Text, nullable=True) # Para armazenar access_token
     google_refresh_token = Column(Text, nullable=True) # Para armazenar refresh_token
+    google_token_expires_at = Column(DateTime, nullable=True) # Expiração do access_token (None = desconhecida, renovar antes de usar)
 
     projects = relationship("Project", back_populates="owner")
 
 class Project(Base):
     __tablename__ = "projects"
+    __table_args__ = (
+        # Listagem paginada (keyset): owner_id = ? AND (created_at, id) < cursor ORDER BY created_at DESC, id DESC
+        Index("ix_projects_owner_created", "owner_id", "created_at", "id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     title_base = Column(String, index=True)
     # Novos campos para Project
@@ -29,17 +34,43 @@ class Project(Base):
 
     youtube_url = Column(String, index=True, nullable=False)
     owner_id = Column(Integer, ForeignKey("users.id"))
-    created_at = Column(DateTime, default=datetime.utcnow)
+    # Chave do keyset: um NULL ficaria fora de toda comparação (created_at, id) < cursor e quebraria o cursor
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, server_default=func.now())
     status = Column(String, default="pending_download")
     original_video_path = Column(String, nullable=True)
+    source_segments_json = Column(JSON, nullable=True) # Estratégia "segments": [{"start", "end", "path"}]
+    source_format = Column(String, nullable=True) # Seletor yt-dlp escolhido pelo perfil de saída (ex: "136+140")
+    scene_cuts_json = Column(JSON, nullable=True) # Timestamps (s) ordenados das mudanças de cena da fonte
+    audio_loudness_json = Column(JSON, nullable=True) # {"loudness": [LUFS/s], "true_peak": [dBTP/s]} da fonte
     retention_data_json = Column(JSON, nullable=True)
+    retention_stream_state = Column(JSON, nullable=True) # Estado do StreamingPeakDetector entre chunks de analytics
+    auto_render_top_n = Column(Integer, nullable=True) # "Modo automático": renderiza os N melhores clipes sem aprovação (0/None = desligado)
     processing_error = Column(Text, nullable=True)
 
     owner = relationship("User", back_populates="projects")
     suggested_clips = relationship("SuggestedClip", back_populates="project", cascade="all, delete-orphan")
+    retention_chunks = relationship("RetentionChunk", cascade="all, delete-orphan")
+
+class RetentionChunk(Base):
+    """Retention points of one streamed analytics chunk, appended until the series is final."""
+    __tablename__ = "retention_chunks"
+    __table_args__ = (
+        # Pontos recentes de um projeto (contexto para pontuar os picos finalizados): last_timestamp >= ?
+        Index("ix_retention_chunks_project_last", "project_id", "last_timestamp"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    project_id = Column(Integer, ForeignKey("projects.id"), nullable=False)
+    first_timestamp = Column(Float, nullable=False)
+    last_timestamp = Column(Float, nullable=False)
+    points_json = Column(JSON, nullable=False) # [[timestamp, retention], ...] na ordem de chegada
+    created_at = Column(DateTime, default=datetime.utcnow)
 
 class SuggestedClip(Base):
     __tablename__ = "suggested_clips"
+    __table_args__ = (
+        # Listagem paginada (keyset) dos clipes de um projeto na ordem do vídeo
+        Index("ix_suggested_clips_project_inicio", "project_id", "timestamp_inicio_segundos", "id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     project_id = Column(Integer, ForeignKey("projects.id"), nullable=False)
 
@@ -59,6 +90,8 @@ class SuggestedClip(Base):
     processed_clip_path = Column(String, nullable=True)
     processing_status = Column(String, nullable=True) # ex: pending_processing, processing, processed, processing_failed
     processing_error_detail = Column(Text, nullable=True)
+    processing_progress = Column(Float, nullable=True) # 0-100, atualizado durante o render
+    requested_render_mode = Column(String, nullable=True) # Modo pedido na aprovação, usado quando o clipe espera o download
 
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -69,13 +102,22 @@ class SuggestedClip(Base):
 
 class ScheduledPublication(Base):
     __tablename__ = "scheduled_publications"
+    __table_args__ = (
+        # O scheduler busca "pending com data_agendamento <= agora" sem varrer a tabela
+        Index("ix_scheduled_publications_status_agendamento", "status_publicacao", "data_agendamento"),
+        # Listagem paginada (keyset) dos agendamentos de um clipe
+        Index("ix_scheduled_publications_clip_agendamento", "suggested_clip_id", "data_agendamento", "id"),
+        # Listagem de um projeto (join com suggested_clips): varre (data_agendamento, id) a partir do
+        # cursor já na ordem da página e para no LIMIT, sem ordenar todos os agendamentos do projeto
+        Index("ix_scheduled_publications_agendamento_id", "data_agendamento", "id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     suggested_clip_id = Column(Integer, ForeignKey("suggested_clips.id"), nullable=False)
 
     plataforma_destino = Column(String, nullable=False) # "youtube_shorts", "instagram_reels", "tiktok"
     data_agendamento = Column(DateTime, nullable=False)
 
-    status_publicacao = Column(String, default="pending") # pending, publishing, published, failed
+    status_publicacao = Column(String, default="pending") # pending, queued, publishing, published, failed
     id_publicacao_plataforma = Column(String, nullable=True) # ID do post na plataforma social
     metricas_desempenho_json = Column(JSON, nullable=True) # Para buscar depois
     publication_error = Column(Text, nullable=True)
@@ -84,3 +126,34 @@ class ScheduledPublication(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     suggested_clip = relationship("SuggestedClip", back_populates="scheduled_publications")
+
+
+class TaskLease(Base):
+    """Idempotency lease of a task execution (render of a clip output, a publication)."""
+    __tablename__ = "task_leases"
+    key = Column(String, primary_key=True) # ex: "render:clip:12" (um por arquivo de saída), "publish:34"
+    owner = Column(String, nullable=False) # Celery task id (uma redelivery reaproveita o mesmo id)
+    params_hash = Column(String, nullable=True) # Render: hash de início/fim/modo da execução que detém a lease
+    status = Column(String, nullable=False, default="running") # running, done, failed
+    expires_at = Column(DateTime, nullable=False) # running: lease; done: até quando o resultado é reaproveitado
+    result_json = Column(JSON, nullable=True)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class StageEvent(Base):
+    """Timing span of one pipeline stage (download, analysis, render, publish...) of a project/clip."""
+    __tablename__ = "stage_events"
+    id = Column(Integer, primary_key=True)
+    # Sem FK: telemetria sobrevive à remoção do projeto/clipe e o insert fica barato
+    project_id = Column(Integer, nullable=True, index=True)
+    clip_id = Column(Integer, nullable=True, index=True)
+    stage = Column(String(32), nullable=False)
+    status = Column(String(16), nullable=False, default="ok") # ok, failed
+    task_id = Column(String(64), nullable=True)
+    enqueued_at = Column(DateTime, nullable=True) # Publicação da mensagem (ou ETA); started_at - enqueued_at = espera na fila
+    started_at = Column(DateTime, nullable=False)
+    finished_at = Column(DateTime, nullable=False)
+    bytes_transferred = Column(BigInteger, nullable=True) # Baixados (download) ou enviados (publish)
+    render_speed_ratio = Column(Float, nullable=True) # Segundos de clipe por segundo de render
@@ -0,0 +1,53 @@
+import base64
+import json
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Query
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+NEXT_CURSOR_HEADER = "X-Next-Cursor" # O corpo continua sendo a lista; o cursor da próxima página vai no header
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values: Sequence) -> str:
+    """Opaque cursor of a row's sort key (base64url JSON; datetimes as ISO 8601)."""
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, columns: Sequence) -> tuple:
+    """Sort key of a cursor, converted back to the python types of `columns`."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(payload, list) or len(payload) != len(columns):
+            raise ValueError("wrong number of values")
+        return tuple(
+            datetime.fromisoformat(value) if column.type.python_type is datetime else column.type.python_type(value)
+            for column, value in zip(columns, payload)
+        )
+    except (ValueError, TypeError) as e: # binascii.Error e JSONDecodeError são ValueError
+        raise InvalidCursor(f"Invalid pagination cursor: {e}")
+
+
+def paginate(query: Query, columns: Sequence, limit: int, cursor: Optional[str] = None,
+             descending: bool = False) -> Tuple[List, Optional[str]]:
+    """
+    Keyset pagination: one page of `query` ordered by `columns` (the last one must be
+    unique, e.g. the id), starting right after `cursor`. Each page is an index range
+    scan whatever its depth, unlike OFFSET. Returns (rows, next cursor or None).
+    """
+    if cursor:
+        after = decode_cursor(cursor, columns)
+        key = tuple_(*columns)
+        query = query.filter(key < tuple_(*after) if descending else key > tuple_(*after))
+    query = query.order_by(*(column.desc() if descending else column.asc() for column in columns))
+    rows = query.limit(limit + 1).all() # Uma linha a mais diz se existe próxima página
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor([getattr(rows[-1], column.key) for column in columns])
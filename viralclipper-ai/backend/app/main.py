@@ -6,6 +6,8 @@ from app.apis import clips as clips_router
 from app.apis import publications as publications_router # Adicionar
 from app.apis import media as media_router # Adicionar
 from app.db.database import engine, Base
+from app.services.stage_metrics import metrics_registry
+from prometheus_client import make_asgi_app
 
 # Criar tabelas do banco de dados (apenas para desenvolvimento/teste inicial)
 # Em produção, usar Alembic para migrações
@@ -28,4 +30,7 @@ app.include_router(clips_router.router, prefix=f"{settings.API_V1_STR}/clips", t
 app.include_router(publications_router.router, prefix=f"{settings.API_V1_STR}/publications", tags=["publications"]) # Adicionar
 app.include_router(media_router.router, prefix=f"{settings.API_V1_STR}/media", tags=["media"]) # Adicionar
 
+# Métricas Prometheus (histogramas de estágio do pipeline; agrega os workers via PROMETHEUS_MULTIPROC_DIR)
+app.mount("/metrics", make_asgi_app(registry=metrics_registry()))
+
 # Outros routers serão adicionados aqui
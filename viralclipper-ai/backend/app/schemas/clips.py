@@ -29,6 +29,7 @@ class SuggestedClipResponse(SuggestedClipBase):
     updated_at: datetime
     processed_clip_path: Optional[str] = None
     processing_status: Optional[str] = None
+    processing_progress: Optional[float] = None
     # scheduled_publications: List['ScheduledPublicationResponse'] = [] # Adicionar depois
 
     class Config:
@@ -12,7 +12,7 @@ class ProjectBase(BaseModel):
     hashtags_base: Optional[List[str]] = None
 
 class ProjectCreate(ProjectBase):
-    pass
+    auto_render_top_n: Optional[int] = Field(None, ge=0, le=50) # None = settings.AUTO_RENDER_TOP_N
 
 class ProjectResponse(ProjectBase):
     id: int
@@ -23,6 +23,7 @@ class ProjectResponse(ProjectBase):
     duracao_video_original_segundos: Optional[int] = None
     retention_data_json: Optional[Any] = None
     processing_error: Optional[str] = None
+    auto_render_top_n: Optional[int] = None
     # suggested_clips: List['SuggestedClipResponse'] = [] # Adicionar depois com forward ref
 
     class Config:
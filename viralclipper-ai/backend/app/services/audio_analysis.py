@@ -0,0 +1,152 @@
+import math
+from collections import defaultdict
+from pathlib import Path
+from typing import Callable, List, Optional
+import numpy as np
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.db import models
+
+LOUDNESS_METADATA_FILENAME = "loudness_metadata.txt"
+SILENCE_LUFS = -70.0 # Gate absoluto do BS.1770; também o piso dos valores armazenados
+
+
+def build_loudness_command(source_path: Path, metadata_path: Path) -> list[str]:
+    """Audio-only decode through ebur128 (momentary loudness + true peak), metadata printed to a file."""
+    af = f"ebur128=metadata=1:peak=true,ametadata=mode=print:file='{metadata_path}'"
+    return ['ffmpeg', '-i', str(source_path), '-vn', '-sn', '-dn', '-af', af, '-f', 'null', '-']
+
+
+def _energy_mean(lufs: np.ndarray) -> float:
+    return float(10 * np.log10(np.mean(10 ** (lufs / 10))))
+
+
+def parse_loudness_metadata(text: str) -> dict:
+    """
+    Aggregates ebur128 frame metadata into per-second arrays: "loudness" (energy mean
+    of the momentary loudness, LUFS) and "true_peak" (max, dBTP).
+    """
+    momentary = defaultdict(list)
+    peaks = defaultdict(float)
+    second = None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("frame:"):
+            for field in line.split():
+                if field.startswith("pts_time:"):
+                    second = int(float(field.split(":", 1)[1]))
+        elif second is not None and line.startswith("lavfi.r128.M="):
+            value = float(line.split("=", 1)[1])
+            momentary[second].append(max(value, SILENCE_LUFS) if math.isfinite(value) else SILENCE_LUFS)
+        elif second is not None and line.startswith("lavfi.r128.true_peak="):
+            peaks[second] = max(peaks[second], float(line.split("=", 1)[1])) # Amplitude linear
+
+    length = max(momentary) + 1 if momentary else 0
+    loudness: List[Optional[float]] = [None] * length
+    true_peak: List[Optional[float]] = [None] * length
+    for sec, values in momentary.items():
+        loudness[sec] = round(_energy_mean(np.asarray(values)), 1)
+        peak = peaks.get(sec, 0.0)
+        true_peak[sec] = round(20 * math.log10(peak), 1) if peak > 0 else SILENCE_LUFS
+    return {"loudness": loudness, "true_peak": true_peak}
+
+
+def analyze_loudness(source_path: Path, work_dir: Path, run_command: Callable[..., None]) -> dict:
+    """Runs the ebur128 pass over one source file. Returns the per-second track."""
+    work_dir.mkdir(parents=True, exist_ok=True)
+    metadata_path = work_dir / LOUDNESS_METADATA_FILENAME
+    metadata_path.unlink(missing_ok=True)
+    run_command(build_loudness_command(source_path, metadata_path))
+    track = parse_loudness_metadata(metadata_path.read_text()) if metadata_path.exists() else {"loudness": [], "true_peak": []}
+    metadata_path.unlink(missing_ok=True)
+    return track
+
+
+def build_loudness_track(project: models.Project, db: Session, run_command: Callable[..., None]) -> dict:
+    """
+    Single loudness analysis pass over a project's source (full download or every
+    segment, placed on the original timeline). Stores the per-second track in
+    Project.audio_loudness_json; seconds without audio are null.
+    """
+    work_dir = Path(settings.MEDIA_ROOT_PATH) / f"project_{project.id}"
+    if project.original_video_path and Path(project.original_video_path).exists():
+        track = analyze_loudness(Path(project.original_video_path), work_dir, run_command)
+    elif project.source_segments_json:
+        track = {"loudness": [], "true_peak": []}
+        for segment in project.source_segments_json:
+            segment_track = analyze_loudness(Path(segment["path"]), work_dir, run_command)
+            for key, values in segment_track.items():
+                merged = track[key]
+                needed = segment["start"] + len(values)
+                merged.extend([None] * (needed - len(merged)))
+                for i, value in enumerate(values):
+                    if value is not None:
+                        merged[segment["start"] + i] = value
+    else:
+        raise ValueError(f"Project {project.id} has no downloaded source to analyze.")
+
+    project.audio_loudness_json = track
+    db.commit()
+    print(f"Project {project.id}: loudness track with {len(track['loudness'])} seconds.")
+    return track
+
+
+def loudness_array(track: Optional[dict], key: str = "loudness") -> np.ndarray:
+    """Track values as a float array, NaN where unknown."""
+    if not track:
+        return np.zeros(0)
+    return np.array([np.nan if value is None else value for value in track.get(key, [])], dtype=float)
+
+
+def measure_range(track: dict, start: float, end: float) -> Optional[dict]:
+    """
+    loudnorm-style measurement (BS.1770 gating on the per-second values) of
+    [start, end) seconds: integrated loudness, loudness range, true peak and the
+    relative gate threshold. None when the range has no usable audio.
+    """
+    loudness = loudness_array(track)[int(start):int(math.ceil(end))]
+    true_peak = loudness_array(track, "true_peak")[int(start):int(math.ceil(end))]
+    loudness = loudness[~np.isnan(loudness)]
+    gated = loudness[loudness > SILENCE_LUFS]
+    if len(gated) == 0:
+        return None
+
+    threshold = _energy_mean(gated) - 10 # Gate relativo de -10 LU
+    above = gated[gated > threshold]
+    integrated = _energy_mean(above) if len(above) else _energy_mean(gated)
+
+    # LRA (EBU Tech 3342): short-term de 3s, gate relativo de -20 LU, percentis 10-95
+    if len(gated) >= 3:
+        energy = 10 ** (gated / 10)
+        short_term = 10 * np.log10(np.convolve(energy, np.ones(3) / 3, mode="valid"))
+    else:
+        short_term = gated
+    short_term = short_term[short_term > _energy_mean(short_term) - 20]
+    lra = float(np.percentile(short_term, 95) - np.percentile(short_term, 10)) if len(short_term) else 0.0
+
+    peaks = true_peak[~np.isnan(true_peak)]
+    return {
+        "measured_I": round(integrated, 2),
+        "measured_LRA": round(lra, 2),
+        "measured_TP": round(float(peaks.max()) if len(peaks) else SILENCE_LUFS, 2),
+        "measured_thresh": round(threshold, 2),
+    }
+
+
+def build_loudnorm_filter(measurement: Optional[dict]) -> str:
+    """
+    Single-pass linear loudnorm using a precomputed measurement ('' without one).
+    loudnorm works at 192 kHz internally, so the output is resampled back to 48 kHz.
+    """
+    if not measurement:
+        return ""
+    params = ":".join(f"{key}={value}" for key, value in measurement.items())
+    return (f"loudnorm=I={settings.LOUDNORM_TARGET_I}:TP={settings.LOUDNORM_TARGET_TP}:"
+            f"LRA={settings.LOUDNORM_TARGET_LRA}:{params}:linear=true,aresample=48000")
+
+
+def clip_loudnorm_filter(project: models.Project, start: float, end: float) -> str:
+    """Loudness normalization filter for a clip of the project (original timeline seconds), or ''."""
+    if not settings.AUDIO_LOUDNORM_ENABLED or not project.audio_loudness_json:
+        return ""
+    return build_loudnorm_filter(measure_range(project.audio_loudness_json, start, end))
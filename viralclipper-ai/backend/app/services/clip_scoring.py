@@ -0,0 +1,119 @@
+import heapq
+from typing import List, Tuple, Optional
+import numpy as np
+from app.core.config import settings
+from app.services.youtube_analyzer import (
+    pad_retention_series, moving_average_matrix, CLIP_MIN_DURATION_SECONDS, CLIP_MAX_DURATION_SECONDS
+)
+from app.services.audio_analysis import loudness_array, SILENCE_LUFS
+
+# Escala da inclinação (pontos de retenção por segundo) usada na normalização via tanh
+SLOPE_SCALE = 0.5
+# Escala (LU acima/abaixo da mediana da fonte) da feature de áudio, também via tanh
+AUDIO_LU_SCALE = 6.0
+
+
+def score_clip_candidates(
+    retention_data: List[Tuple[int, float]],
+    candidates: List[Tuple[int, int]],
+    moving_average_window: int = 12,
+    weights: Optional[dict] = None,
+    loudness: Optional[dict] = None,
+) -> np.ndarray:
+    """
+    Virality score (0-100) of every candidate (start, end) window, all computed at once.
+
+    Combines four signals over each candidate window (three from its retention points, one from audio):
+    - height: mean relative height of retention above its moving average;
+    - area: area under the retention curve per second (mean retention, in %);
+    - slope: least-squares slope of retention (rising or flat beats decaying);
+    - audio: mean loudness of the window relative to the source median, when the
+      project's cached loudness track (audio_analysis) is given.
+    Each signal is mapped to [0, 1] and weighted by settings.CLIP_SCORE_WEIGHTS;
+    without a loudness track the remaining weights are renormalized.
+    """
+    if not candidates or not retention_data:
+        return np.zeros(len(candidates))
+    weights = weights or settings.CLIP_SCORE_WEIGHTS
+
+    timestamps, values, lengths = pad_retention_series([retention_data])
+    times, retention = timestamps[0].astype(float), values[0]
+    moving_average = moving_average_matrix(values, lengths, moving_average_window)[0]
+    relative_height = np.divide(retention - moving_average, moving_average,
+                                out=np.zeros_like(retention), where=moving_average > 0)
+
+    bounds = np.asarray(candidates, dtype=float)
+    first = np.searchsorted(times, bounds[:, 0], side="left")
+    last = np.maximum(np.searchsorted(times, bounds[:, 1], side="left"), first + 1) # Pelo menos um ponto
+    last = np.minimum(last, len(times))
+    first = np.minimum(first, last - 1)
+    count = last - first
+
+    # Matriz (candidatos x pontos da janela) com máscara: estatísticas centradas por janela,
+    # sem o cancelamento numérico de somas acumuladas de t² em vídeos longos
+    offsets = np.arange(count.max())
+    index = first[:, None] + offsets[None, :]
+    mask = offsets[None, :] < count[:, None]
+    index = np.where(mask, index, 0)
+    window_times, window_retention = times[index], retention[index]
+
+    height = np.clip(np.where(mask, relative_height[index], 0.0).sum(axis=1) / count, 0.0, 1.0)
+    mean_retention = np.where(mask, window_retention, 0.0).sum(axis=1) / count
+    area = np.clip(mean_retention / 100.0, 0.0, 1.0)
+    centered_t = np.where(mask, window_times - (np.where(mask, window_times, 0.0).sum(axis=1) / count)[:, None], 0.0)
+    centered_r = np.where(mask, window_retention - mean_retention[:, None], 0.0)
+    variance = (centered_t ** 2).sum(axis=1)
+    slope = np.divide((centered_t * centered_r).sum(axis=1), variance, out=np.zeros(len(count)), where=variance > 0)
+    slope_score = 0.5 + 0.5 * np.tanh(slope / SLOPE_SCALE)
+
+    features = {"height": height, "area": area, "slope": slope_score}
+    audio_score = _audio_feature(loudness, bounds)
+    if audio_score is not None:
+        features["audio"] = audio_score
+
+    total_weight = sum(weights.get(name, 0) for name in features) or 1.0
+    score = sum(weights.get(name, 0) * feature for name, feature in features.items()) / total_weight
+    return np.round(score * 100.0, 2)
+
+
+def _audio_feature(loudness: Optional[dict], bounds: np.ndarray) -> Optional[np.ndarray]:
+    """Per-candidate [0, 1] loudness feature from the per-second track, or None without usable audio."""
+    values = loudness_array(loudness)
+    known = ~np.isnan(values) & (values > SILENCE_LUFS)
+    if not known.any():
+        return None
+    median = np.median(values[known])
+    # Somas acumuladas por segundo: média de cada janela em O(1)
+    filled = np.where(known, values, 0.0)
+    value_sums = np.concatenate(([0.0], np.cumsum(filled)))
+    known_counts = np.concatenate(([0], np.cumsum(known)))
+    first = np.clip(bounds[:, 0].astype(int), 0, len(values))
+    last = np.clip(np.ceil(bounds[:, 1]).astype(int), 0, len(values))
+    count = known_counts[last] - known_counts[first]
+    mean = np.divide(value_sums[last] - value_sums[first], count, out=np.full(len(bounds), median), where=count > 0)
+    return 0.5 + 0.5 * np.tanh((mean - median) / AUDIO_LU_SCALE)
+
+
+def top_k_clips(candidates: List[Tuple[int, int]], scores, k: int) -> List[Tuple[int, int, float]]:
+    """The k best (start, end, score) candidates, best first (heap selection, O(n log k))."""
+    best = heapq.nlargest(k, zip(scores, range(len(candidates))))
+    return [(candidates[i][0], candidates[i][1], float(score)) for score, i in best]
+
+
+def rank_clip_candidates(
+    retention_data: List[Tuple[int, float]],
+    peaks: List[Tuple[int, int]],
+    top_k: Optional[int] = None,
+    loudness: Optional[dict] = None,
+) -> List[Tuple[int, int, float]]:
+    """
+    Scoring stage after detect_retention_peaks: drops peaks outside the clip duration
+    bounds, scores the rest (with the audio feature when a loudness track is given)
+    and keeps the top_k (settings.CLIP_TOP_K) best.
+    """
+    candidates = [
+        (start, end) for start, end in peaks
+        if CLIP_MIN_DURATION_SECONDS <= end - start <= CLIP_MAX_DURATION_SECONDS
+    ]
+    scores = score_clip_candidates(retention_data, candidates, loudness=loudness)
+    return top_k_clips(candidates, scores, settings.CLIP_TOP_K if top_k is None else top_k)
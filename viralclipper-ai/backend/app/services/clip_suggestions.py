@@ -0,0 +1,117 @@
+from bisect import bisect_left
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+from app.db import models
+from app.services.youtube_analyzer import CLIP_MIN_DURATION_SECONDS, CLIP_MAX_DURATION_SECONDS
+
+STATUS_PENDING = "pending"
+MATCH_MIN_OVERLAP = 0.5 # IoU a partir do qual um candidato é o "mesmo momento" de um clipe existente
+
+
+@dataclass
+class ClipSyncResult:
+    inserted: int = 0
+    updated: int = 0 # Pendentes reencontrados cujo score mudou
+    deleted: int = 0
+    total: int = 0 # Clipes do projeto após a sincronização
+
+
+def interval_overlap(a_start: float, a_end: float, b_start: float, b_end: float) -> float:
+    """Intersection over union of two [start, end] intervals (0 when disjoint)."""
+    intersection = min(a_end, b_end) - max(a_start, b_start)
+    if intersection <= 0:
+        return 0.0
+    return intersection / (max(a_end, b_end) - min(a_start, b_start))
+
+
+class IntervalIndex:
+    """
+    Intervals sorted by start. Intervals that may overlap [start, end] start in
+    (start - longest, end), so a lookup is a bisect plus a short scan.
+    """
+
+    def __init__(self):
+        self._starts: List[float] = []
+        self._items: List[tuple] = [] # (start, end, payload), na ordem de _starts
+        self._longest = 0.0
+
+    def add(self, start: float, end: float, payload=None):
+        position = bisect_left(self._starts, start)
+        self._starts.insert(position, start)
+        self._items.insert(position, (start, end, payload))
+        self._longest = max(self._longest, end - start)
+
+    def best_match(self, start: float, end: float, min_overlap: float = MATCH_MIN_OVERLAP) -> Optional[tuple]:
+        """The (start, end, payload) overlapping [start, end] the most, if it reaches min_overlap."""
+        best, best_overlap = None, min_overlap
+        for item in self._items[bisect_left(self._starts, start - self._longest):bisect_left(self._starts, end)]:
+            overlap = interval_overlap(start, end, item[0], item[1])
+            if overlap >= best_overlap:
+                best, best_overlap = item, overlap
+        return best
+
+
+def _candidate_score(candidate: Tuple) -> float:
+    return candidate[2] if len(candidate) > 2 and candidate[2] is not None else 0.0
+
+
+def sync_suggested_clips(db: Session, project_id: int, candidates: Sequence[Tuple],
+                         replace_pending: bool = True) -> ClipSyncResult:
+    """
+    Reconciles the project's suggestions with the (start, end[, score]) candidates of an
+    analysis, by interval overlap:
+
+    - a candidate matching an approved/rejected clip is dropped (the user already decided);
+    - a candidate matching a pending clip keeps that row (only its score is refreshed);
+    - the remaining candidates are inserted, with no duplicates among themselves;
+    - with replace_pending, pending clips no candidate matched are deleted, unless they
+      were already queued for render (auto mode).
+
+    One SELECT plus at most one DELETE, one UPDATE and one multi-row INSERT; nothing is
+    committed, so the caller decides the transaction.
+    """
+    existing = db.query(
+        models.SuggestedClip.id, models.SuggestedClip.timestamp_inicio_segundos, models.SuggestedClip.timestamp_fim_segundos,
+        models.SuggestedClip.status_aprovacao, models.SuggestedClip.processing_status, models.SuggestedClip.score_viralidade_inicial
+    ).filter(models.SuggestedClip.project_id == project_id).all()
+
+    index = IntervalIndex()
+    for clip in existing:
+        index.add(clip.timestamp_inicio_segundos, clip.timestamp_fim_segundos, clip)
+
+    new_rows, score_updates, matched_ids = [], {}, set()
+    # Melhores primeiro: entre candidatos sobrepostos, fica o de maior score
+    for start_time, end_time, *score in sorted(candidates, key=_candidate_score, reverse=True):
+        clip_duration = end_time - start_time
+        if not (CLIP_MIN_DURATION_SECONDS <= clip_duration <= CLIP_MAX_DURATION_SECONDS): # Ex: clipes entre 10s e 3 minutos
+            print(f"Skipping peak ({start_time}-{end_time}) for project {project_id} due to duration: {clip_duration}s")
+            continue
+        score = score[0] if score else None
+        match = index.best_match(start_time, end_time)
+        if match is not None:
+            clip = match[2]
+            if clip is not None and clip.status_aprovacao == STATUS_PENDING and clip.id not in matched_ids:
+                matched_ids.add(clip.id)
+                if score is not None and score != clip.score_viralidade_inicial:
+                    score_updates[clip.id] = score
+            continue
+        new_rows.append({"project_id": project_id, "timestamp_inicio_segundos": start_time,
+                         "timestamp_fim_segundos": end_time, "score_viralidade_inicial": score})
+        index.add(start_time, end_time) # Candidatos seguintes não duplicam este
+
+    stale_ids = [clip.id for clip in existing
+                 if replace_pending and clip.status_aprovacao == STATUS_PENDING
+                 and clip.id not in matched_ids and clip.processing_status is None]
+
+    if stale_ids:
+        db.query(models.SuggestedClip).filter(models.SuggestedClip.id.in_(stale_ids)).delete(synchronize_session=False)
+    if score_updates:
+        db.execute(update(models.SuggestedClip), [
+            {"id": clip_id, "score_viralidade_inicial": score} for clip_id, score in score_updates.items()
+        ])
+    if new_rows:
+        db.execute(insert(models.SuggestedClip), new_rows) # executemany/insertmanyvalues: um INSERT de várias linhas
+    return ClipSyncResult(inserted=len(new_rows), updated=len(score_updates), deleted=len(stale_ids),
+                          total=len(existing) - len(stale_ids) + len(new_rows))
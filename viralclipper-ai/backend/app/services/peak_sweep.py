@@ -0,0 +1,143 @@
+"""
+Parameter sweep for retention peak detection: evaluates a grid of
+(moving_average_window, peak_threshold_factor, merge_distance_seconds) over many
+retention series in one vectorized pass.
+
+Usage (from viralclipper-ai/backend, over Project.retention_data_json):
+    python -m app.services.peak_sweep --windows 6,12,18 --factors 1.05,1.1,1.15,1.2 --merge-distances 5,15,30
+"""
+import argparse
+import json
+from typing import List, Tuple, Optional
+import numpy as np
+from app.services.youtube_analyzer import (
+    pad_retention_series, moving_average_matrix, settle_moving_average_ties, peak_state_matrix, raw_peak_arrays, merged_peak_arrays,
+    CLIP_MIN_DURATION_SECONDS, CLIP_MAX_DURATION_SECONDS
+)
+
+
+def _duration_stats(durations: np.ndarray) -> dict:
+    if len(durations) == 0:
+        return {"duration_mean": None, "duration_p10": None, "duration_p50": None, "duration_p90": None}
+    p10, p50, p90 = np.percentile(durations, [10, 50, 90])
+    return {
+        "duration_mean": round(float(durations.mean()), 2),
+        "duration_p10": float(p10),
+        "duration_p50": float(p50),
+        "duration_p90": float(p90),
+    }
+
+
+def sweep_peak_parameters(
+    retention_series: List[List[Tuple[int, float]]],
+    windows: List[int],
+    factors: List[float],
+    merge_distances: List[float],
+) -> List[dict]:
+    """
+    Runs detect_retention_peaks semantics for every parameter combination and returns
+    one summary per combination: peak and clip counts (clips = peaks within the
+    suggested-clip duration bounds) and the duration distribution of the peaks.
+
+    Moving averages are computed once per window and shared by all thresholds. All
+    thresholds are evaluated together as stacked rows, and the raw peaks of a
+    threshold are shared by every merge distance.
+    """
+    timestamps, values, lengths = pad_retention_series(retention_series)
+    n_series = len(retention_series)
+    results = []
+    if n_series == 0 or values.shape[1] == 0:
+        return results
+
+    n_factors = len(factors)
+    stacked_values = np.tile(values, (n_factors, 1))
+    stacked_timestamps = np.tile(timestamps, (n_factors, 1))
+    stacked_lengths = np.tile(lengths, n_factors)
+    row_factors = np.repeat(np.asarray(factors, dtype=float), n_series)[:, None]
+
+    for window in windows:
+        moving_average = np.tile(moving_average_matrix(values, lengths, window), (n_factors, 1))
+        moving_average = settle_moving_average_ties(stacked_values, moving_average, stacked_lengths, window, row_factors)
+        state = peak_state_matrix(stacked_values, moving_average, stacked_lengths, row_factors)
+        raw_rows, raw_starts, raw_ends = raw_peak_arrays(stacked_timestamps, state, stacked_lengths)
+
+        for merge_distance in merge_distances:
+            rows, starts, ends = merged_peak_arrays(raw_rows, raw_starts, raw_ends, merge_distance)
+            durations = ends - starts
+            factor_index = rows // n_series
+            in_bounds = (durations >= CLIP_MIN_DURATION_SECONDS) & (durations <= CLIP_MAX_DURATION_SECONDS)
+            peak_counts = np.bincount(factor_index, minlength=n_factors)
+            clip_counts = np.bincount(factor_index, weights=in_bounds, minlength=n_factors).astype(int)
+            too_short = np.bincount(factor_index, weights=durations < CLIP_MIN_DURATION_SECONDS, minlength=n_factors).astype(int)
+
+            for i, factor in enumerate(factors):
+                factor_durations = durations[factor_index == i]
+                results.append({
+                    "moving_average_window": window,
+                    "peak_threshold_factor": factor,
+                    "merge_distance_seconds": merge_distance,
+                    "series": n_series,
+                    "peaks": int(peak_counts[i]),
+                    "clips": int(clip_counts[i]),
+                    "clips_per_series": round(clip_counts[i] / n_series, 3),
+                    "too_short": int(too_short[i]),
+                    "too_long": int(peak_counts[i] - clip_counts[i] - too_short[i]),
+                    **_duration_stats(factor_durations),
+                })
+    return results
+
+
+def load_stored_retention_series(limit: Optional[int] = None) -> List[List[Tuple[int, float]]]:
+    """Retention series stored on projects (Project.retention_data_json)."""
+    from app.db.database import SessionLocal
+    from app.db import models
+
+    db = SessionLocal()
+    try:
+        query = db.query(models.Project.retention_data_json).filter(models.Project.retention_data_json.isnot(None)) \
+            .order_by(models.Project.id.desc())
+        if limit:
+            query = query.limit(limit)
+        return [[tuple(point) for point in row[0]] for row in query if row[0]]
+    finally:
+        db.close()
+
+
+def _parse_list(value: str, cast):
+    return [cast(item) for item in value.split(",") if item.strip()]
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Sweep retention peak-detection parameters over stored projects.")
+    parser.add_argument("--windows", default="6,12,18", help="Moving average windows (points), comma separated")
+    parser.add_argument("--factors", default="1.05,1.1,1.15,1.2,1.3", help="Peak threshold factors, comma separated")
+    parser.add_argument("--merge-distances", default="5,15,30", help="Merge distances (seconds), comma separated")
+    parser.add_argument("--limit", type=int, default=None, help="Only the N most recent projects")
+    parser.add_argument("--sort-by", default="clips_per_series", help="Result field to sort the table by")
+    parser.add_argument("--output", default=None, help="Write the full results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    series = load_stored_retention_series(args.limit)
+    print(f"Sweeping {len(series)} retention series.")
+    results = sweep_peak_parameters(
+        series,
+        _parse_list(args.windows, int),
+        _parse_list(args.factors, float),
+        _parse_list(args.merge_distances, float),
+    )
+    results.sort(key=lambda r: (r[args.sort_by] is None, r[args.sort_by]), reverse=True)
+
+    columns = ["moving_average_window", "peak_threshold_factor", "merge_distance_seconds", "peaks", "clips",
+               "clips_per_series", "too_short", "too_long", "duration_p10", "duration_p50", "duration_p90"]
+    print("\t".join(columns))
+    for result in results:
+        print("\t".join(str(result[column]) for column in columns))
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
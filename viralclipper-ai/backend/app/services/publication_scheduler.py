@@ -0,0 +1,77 @@
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Tuple
+from sqlalchemy.orm import Session, Query
+from app.db import models
+
+STATUS_PENDING = "pending"
+STATUS_QUEUED = "queued" # Reivindicada por um scheduler e despachada com ETA
+
+
+def to_utc_naive(moment: datetime) -> datetime:
+    """data_agendamento is stored as naive UTC (like every other timestamp in the models)."""
+    if moment.tzinfo is None:
+        return moment
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def due_publications_query(db: Session, until: datetime, batch_size: int) -> Query:
+    """
+    Pending publications due up to `until`, oldest first, locked for this transaction.
+    Served by the (status_publicacao, data_agendamento) index; SKIP LOCKED lets several
+    scheduler replicas claim disjoint batches without waiting on each other.
+    """
+    return db.query(models.ScheduledPublication.id, models.ScheduledPublication.data_agendamento).filter(
+        models.ScheduledPublication.status_publicacao == STATUS_PENDING,
+        models.ScheduledPublication.data_agendamento <= until
+    ).order_by(models.ScheduledPublication.data_agendamento).limit(batch_size).with_for_update(skip_locked=True)
+
+
+def claim_due_publications(db: Session, until: datetime, batch_size: int) -> List[Tuple[int, datetime]]:
+    """Marks one batch of due publications as queued and returns their (id, data_agendamento)."""
+    claimed = due_publications_query(db, until, batch_size).all()
+    if claimed:
+        db.query(models.ScheduledPublication).filter(
+            models.ScheduledPublication.id.in_([publication_id for publication_id, _ in claimed])
+        ).update({"status_publicacao": STATUS_QUEUED}, synchronize_session=False)
+    db.commit() # Libera os locks
+    return [(publication_id, scheduled_at) for publication_id, scheduled_at in claimed]
+
+
+def requeue_stale_publications(db: Session, now: datetime, stale_after_seconds: int) -> int:
+    """
+    Returns to pending the publications still queued stale_after_seconds after both their
+    scheduled time (their ETA is at most one bucket later) and their claim. Their batch
+    never reached the broker, or the scheduler died between the claim commit and the
+    dispatch. A late duplicate of a batch that did run is harmless: uploads are leased.
+    """
+    threshold = now - timedelta(seconds=stale_after_seconds)
+    requeued = db.query(models.ScheduledPublication).filter(
+        models.ScheduledPublication.status_publicacao == STATUS_QUEUED,
+        models.ScheduledPublication.data_agendamento < threshold,
+        models.ScheduledPublication.updated_at < threshold
+    ).update({"status_publicacao": STATUS_PENDING}, synchronize_session=False)
+    db.commit()
+    return requeued
+
+
+def bucket_by_eta(claimed: List[Tuple[int, datetime]], bucket_seconds: int, max_batch: int) -> Dict[datetime, List[List[int]]]:
+    """
+    Groups claimed publications into ETA buckets of bucket_seconds. Each bucket's ETA is
+    its latest scheduled time, so nothing is published early and nothing waits more than
+    bucket_seconds. Buckets are split into batches of at most max_batch publications.
+    """
+    buckets = defaultdict(list)
+    for publication_id, scheduled_at in claimed:
+        bucket_start = int(scheduled_at.replace(tzinfo=timezone.utc).timestamp()) // bucket_seconds
+        buckets[bucket_start].append((publication_id, scheduled_at))
+    batches = {}
+    for members in buckets.values():
+        eta = max(scheduled_at for _, scheduled_at in members)
+        ids = [publication_id for publication_id, _ in members]
+        batches[eta] = [ids[i:i + max_batch] for i in range(0, len(ids), max_batch)]
+    return batches
+
+
+def scheduler_horizon(now: datetime, lookahead_seconds: int) -> datetime:
+    return now + timedelta(seconds=lookahead_seconds)
@@ -0,0 +1,109 @@
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+MANIFEST_FILENAME = "manifest.json"
+LOCK_FILENAME = "manifest.lock"
+
+
+def source_identity(source_path: Path) -> dict:
+    """Identifies a source file by path, size and modification time."""
+    stat = source_path.stat()
+    return {"path": str(source_path.resolve()), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def make_render_key(source_path: Path, start: float, end: float, filter_graph: str, encoder_args: list[str]) -> str:
+    """Hashes everything that influences the rendered bytes into a cache key."""
+    payload = {
+        "source": source_identity(source_path),
+        "start": start,
+        "end": end,
+        "filter_graph": filter_graph,
+        "encoder_args": list(encoder_args),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def link_or_copy(source: Path, destination: Path):
+    """Atomically places source at destination, hard linking when possible."""
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = destination.with_name(f".{destination.name}.{os.getpid()}.tmp")
+    tmp_path.unlink(missing_ok=True)
+    try:
+        os.link(source, tmp_path)
+    except OSError:
+        shutil.copy2(source, tmp_path)
+    os.replace(tmp_path, destination)
+
+
+class RenderCache:
+    """
+    Content-addressed store of rendered clips with an LRU byte budget.
+
+    Entries live in `root/<key>.mp4` and are tracked in `root/manifest.json`
+    (size and last access per key). Files handed out to callers are hard links,
+    so evicting an entry never removes a clip that is already in use.
+    """
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+
+    def entry_path(self, key: str) -> Path:
+        return self.root / f"{key}.mp4"
+
+    @contextmanager
+    def _locked_manifest(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.root / LOCK_FILENAME, "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            manifest_path = self.root / MANIFEST_FILENAME
+            manifest = {}
+            if manifest_path.exists():
+                try:
+                    manifest = json.loads(manifest_path.read_text())
+                except ValueError:
+                    manifest = {}
+            yield manifest
+            tmp_path = manifest_path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(manifest))
+            os.replace(tmp_path, manifest_path)
+
+    def fetch(self, key: str, destination: Path) -> bool:
+        """Places the cached render for key at destination. Returns False on a miss."""
+        with self._locked_manifest() as manifest:
+            entry = manifest.get(key)
+            path = self.entry_path(key)
+            if not entry or not path.exists():
+                manifest.pop(key, None)
+                return False
+            entry["last_access"] = time.time()
+            link_or_copy(path, destination)
+            return True
+
+    def store(self, key: str, rendered_path: Path):
+        """Adds a freshly rendered file to the cache and evicts old entries over budget."""
+        with self._locked_manifest() as manifest:
+            link_or_copy(rendered_path, self.entry_path(key))
+            manifest[key] = {"size": rendered_path.stat().st_size, "last_access": time.time()}
+            self._evict(manifest, keep=key)
+
+    def _evict(self, manifest: dict, keep: str | None = None):
+        total = sum(entry["size"] for entry in manifest.values())
+        for key in sorted(manifest, key=lambda k: manifest[k]["last_access"]):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= manifest.pop(key)["size"]
+            self.entry_path(key).unlink(missing_ok=True)
+            print(f"Render cache: evicted {key}")
+
+    def total_bytes(self) -> int:
+        with self._locked_manifest() as manifest:
+            return sum(entry["size"] for entry in manifest.values())
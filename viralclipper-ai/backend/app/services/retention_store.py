@@ -0,0 +1,38 @@
+from typing import List, Sequence, Tuple
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from app.db import models
+
+
+def append_retention_chunk(db: Session, project_id: int, points: Sequence[Tuple[int, float]]):
+    """Stores only the new points of a streamed chunk (one INSERT); nothing is committed."""
+    if not points:
+        return
+    db.execute(insert(models.RetentionChunk).values(
+        project_id=project_id, first_timestamp=points[0][0], last_timestamp=points[-1][0],
+        points_json=[list(point) for point in points]
+    ))
+
+
+def load_retention_since(db: Session, project_id: int, since: float) -> List[Tuple[int, float]]:
+    """
+    Streamed points of the chunks that reach `since` or later, in order. Whole chunks are
+    returned, so the series may start a little before `since`.
+    """
+    chunks = db.query(models.RetentionChunk.points_json).filter(
+        models.RetentionChunk.project_id == project_id,
+        models.RetentionChunk.last_timestamp >= since
+    ).order_by(models.RetentionChunk.id).all()
+    return [tuple(point) for chunk in chunks for point in chunk.points_json]
+
+
+def retention_series(db: Session, project: models.Project) -> List[Tuple[int, float]]:
+    """Full retention series of a project: the stored series plus chunks still being streamed."""
+    series = [tuple(point) for point in project.retention_data_json or []]
+    return series + load_retention_since(db, project.id, float("-inf"))
+
+
+def consolidate_retention_chunks(db: Session, project: models.Project):
+    """Moves the streamed chunks into retention_data_json once the series is final (single O(n) pass)."""
+    project.retention_data_json = [list(point) for point in retention_series(db, project)]
+    db.query(models.RetentionChunk).filter(models.RetentionChunk.project_id == project.id).delete(synchronize_session=False)
@@ -0,0 +1,101 @@
+import bisect
+import math
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.db import models
+from app.services.video_processor import run_ffmpeg_command
+
+SCENE_METADATA_FILENAME = "scene_metadata.txt"
+
+
+def build_scene_detection_command(source_path: Path, metadata_path: Path,
+                                  threshold: float, scale_width: int) -> list[str]:
+    """Decodes a downscaled, video-only stream and prints the pts_time of every scene change."""
+    vf = f"scale={scale_width}:-2,select='gt(scene,{threshold})',metadata=print:file='{metadata_path}'"
+    return ['ffmpeg', '-i', str(source_path), '-an', '-sn', '-dn', '-vf', vf, '-f', 'null', '-']
+
+
+def parse_scene_metadata(text: str) -> List[float]:
+    """Extracts the sorted pts_time values from ffmpeg's metadata=print output."""
+    cuts = []
+    for line in text.splitlines():
+        for field in line.split():
+            if field.startswith("pts_time:"):
+                cuts.append(round(float(field.split(":", 1)[1]), 3))
+    return sorted(cuts)
+
+
+def detect_scene_cuts(source_path: Path, work_dir: Path, threshold: Optional[float] = None,
+                      scale_width: Optional[int] = None,
+                      run_command: Callable[..., None] = run_ffmpeg_command) -> List[float]:
+    """Runs ffmpeg scene detection over source_path. Returns sorted cut timestamps (seconds)."""
+    work_dir.mkdir(parents=True, exist_ok=True)
+    metadata_path = work_dir / SCENE_METADATA_FILENAME
+    metadata_path.unlink(missing_ok=True)
+    run_command(build_scene_detection_command(
+        source_path, metadata_path,
+        settings.SCENE_DETECTION_THRESHOLD if threshold is None else threshold,
+        scale_width or settings.SCENE_DETECTION_SCALE_WIDTH,
+    ))
+    cuts = parse_scene_metadata(metadata_path.read_text()) if metadata_path.exists() else []
+    metadata_path.unlink(missing_ok=True)
+    return cuts
+
+
+def build_scene_index(project: models.Project, db: Session,
+                      run_command: Callable[..., None] = run_ffmpeg_command) -> List[float]:
+    """
+    One-time scene analysis of a project's source: the full download, or every
+    downloaded segment (cuts shifted to the original timeline). Stores the sorted
+    cut timestamps in Project.scene_cuts_json.
+    """
+    work_dir = Path(settings.MEDIA_ROOT_PATH) / f"project_{project.id}"
+    if project.original_video_path and Path(project.original_video_path).exists():
+        cuts = detect_scene_cuts(Path(project.original_video_path), work_dir, run_command=run_command)
+    elif project.source_segments_json:
+        cuts = []
+        for segment in project.source_segments_json:
+            segment_cuts = detect_scene_cuts(Path(segment["path"]), work_dir, run_command=run_command)
+            cuts.extend(round(segment["start"] + cut, 3) for cut in segment_cuts)
+        cuts = sorted(set(cuts))
+    else:
+        raise ValueError(f"Project {project.id} has no downloaded source to index.")
+
+    project.scene_cuts_json = cuts
+    db.commit()
+    print(f"Project {project.id}: scene index with {len(cuts)} cuts.")
+    return cuts
+
+
+def nearest_cut(cuts: List[float], timestamp: float, max_shift: float) -> Optional[float]:
+    """Closest cut to timestamp (binary search), or None if none is within max_shift seconds."""
+    if not cuts:
+        return None
+    i = bisect.bisect_left(cuts, timestamp)
+    neighbours = cuts[max(0, i - 1):i + 1]
+    best = min(neighbours, key=lambda cut: abs(cut - timestamp))
+    return best if abs(best - timestamp) <= max_shift else None
+
+
+def snap_clip_bounds(start: int, end: int, cuts: Optional[List[float]],
+                     max_shift: Optional[float] = None,
+                     min_duration: float = 1) -> Tuple[int, int]:
+    """
+    Moves clip start/end to the nearest scene cuts within max_shift seconds.
+
+    Clip timestamps are whole seconds, so a snapped start rounds up and a snapped end
+    rounds down: the clip never shows a fraction of the neighbouring shot. Bounds that
+    would leave less than min_duration are kept as they were.
+    """
+    if not cuts:
+        return start, end
+    max_shift = settings.SCENE_SNAP_MAX_SHIFT_SECONDS if max_shift is None else max_shift
+    start_cut = nearest_cut(cuts, start, max_shift)
+    end_cut = nearest_cut(cuts, end, max_shift)
+    snapped_start = math.ceil(start_cut) if start_cut is not None else start
+    snapped_end = math.floor(end_cut) if end_cut is not None else end
+    if snapped_end - snapped_start < min_duration:
+        return start, end
+    return snapped_start, snapped_end
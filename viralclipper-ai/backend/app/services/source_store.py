@@ -0,0 +1,179 @@
+import fcntl
+import hashlib
+import json
+import shutil
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Optional
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.db import models
+
+SOURCES_DIRNAME = "sources"
+ENTRY_FILENAME = "source.json"
+LOCK_FILENAME = ".lock"
+
+
+def sources_root() -> Path:
+    return Path(settings.MEDIA_ROOT_PATH) / SOURCES_DIRNAME
+
+
+def source_dir(video_id: str, format_selector: str) -> Path:
+    """Directory of one (video, format) entry of the shared store."""
+    format_key = hashlib.sha1(format_selector.encode("utf-8")).hexdigest()[:12]
+    return sources_root() / video_id / format_key
+
+
+@contextmanager
+def source_lock(directory: Path, blocking: bool = True):
+    """
+    Exclusive per-key lock (flock on a file inside the entry directory), shared by
+    every API/worker process that mounts the media volume. Yields False when
+    blocking=False and the lock is held elsewhere.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / LOCK_FILENAME, "w") as lock_file:
+        flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+        try:
+            fcntl.flock(lock_file, flags)
+        except BlockingIOError:
+            yield False
+            return
+        yield True
+
+
+def read_entry(directory: Path) -> Optional[dict]:
+    entry_path = directory / ENTRY_FILENAME
+    if not entry_path.exists():
+        return None
+    entry = json.loads(entry_path.read_text())
+    if not Path(entry["path"]).exists():
+        return None
+    return entry
+
+
+def acquire_source(video_id: str, format_selector: str,
+                   downloader: Callable[[Path], tuple[str, Optional[int]]]) -> tuple[str, Optional[int]]:
+    """
+    Returns (path, duration) of the shared source for video_id/format, downloading it
+    only if no project fetched it before. Concurrent callers for the same key wait on
+    the lock and then reuse the single download.
+
+    downloader receives the entry directory and must return (file path, duration).
+    """
+    directory = source_dir(video_id, format_selector)
+    with source_lock(directory):
+        entry = read_entry(directory)
+        if entry:
+            print(f"Source store hit for {video_id} ({format_selector}): {entry['path']}")
+            # O projeto só passa a referenciar o arquivo quando o chamador commitar original_video_path:
+            # marcar a entrada como em uso para release/GC respeitarem a carência até lá
+            entry["acquired_at"] = time.time()
+            _write_entry(directory, entry)
+            return entry["path"], entry.get("duration")
+
+        path, duration = downloader(directory)
+        entry = {
+            "video_id": video_id,
+            "format": format_selector,
+            "path": str(path),
+            "duration": duration,
+            "created_at": time.time(),
+        }
+        _write_entry(directory, entry)
+        return entry["path"], duration
+
+
+def _write_entry(directory: Path, entry: dict):
+    tmp_path = directory / f"{ENTRY_FILENAME}.tmp"
+    tmp_path.write_text(json.dumps(entry))
+    tmp_path.replace(directory / ENTRY_FILENAME)
+
+
+def _in_grace_period(entry: dict, grace: float) -> bool:
+    """True while a download or reuse of the entry may not have been committed to its project yet."""
+    last_acquired = max(entry.get("created_at", 0), entry.get("acquired_at", 0))
+    return time.time() - last_acquired < grace
+
+
+def is_shared_source(path: Optional[str]) -> bool:
+    if not path:
+        return False
+    try:
+        Path(path).resolve().relative_to(sources_root().resolve())
+        return True
+    except ValueError:
+        return False
+
+
+def count_references(db: Session, path: str) -> int:
+    """Reference count of a stored source: projects whose original_video_path points at it."""
+    return db.query(models.Project).filter(models.Project.original_video_path == path).count()
+
+
+def _delete_entry(directory: Path):
+    shutil.rmtree(directory, ignore_errors=True)
+    video_dir = directory.parent
+    if video_dir.exists() and not any(video_dir.iterdir()):
+        video_dir.rmdir()
+
+
+def release_source(db: Session, project: models.Project) -> bool:
+    """
+    Drops the project's reference to its source and deletes the stored file when no
+    other project references it anymore. Returns True if the file was deleted.
+
+    Entries acquired less than SOURCE_STORE_GC_GRACE_SECONDS ago are kept: another
+    project may have just acquired the same source without having committed its
+    reference yet. The periodic GC collects them later.
+    """
+    path = project.original_video_path
+    project.original_video_path = None
+    db.commit()
+    if not is_shared_source(path):
+        return False
+
+    directory = Path(path).parent
+    with source_lock(directory, blocking=False) as locked:
+        # Se outro processo está baixando/lendo esta entrada, o GC periódico resolve depois
+        if not locked:
+            return False
+        entry = read_entry(directory)
+        if entry and _in_grace_period(entry, settings.SOURCE_STORE_GC_GRACE_SECONDS):
+            return False
+        if count_references(db, path) > 0:
+            return False
+        _delete_entry(directory)
+    print(f"Source store: released and deleted {path}")
+    return True
+
+
+def collect_unreferenced_sources(db: Session, grace_seconds: Optional[int] = None) -> list[str]:
+    """
+    Garbage-collects stored sources with a zero reference count.
+
+    Entries downloaded or reused less than grace_seconds ago are kept, so a source
+    that was just acquired is not collected before its project row points at it.
+    """
+    grace = settings.SOURCE_STORE_GC_GRACE_SECONDS if grace_seconds is None else grace_seconds
+    root = sources_root()
+    if not root.exists():
+        return []
+
+    deleted = []
+    for entry_path in root.glob(f"*/*/{ENTRY_FILENAME}"):
+        directory = entry_path.parent
+        with source_lock(directory, blocking=False) as locked:
+            if not locked:
+                continue
+            entry = json.loads(entry_path.read_text())
+            if _in_grace_period(entry, grace):
+                continue
+            if count_references(db, entry["path"]) > 0:
+                continue
+            _delete_entry(directory)
+            deleted.append(entry["path"])
+    if deleted:
+        print(f"Source store GC deleted {len(deleted)} unreferenced sources: {deleted}")
+    return deleted
@@ -0,0 +1,130 @@
+import os
+import time
+from datetime import datetime
+from typing import Callable, Optional
+from prometheus_client import CollectorRegistry, Counter, Histogram, REGISTRY, multiprocess
+from sqlalchemy.orm import Session
+from app.db import models
+
+ENQUEUED_AT_HEADER = "enqueued_at"
+
+# Buckets cobrem de uma análise de 100 ms a um download/render de uma hora
+DURATION_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+BYTES_BUCKETS = (1e5, 1e6, 1e7, 5e7, 1e8, 5e8, 1e9, 5e9)
+SPEED_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32)
+
+STAGE_DURATION = Histogram("viralclipper_stage_duration_seconds", "Wall time of a pipeline stage",
+                           ["stage", "status"], buckets=DURATION_BUCKETS)
+STAGE_QUEUE_WAIT = Histogram("viralclipper_stage_queue_wait_seconds", "Time a stage's task waited in the queue",
+                             ["stage"], buckets=DURATION_BUCKETS)
+STAGE_BYTES = Histogram("viralclipper_stage_bytes", "Bytes downloaded or uploaded by a stage",
+                        ["stage"], buckets=BYTES_BUCKETS)
+RENDER_SPEED = Histogram("viralclipper_render_speed_ratio", "Clip seconds rendered per wall second",
+                         ["stage"], buckets=SPEED_BUCKETS)
+# Contadores (não gauges de stats()): no modo multiprocess só o que cada processo grava no diretório é agregado
+RETENTION_CACHE_LOOKUPS = Counter("viralclipper_retention_cache_lookups", "Retention cache lookups by outcome",
+                                  ["result"]) # local_hit, shared_hit, coalesced, miss
+RETENTION_CACHE_EVICTIONS = Counter("viralclipper_retention_cache_evictions",
+                                    "Retention series evicted from a process's LRU to stay within its entry limit")
+
+
+def metrics_registry():
+    """
+    Registry served on /metrics. With PROMETHEUS_MULTIPROC_DIR set (API and Celery
+    workers sharing that directory), it aggregates the samples every process wrote there.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def mark_process_dead(pid: int):
+    """Drops the live gauges of a finished worker process (multiprocess mode only)."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
+
+
+def stamp_enqueue_time(headers: dict):
+    """before_task_publish hook: records when the message was sent."""
+    headers.setdefault(ENQUEUED_AT_HEADER, time.time())
+
+
+def task_enqueued_at(task) -> Optional[datetime]:
+    """When the current task became runnable: its publish time, or its ETA if later."""
+    if task is None:
+        return None
+    request = task.request
+    stamp = getattr(request, ENQUEUED_AT_HEADER, None) or (getattr(request, "headers", None) or {}).get(ENQUEUED_AT_HEADER)
+    enqueued_at = datetime.utcfromtimestamp(float(stamp)) if stamp else None
+    eta = getattr(request, "eta", None)
+    if eta:
+        eta = datetime.fromisoformat(eta) if isinstance(eta, str) else eta
+        if eta.tzinfo is not None:
+            eta = datetime.utcfromtimestamp(eta.timestamp())
+        enqueued_at = max(enqueued_at, eta) if enqueued_at else eta
+    return enqueued_at
+
+
+def record_stage_event(db: Session, stage: str, started_at: datetime, finished_at: datetime,
+                       project_id: Optional[int] = None, clip_id: Optional[int] = None,
+                       task_id: Optional[str] = None, enqueued_at: Optional[datetime] = None,
+                       status: str = "ok", bytes_transferred: Optional[int] = None,
+                       render_speed_ratio: Optional[float] = None) -> models.StageEvent:
+    """Stores one stage span and feeds the Prometheus histograms."""
+    event = models.StageEvent(
+        project_id=project_id, clip_id=clip_id, stage=stage, status=status, task_id=task_id,
+        enqueued_at=enqueued_at, started_at=started_at, finished_at=finished_at,
+        bytes_transferred=bytes_transferred, render_speed_ratio=render_speed_ratio,
+    )
+    db.add(event)
+    db.commit()
+
+    STAGE_DURATION.labels(stage, status).observe((finished_at - started_at).total_seconds())
+    if enqueued_at is not None:
+        STAGE_QUEUE_WAIT.labels(stage).observe(max((started_at - enqueued_at).total_seconds(), 0.0))
+    if bytes_transferred:
+        STAGE_BYTES.labels(stage).observe(bytes_transferred)
+    if render_speed_ratio:
+        RENDER_SPEED.labels(stage).observe(render_speed_ratio)
+    return event
+
+
+class StageSpan:
+    """
+    Timing span of a task's stage, started at the top of the task and finished in its
+    `finally`. Set bytes_transferred / media_seconds along the way; call fail() from the
+    `except` block. Recording problems are logged and never fail the task.
+    """
+
+    def __init__(self, stage: str, task=None, project_id: Optional[int] = None, clip_id: Optional[int] = None):
+        self.stage = stage
+        self.project_id = project_id
+        self.clip_id = clip_id
+        self.task_id = getattr(task.request, "id", None) if task is not None else None
+        self.enqueued_at = task_enqueued_at(task)
+        self.started_at = datetime.utcnow()
+        self.status = "ok"
+        self.bytes_transferred: Optional[int] = None
+        self.media_seconds: Optional[float] = None # Duração renderizada, para a razão de velocidade
+
+    def fail(self):
+        self.status = "failed"
+
+    def finish(self, session_factory: Callable[[], Session]) -> Optional[models.StageEvent]:
+        finished_at = datetime.utcnow()
+        elapsed = (finished_at - self.started_at).total_seconds()
+        speed = round(self.media_seconds / elapsed, 3) if self.media_seconds and elapsed > 0 else None
+        db = session_factory() # Sessão própria: a da task pode estar num estado inválido após uma falha
+        try:
+            return record_stage_event(
+                db, self.stage, self.started_at, finished_at, project_id=self.project_id, clip_id=self.clip_id,
+                task_id=self.task_id, enqueued_at=self.enqueued_at, status=self.status,
+                bytes_transferred=self.bytes_transferred, render_speed_ratio=speed,
+            )
+        except Exception as e:
+            print(f"Could not record {self.stage} stage event (project {self.project_id}, clip {self.clip_id}): {e}")
+            return None
+        finally:
+            db.close()
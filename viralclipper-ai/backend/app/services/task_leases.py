@@ -0,0 +1,110 @@
+import hashlib
+import json
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import or_, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.db import models
+
+LEASE_RUNNING = "running"
+LEASE_DONE = "done"
+LEASE_FAILED = "failed"
+
+
+@dataclass
+class LeaseOutcome:
+    acquired: bool
+    owner: str # Dono atual: o próprio chamador quando acquired
+    status: str
+    result: Optional[dict] = None
+    params_hash: Optional[str] = None # Parâmetros da execução atual (a do chamador quando acquired)
+
+
+def render_lease_key(clip_id: int) -> str:
+    """One lease per clip output: every render of the clip writes the same clip_{id}.mp4."""
+    return f"render:clip:{clip_id}"
+
+
+def render_params_hash(start: float, end: float, render_mode: str) -> str:
+    """Same range and mode = same job; carried inside the clip's render lease."""
+    params = json.dumps([start, end, render_mode])
+    return hashlib.sha256(params.encode()).hexdigest()[:16]
+
+
+def publish_lease_key(publication_id: int) -> str:
+    return f"publish:{publication_id}"
+
+
+def new_owner() -> str:
+    return uuid.uuid4().hex
+
+
+def acquire_lease(db: Session, key: str, owner: str, ttl_seconds: Optional[int] = None,
+                  reuse_done: bool = True, params_hash: Optional[str] = None) -> LeaseOutcome:
+    """
+    Tries to become the single executor of `key`. Succeeds when there is no lease, the
+    previous one expired or failed, or it belongs to this same owner (a Celery redelivery
+    of the same task id after the worker died). Otherwise returns the current holder:
+    an in-flight job (running) or its still valid result (done). With reuse_done=False
+    a finished execution does not block a new one (only in-flight duplicates collapse).
+    params_hash is stored with the lease so a refused caller can tell a duplicate of the
+    running job from a different job on the same key.
+    """
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=ttl_seconds or settings.TASK_LEASE_TTL_SECONDS)
+    try:
+        # INSERT direto (Core): não conflita com uma instância da mesma chave já carregada na sessão
+        db.execute(insert(models.TaskLease).values(key=key, owner=owner, status=LEASE_RUNNING, expires_at=expires_at,
+                                                   params_hash=params_hash, created_at=now, updated_at=now))
+        db.commit()
+        return LeaseOutcome(True, owner, LEASE_RUNNING, params_hash=params_hash)
+    except IntegrityError:
+        db.rollback()
+
+    # Chave já existe: assumir de forma atômica só se a lease não vale mais (UPDATE condicional)
+    takeover = [models.TaskLease.expires_at < now, models.TaskLease.status == LEASE_FAILED, models.TaskLease.owner == owner]
+    if not reuse_done:
+        takeover.append(models.TaskLease.status == LEASE_DONE)
+    taken = db.query(models.TaskLease).filter(models.TaskLease.key == key, or_(*takeover)).update({"owner": owner, "status": LEASE_RUNNING, "expires_at": expires_at, "result_json": None,
+                                           "params_hash": params_hash},
+             synchronize_session=False)
+    db.commit()
+    if taken:
+        return LeaseOutcome(True, owner, LEASE_RUNNING, params_hash=params_hash)
+    current = db.query(models.TaskLease).filter(models.TaskLease.key == key).first()
+    if current is None: # Removida entre as duas consultas: tentar de novo
+        return acquire_lease(db, key, owner, ttl_seconds, reuse_done, params_hash)
+    return LeaseOutcome(False, current.owner, current.status, current.result_json, current.params_hash)
+
+
+def complete_lease(db: Session, key: str, owner: str, result: dict):
+    """Stores the result; duplicates submitted within TASK_LEASE_RESULT_TTL_SECONDS receive it."""
+    db.query(models.TaskLease).filter(models.TaskLease.key == key, models.TaskLease.owner == owner).update({
+        "status": LEASE_DONE,
+        "result_json": result,
+        "expires_at": datetime.utcnow() + timedelta(seconds=settings.TASK_LEASE_RESULT_TTL_SECONDS),
+    }, synchronize_session=False)
+    db.commit()
+
+
+def fail_lease(db: Session, key: str, owner: str):
+    """Marks the execution as failed so the next submission runs it again."""
+    db.query(models.TaskLease).filter(models.TaskLease.key == key, models.TaskLease.owner == owner).update(
+        {"status": LEASE_FAILED}, synchronize_session=False)
+    db.commit()
+
+
+def lease_in_flight(db: Session, key: str, params_hash: Optional[str] = None) -> bool:
+    """True while another execution of `key` (with these params_hash, when given) holds a valid running lease."""
+    query = db.query(models.TaskLease).filter(
+        models.TaskLease.key == key,
+        models.TaskLease.status == LEASE_RUNNING,
+        models.TaskLease.expires_at >= datetime.utcnow()
+    )
+    if params_hash is not None:
+        query = query.filter(models.TaskLease.params_hash == params_hash)
+    return query.count() > 0
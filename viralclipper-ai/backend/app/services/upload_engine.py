@@ -0,0 +1,191 @@
+import asyncio
+import json
+import os
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, List
+import httpx
+
+# O protocolo resumable do YouTube exige chunks múltiplos de 256 KiB (exceto o último)
+CHUNK_ALIGNMENT = 256 * 1024
+RESUME_INCOMPLETE = 308
+RETRYABLE_STATUS_CODES = (500, 502, 503, 504)
+
+
+class ResumableUploadError(Exception):
+    pass
+
+
+@dataclass
+class UploadJob:
+    publication_id: int
+    account_id: int # Dono das credenciais: o limite de uploads simultâneos é por conta
+    access_token: str
+    file_path: Path
+    metadata: dict # Corpo de videos.insert (snippet/status)
+    content_type: str = "video/mp4"
+
+
+@dataclass
+class UploadResult:
+    publication_id: int
+    video_id: Optional[str] = None
+    error: Optional[str] = None
+    bytes_sent: int = 0
+    retries: int = 0
+    started_at: Optional[datetime] = None # Após os limites de concorrência: só o tempo de upload
+    finished_at: Optional[datetime] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.video_id is not None
+
+
+@dataclass
+class _UploadSession:
+    uri: str
+    total: int
+    offset: int = 0
+    retries: int = 0
+    response: dict = field(default_factory=dict)
+
+
+def _parse_range_end(range_header: Optional[str]) -> int:
+    """Offset to resume from, given a 308 Range header ("bytes=0-524287"); 0 when absent."""
+    if not range_header:
+        return 0
+    return int(range_header.rsplit("-", 1)[1]) + 1
+
+
+class AsyncUploadEngine:
+    """
+    Runs many resumable, chunked uploads concurrently from one event loop.
+
+    Memory per upload is bounded by chunk_size: the file is read one chunk at a time.
+    Concurrency is bounded globally (max_concurrent) and per account
+    (per_account_limit), matching the per-channel upload quotas. Transport errors and
+    5xx responses are retried with exponential backoff, resuming from the offset the
+    server confirmed.
+    """
+
+    def __init__(self, upload_url: str, max_concurrent: int = 32, per_account_limit: int = 2,
+                 chunk_size: int = 8 * 1024 * 1024, max_retries: int = 5, backoff_seconds: float = 1.0,
+                 client: Optional[httpx.AsyncClient] = None):
+        if chunk_size % CHUNK_ALIGNMENT:
+            raise ValueError(f"chunk_size must be a multiple of {CHUNK_ALIGNMENT} bytes.")
+        self.upload_url = upload_url
+        self.max_concurrent = max_concurrent
+        self.per_account_limit = per_account_limit
+        self.chunk_size = chunk_size
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self._client = client
+
+    async def upload_many(self, jobs: List[UploadJob]) -> List[UploadResult]:
+        """Uploads every job concurrently; results in the order of jobs. Never raises per job."""
+        # Semáforos criados no loop que os usa (o engine é reutilizável entre asyncio.run)
+        global_limit = asyncio.Semaphore(self.max_concurrent)
+        account_limits = defaultdict(lambda: asyncio.Semaphore(self.per_account_limit))
+        owns_client = self._client is None
+        client = self._client or httpx.AsyncClient(timeout=httpx.Timeout(60.0, connect=10.0),
+                                                   limits=httpx.Limits(max_connections=self.max_concurrent))
+        try:
+            return await asyncio.gather(*(
+                self._upload_limited(client, job, account_limits[job.account_id], global_limit) for job in jobs
+            ))
+        finally:
+            if owns_client:
+                await client.aclose()
+
+    async def upload(self, job: UploadJob) -> UploadResult:
+        return (await self.upload_many([job]))[0]
+
+    async def _upload_limited(self, client: httpx.AsyncClient, job: UploadJob,
+                              account_limit: asyncio.Semaphore, global_limit: asyncio.Semaphore) -> UploadResult:
+        async with account_limit, global_limit: # Conta primeiro: uma conta saturada não ocupa vagas globais
+            started_at = datetime.utcnow()
+            try:
+                session = await self._start_session(client, job)
+                await self._send_chunks(client, job, session)
+                return UploadResult(job.publication_id, video_id=session.response.get("id"),
+                                    bytes_sent=session.offset, retries=session.retries,
+                                    started_at=started_at, finished_at=datetime.utcnow())
+            except Exception as e:
+                return UploadResult(job.publication_id, error=f"{type(e).__name__}: {e}",
+                                    started_at=started_at, finished_at=datetime.utcnow())
+
+    async def _start_session(self, client: httpx.AsyncClient, job: UploadJob) -> _UploadSession:
+        total = os.path.getsize(job.file_path)
+        if total == 0:
+            raise ResumableUploadError(f"{job.file_path} is empty.")
+        response = await self._with_retries(lambda: client.post(
+            self.upload_url,
+            params={"uploadType": "resumable", "part": ",".join(job.metadata.keys()) or "snippet,status"},
+            headers={
+                "Authorization": f"Bearer {job.access_token}",
+                "Content-Type": "application/json; charset=UTF-8",
+                "X-Upload-Content-Length": str(total),
+                "X-Upload-Content-Type": job.content_type,
+            },
+            content=json.dumps(job.metadata),
+        ))
+        if response.status_code != 200 or "location" not in response.headers:
+            raise ResumableUploadError(f"Could not start upload session: HTTP {response.status_code} {response.text[:200]}")
+        return _UploadSession(uri=response.headers["location"], total=total)
+
+    async def _send_chunks(self, client: httpx.AsyncClient, job: UploadJob, session: _UploadSession):
+        with open(job.file_path, "rb") as f:
+            while not session.response:
+                f.seek(session.offset)
+                chunk = f.read(self.chunk_size)
+                end = session.offset + len(chunk) - 1
+                try:
+                    response = await client.put(session.uri, content=chunk, headers={
+                        "Authorization": f"Bearer {job.access_token}",
+                        "Content-Range": f"bytes {session.offset}-{end}/{session.total}",
+                    })
+                except httpx.TransportError:
+                    response = None
+                if response is not None and response.status_code in (200, 201):
+                    session.offset = session.total
+                    session.response = response.json()
+                    continue
+                if response is not None and response.status_code == RESUME_INCOMPLETE:
+                    session.offset = _parse_range_end(response.headers.get("range"))
+                    continue
+                if response is not None and response.status_code not in RETRYABLE_STATUS_CODES:
+                    raise ResumableUploadError(f"Chunk upload failed: HTTP {response.status_code} {response.text[:200]}")
+                # Falha transitória: esperar e perguntar ao servidor quanto ele já recebeu
+                await self._backoff(session)
+                session.offset = await self._query_offset(client, job, session)
+
+    async def _query_offset(self, client: httpx.AsyncClient, job: UploadJob, session: _UploadSession) -> int:
+        response = await self._with_retries(lambda: client.put(session.uri, headers={
+            "Authorization": f"Bearer {job.access_token}",
+            "Content-Range": f"bytes */{session.total}",
+        }), session)
+        if response.status_code in (200, 201): # O último chunk chegou; só a resposta se perdeu
+            session.response = response.json()
+            return session.total
+        if response.status_code != RESUME_INCOMPLETE:
+            raise ResumableUploadError(f"Upload session lost: HTTP {response.status_code}")
+        return _parse_range_end(response.headers.get("range"))
+
+    async def _with_retries(self, send, session: Optional[_UploadSession] = None) -> httpx.Response:
+        session = session or _UploadSession(uri="", total=0)
+        while True:
+            try:
+                response = await send()
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    return response
+            except httpx.TransportError:
+                pass
+            await self._backoff(session)
+
+    async def _backoff(self, session: _UploadSession):
+        if session.retries >= self.max_retries:
+            raise ResumableUploadError(f"Giving up after {session.retries} retries.")
+        await asyncio.sleep(self.backoff_seconds * (2 ** session.retries))
+        session.retries += 1
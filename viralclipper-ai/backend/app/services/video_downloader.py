@@ -1,19 +1,105 @@
 import yt_dlp
+from yt_dlp.utils import download_range_func
 import os
 from pathlib import Path
 from app.core.config import settings
 from app.db import models
+from app.services.source_store import acquire_source
+from app.services.youtube_urls import extract_video_id
 from sqlalchemy.orm import Session
 
-def download_video(youtube_url: str, project_id: int, db: Session) -> tuple[str, int | None]: # Retornar path e duração
-    project_media_path = Path(settings.MEDIA_ROOT_PATH) / f"project_{project_id}"
-    project_media_path.mkdir(parents=True, exist_ok=True)
+VIDEO_FORMAT = 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best'
+
+
+def _meets_target(fmt: dict, profile: dict) -> bool:
+    """
+    True when the render covers the profile's output frame without upscaling. The vertical
+    filter scales the source until it covers the frame and center-crops it, so both sides
+    must reach it: a 16:9 source needs its height (short side) at output_height.
+    """
+    return (fmt.get('width') or 0) >= profile.get('output_width', 0) and (fmt.get('height') or 0) >= profile.get('output_height', 0)
+
+
+def _codec_allowed(fmt: dict, codecs: list[str] | None, key: str) -> bool:
+    codec = (fmt.get(key) or '').lower()
+    return not codecs or any(codec.startswith(c) for c in codecs)
+
+
+def _pick_smallest_meeting_target(candidates: list[dict], profile: dict) -> dict | None:
+    """Smallest candidate at or above the target; the largest one below it otherwise."""
+    if not candidates:
+        return None
+    size = lambda f: ((f.get('width') or 0) * (f.get('height') or 0), f.get('tbr') or 0, f.get('filesize') or f.get('filesize_approx') or 0)
+    meeting = [f for f in candidates if _meets_target(f, profile)]
+    if meeting:
+        return min(meeting, key=size)
+    return max(candidates, key=size)
+
+
+def select_format(formats: list[dict], profile: dict) -> str | None:
+    """
+    Picks the smallest yt-dlp format that still satisfies an output profile
+    (settings.OUTPUT_PROFILES) and returns its format selector ("<video>+<audio>" or
+    a single muxed id). Returns None when no format is usable.
+
+    Video-only streams with a preferred codec/container come first; the container and
+    codec constraints are relaxed, in that order, when no stream meets the target (or none
+    exists) before falling back to muxed formats.
+    """
+    video_only = [f for f in formats if f.get('vcodec') not in (None, 'none') and f.get('acodec') == 'none' and f.get('width')]
+    audio_only = [f for f in formats if f.get('acodec') not in (None, 'none') and f.get('vcodec') == 'none']
+    muxed = [f for f in formats if f.get('vcodec') not in (None, 'none') and f.get('acodec') not in (None, 'none') and f.get('width')]
+
+    codecs = profile.get('video_codecs')
+    video_ext = profile.get('video_ext')
+    tiers = [
+        [f for f in video_only if _codec_allowed(f, codecs, 'vcodec') and (not video_ext or f.get('ext') == video_ext)],
+        [f for f in video_only if _codec_allowed(f, codecs, 'vcodec')],
+        video_only,
+    ]
+    picks = [_pick_smallest_meeting_target(tier, profile) for tier in tiers]
+    # Ampliar custa mais qualidade do que perder o codec preferido; sem nenhum formato que
+    # atenda, fica o maior do primeiro nível disponível
+    video = next((p for p in picks if p and _meets_target(p, profile)), None) or next((p for p in picks if p), None)
+
+    audio_ext = profile.get('audio_ext')
+    preferred_audio = [f for f in audio_only if not audio_ext or f.get('ext') == audio_ext] or audio_only
+    audio = None
+    if preferred_audio:
+        min_abr = profile.get('min_audio_bitrate', 0)
+        good_enough = [f for f in preferred_audio if (f.get('abr') or 0) >= min_abr]
+        abr = lambda f: f.get('abr') or 0
+        audio = min(good_enough, key=abr) if good_enough else max(preferred_audio, key=abr)
+
+    if video and audio:
+        return f"{video['format_id']}+{audio['format_id']}"
+
+    best_muxed = _pick_smallest_meeting_target(muxed, profile)
+    return str(best_muxed['format_id']) if best_muxed else None
+
+
+def resolve_video_format(info_dict: dict, profile_name: str | None = None) -> str:
+    """
+    Format selector for a video given its metadata and an output profile. The exact
+    choice is followed by VIDEO_FORMAT as a yt-dlp fallback, in case the chosen ids
+    are gone by the time the download starts.
+    """
+    profile = settings.OUTPUT_PROFILES.get(profile_name or settings.DEFAULT_OUTPUT_PROFILE)
+    if not profile:
+        print(f"Unknown output profile '{profile_name or settings.DEFAULT_OUTPUT_PROFILE}', using default format.")
+        return VIDEO_FORMAT
+    chosen = select_format(info_dict.get('formats') or [], profile)
+    return f"{chosen}/{VIDEO_FORMAT}" if chosen else VIDEO_FORMAT
+
+def download_to_directory(youtube_url: str, target_dir: Path, format_selector: str = VIDEO_FORMAT) -> tuple[str, int | None]:
+    """Downloads the full video into target_dir/original_video.<ext>. Returns (path, duration)."""
+    target_dir.mkdir(parents=True, exist_ok=True)
 
     filename_template = "original_video.%(ext)s"
-    output_path_template = str(project_media_path / filename_template)
+    output_path_template = str(target_dir / filename_template)
 
     ydl_opts = {
-        'format': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best',
+        'format': format_selector,
         'outtmpl': output_path_template,
         'noplaylist': True,
         'quiet': True,
@@ -21,33 +107,57 @@ def download_video(youtube_url: str, project_id: int, db: Session) -> tuple[str,
     }
 
     downloaded_file_path = None
-    duration = None
-    try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info_dict = ydl.extract_info(youtube_url, download=True)
-            duration = info_dict.get('duration') # Extrair duração
-
-            if 'filepath' in info_dict:
-                 downloaded_file_path = info_dict['filepath']
-            elif 'requested_downloads' in info_dict and                  len(info_dict['requested_downloads']) > 0 and                  'filepath' in info_dict['requested_downloads'][0]:
-                 downloaded_file_path = info_dict['requested_downloads'][0]['filepath']
-            else:
-                # Fallback if filepath is not directly available
-                for f_item in project_media_path.iterdir():
-                    if f_item.stem == "original_video": # Check for the base name without extension
-                        downloaded_file_path = str(f_item)
-                        break
-            if not downloaded_file_path or not Path(downloaded_file_path).exists():
-                 raise Exception("Downloaded file not found after yt-dlp execution.")
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info_dict = ydl.extract_info(youtube_url, download=True)
+        duration = info_dict.get('duration') # Extrair duração
+
+        if 'filepath' in info_dict:
+             downloaded_file_path = info_dict['filepath']
+        elif 'requested_downloads' in info_dict and                  len(info_dict['requested_downloads']) > 0 and                  'filepath' in info_dict['requested_downloads'][0]:
+             downloaded_file_path = info_dict['requested_downloads'][0]['filepath']
+        else:
+            # Fallback if filepath is not directly available
+            for f_item in target_dir.iterdir():
+                if f_item.stem == "original_video": # Check for the base name without extension
+                    downloaded_file_path = str(f_item)
+                    break
+        if not downloaded_file_path or not Path(downloaded_file_path).exists():
+             raise Exception("Downloaded file not found after yt-dlp execution.")
+    return downloaded_file_path, (int(duration) if duration else None)
+
 
+def download_video(youtube_url: str, project_id: int, db: Session) -> tuple[str, int | None]: # Retornar path e duração
+    """
+    Downloads the source video of a project. YouTube videos go through the shared source
+    store, so the same video/format is fetched and stored once for every project using it.
+    """
+    try:
         project = db.query(models.Project).filter(models.Project.id == project_id).first()
+        format_selector = project.source_format if project and project.source_format else None
+        if not format_selector:
+            format_selector = resolve_video_format(fetch_video_metadata(youtube_url))
+        print(f"Project {project_id}: downloading format {format_selector}")
+
+        video_id = extract_video_id(youtube_url)
+        if video_id:
+            downloaded_file_path, duration = acquire_source(
+                video_id, format_selector,
+                lambda target_dir: download_to_directory(youtube_url, target_dir, format_selector)
+            )
+        else:
+            project_media_path = Path(settings.MEDIA_ROOT_PATH) / f"project_{project_id}"
+            downloaded_file_path, duration = download_to_directory(youtube_url, project_media_path, format_selector)
+
         if project:
+            project.source_format = format_selector
             project.original_video_path = downloaded_file_path # Store relative path from MEDIA_ROOT or absolute? Storing absolute for now.
             if duration:
                 project.duracao_video_original_segundos = int(duration)
-            project.status = "downloaded"
+            # A análise de retenção roda em paralelo; não sobrescrever o status que ela já gravou
+            if project.status in ("pending_download", "metadata_fetched"):
+                project.status = "downloaded"
             db.commit()
-        return downloaded_file_path, (int(duration) if duration else None)
+        return downloaded_file_path, duration
     except Exception as e:
         project = db.query(models.Project).filter(models.Project.id == project_id).first()
         if project:
@@ -56,3 +166,98 @@ def download_video(youtube_url: str, project_id: int, db: Session) -> tuple[str,
             db.commit()
         print(f"Error downloading video for project {project_id}: {e}")
         raise
+
+
+def fetch_video_metadata(youtube_url: str) -> dict:
+    """Fetches the video metadata (duration, title, formats) without downloading media."""
+    with yt_dlp.YoutubeDL({'noplaylist': True, 'quiet': True}) as ydl:
+        return ydl.extract_info(youtube_url, download=False)
+
+
+def pad_and_merge_ranges(ranges: list[tuple[int, int]], padding: int, duration: int | None = None) -> list[tuple[int, int]]:
+    """Pads every (start, end) range and merges the ones that overlap after padding."""
+    padded = sorted(
+        (max(0, start - padding), end + padding if duration is None else min(duration, end + padding))
+        for start, end in ranges
+    )
+    merged: list[tuple[int, int]] = []
+    for start, end in padded:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def download_video_segments(youtube_url: str, project_id: int, ranges: list[tuple[int, int]], db: Session) -> list[dict]:
+    """
+    Downloads only the given time ranges of a video (yt-dlp download_ranges) as one file
+    per range and records them in Project.source_segments_json.
+
+    Segments already present on the project are kept; ranges fully covered by an
+    existing segment are not downloaded again.
+    """
+    project = db.query(models.Project).filter(models.Project.id == project_id).first()
+    existing = list(project.source_segments_json or []) if project else []
+    missing = [
+        (start, end) for start, end in ranges
+        if not any(seg["start"] <= start and end <= seg["end"] and Path(seg["path"]).exists() for seg in existing)
+    ]
+    if not missing:
+        return existing
+
+    segments_dir = Path(settings.MEDIA_ROOT_PATH) / f"project_{project_id}" / "segments"
+    segments_dir.mkdir(parents=True, exist_ok=True)
+
+    ydl_opts = {
+        'format': (project.source_format if project else None) or VIDEO_FORMAT,
+        'outtmpl': str(segments_dir / "segment_%(section_start)d_%(section_end)d.%(ext)s"),
+        'download_ranges': download_range_func(None, missing),
+        'force_keyframes_at_cuts': True, # Cortes precisos nas bordas do segmento
+        'noplaylist': True,
+        'quiet': True,
+        'merge_output_format': 'mp4',
+    }
+
+    try:
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            ydl.extract_info(youtube_url, download=True)
+
+        new_segments = []
+        for start, end in missing:
+            matches = sorted(segments_dir.glob(f"segment_{start}_{end}.*"))
+            if not matches:
+                raise Exception(f"Segment {start}-{end}s not found after yt-dlp execution.")
+            new_segments.append({"start": start, "end": end, "path": str(matches[0])})
+
+        segments = sorted(existing + new_segments, key=lambda seg: seg["start"])
+        if project:
+            project.source_segments_json = segments
+            project.status = "segments_downloaded"
+            db.commit()
+        return segments
+    except Exception as e:
+        if project:
+            project.status = "download_failed"
+            project.processing_error = str(e)
+            db.commit()
+        print(f"Error downloading segments for project {project_id}: {e}")
+        raise
+
+
+def ensure_clip_segments(project: models.Project, clips: list, db: Session) -> list[dict]:
+    """
+    Makes sure every clip of a "segments" project is covered by a local segment,
+    downloading a padded segment for clips edited outside the original ranges.
+    """
+    if project.original_video_path or project.source_segments_json is None:
+        return project.source_segments_json or []
+    uncovered = [
+        (clip.timestamp_inicio_segundos, clip.timestamp_fim_segundos) for clip in clips
+        if not any(seg["start"] <= clip.timestamp_inicio_segundos and clip.timestamp_fim_segundos <= seg["end"]
+                   for seg in project.source_segments_json)
+    ]
+    if not uncovered:
+        return project.source_segments_json
+    ranges = pad_and_merge_ranges(uncovered, settings.SEGMENT_PADDING_SECONDS, project.duracao_video_original_segundos)
+    return download_video_segments(project.youtube_url, project.id, ranges, db)
@@ -1,38 +1,384 @@
 import subprocess
 import os
+import json
+import bisect
+import threading
+import time
+from collections import deque
 from pathlib import Path
+from typing import Callable, Iterable, Optional
 from app.core.config import settings
 from app.db import models
+from app.services.render_cache import RenderCache, make_render_key
+from app.services.audio_analysis import clip_loudnorm_filter
 from sqlalchemy.orm import Session
 
-def run_ffmpeg_command(command: list[str]):
+# Formato vertical 9:16 usado por todos os clipes renderizados
+TARGET_WIDTH = 720
+TARGET_HEIGHT = 1280
+
+# Modos de renderização: "vertical" reencoda com crop 9:16; "straight_cut" apenas corta o trecho
+RENDER_MODE_VERTICAL = "vertical"
+RENDER_MODE_STRAIGHT_CUT = "straight_cut"
+RENDER_MODES = (RENDER_MODE_VERTICAL, RENDER_MODE_STRAIGHT_CUT)
+
+# Smart cut só é seguro quando o trecho reencodado usa o mesmo codec do trecho copiado
+SMART_CUT_CODECS = {"h264": "libx264"}
+# Perfis H.264 do ffprobe -> -profile:v do libx264; fora desta lista o clipe é reencodado inteiro
+SMART_CUT_X264_PROFILES = {
+    "Constrained Baseline": "baseline", "Baseline": "baseline", "Main": "main", "High": "high",
+    "High 10": "high10", "High 4:2:2": "high422", "High 4:4:4 Predictive": "high444",
+}
+# Áudio: só AAC-LC (o que o encoder aac gera) pode ser concatenado com o áudio copiado
+SMART_CUT_AUDIO_CODECS = {"aac": "aac"}
+SMART_CUT_AUDIO_PROFILES = {None, "LC"}
+SMART_CUT_PART_FORMAT = "mpegts" # Annex B: SPS/PPS vão em banda no início de cada parte
+KEYFRAME_INDEX_FILENAME = "keyframes.json"
+
+VERTICAL_ENCODER_ARGS = ['-c:a', 'aac', '-strict', '-2']
+RENDER_CACHE_DIRNAME = "render_cache"
+
+
+def build_vertical_filter(target_w: int = TARGET_WIDTH, target_h: int = TARGET_HEIGHT) -> str:
+    """Returns the scale + center crop filter that reformats a video to 9:16."""
+    # Escalar até cobrir o quadro 9:16 antes do crop; "scale=720:-2" deixava fontes
+    # paisagem com menos de 1280 px de altura e o crop falhava
+    return (f"scale={target_w}:{target_h}:force_original_aspect_ratio=increase,"
+            f"crop={target_w}:{target_h}:(iw-{target_w})/2:(ih-{target_h})/2")
+
+
+def get_render_cache() -> RenderCache:
+    return RenderCache(Path(settings.MEDIA_ROOT_PATH) / RENDER_CACHE_DIRNAME, settings.RENDER_CACHE_MAX_BYTES)
+
+
+def clip_render_key(original_video_path: Path, start_time: float, end_time: float, render_mode: str = RENDER_MODE_VERTICAL,
+                    audio_filter: str = "") -> str:
+    """Cache key of a clip render: source identity, range, filter graph and encoder parameters."""
+    if render_mode == RENDER_MODE_STRAIGHT_CUT:
+        return make_render_key(original_video_path, start_time, end_time, "smart_cut",
+                               sorted(SMART_CUT_CODECS.items()) + [("parts", SMART_CUT_PART_FORMAT)])
+    filter_graph = build_vertical_filter() + (f";{audio_filter}" if audio_filter else "")
+    return make_render_key(original_video_path, start_time, end_time, filter_graph, VERTICAL_ENCODER_ARGS)
+
+
+def parse_progress_block(fields: dict) -> dict:
+    """Converts one `-progress` key=value block into out_time (seconds), fps and speed."""
+    out_time = None
+    for key in ("out_time_us", "out_time_ms"): # out_time_ms também é em microssegundos
+        value = fields.get(key)
+        if value and value != "N/A":
+            out_time = int(value) / 1_000_000
+            break
+    fps = fields.get("fps")
+    speed = fields.get("speed", "").rstrip("x").strip()
+    return {
+        "out_time": out_time,
+        "fps": float(fps) if fps and fps != "N/A" else None,
+        "speed": float(speed) if speed and speed != "N/A" else None,
+        "finished": fields.get("progress") == "end",
+    }
+
+
+def run_ffmpeg_command(command: list[str], on_progress: Optional[Callable[[dict], None]] = None):
+    """
+    Runs ffmpeg while streaming its `-progress pipe:1` output line by line.
+
+    on_progress receives a dict with out_time/fps/speed at every progress report.
+    Only the last FFMPEG_STDERR_TAIL_LINES lines of stderr are kept, for the error message.
+    """
+    progress_command = [command[0], '-progress', 'pipe:1', '-nostats', *command[1:]]
+    stderr_tail = deque(maxlen=settings.FFMPEG_STDERR_TAIL_LINES)
     try:
-        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        stdout, stderr = process.communicate()
-        if process.returncode != 0:
-            raise Exception(f"FFmpeg error: {stderr.decode('utf-8')}")
-        print(f"FFmpeg output: {stdout.decode('utf-8')}")
+        process = subprocess.Popen(progress_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     except FileNotFoundError:
         raise Exception("FFmpeg not found. Make sure it's installed and in PATH.")
-    except Exception as e:
-        raise e
 
+    # stderr é drenado numa thread à parte para que o ffmpeg nunca bloqueie num pipe cheio
+    def drain_stderr():
+        for raw_line in process.stderr:
+            stderr_tail.append(raw_line.decode('utf-8', errors='replace').rstrip())
+
+    stderr_thread = threading.Thread(target=drain_stderr, daemon=True)
+    stderr_thread.start()
+
+    fields = {}
+    for raw_line in process.stdout:
+        key, _, value = raw_line.decode('utf-8', errors='replace').strip().partition("=")
+        if not key:
+            continue
+        fields[key] = value
+        if key == "progress":
+            if on_progress:
+                on_progress(parse_progress_block(fields))
+            fields = {}
+
+    returncode = process.wait()
+    stderr_thread.join()
+    if returncode != 0:
+        raise Exception(f"FFmpeg error: {chr(10).join(stderr_tail)}")
+
+
+class ClipProgressReporter:
+    """
+    Turns ffmpeg progress reports into SuggestedClip.processing_progress updates.
+
+    Each target is (clip, offset, duration): the clip range starts `offset` seconds into
+    the ffmpeg output timeline. Database writes are throttled to at most one every
+    `min_interval` seconds, however often ffmpeg reports.
+    """
+
+    def __init__(self, db: Session, targets: list[tuple], min_interval: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.db = db
+        self.targets = targets
+        self.min_interval = settings.FFMPEG_PROGRESS_WRITE_INTERVAL_SECONDS if min_interval is None else min_interval
+        self.clock = clock
+        self.last_write = None
+
+    def __call__(self, progress: dict):
+        if progress.get("out_time") is None:
+            return
+        now = self.clock()
+        if self.last_write is not None and now - self.last_write < self.min_interval:
+            return
+        self.last_write = now
+        for clip, offset, duration in self.targets:
+            done = min(max(progress["out_time"] - offset, 0), duration)
+            clip.processing_progress = round(100 * done / duration, 1) if duration > 0 else 0.0
+        self.db.commit()
+
+    def shifted(self, seconds: float) -> Callable[[dict], None]:
+        """Reporter for a command whose output starts `seconds` into the clip."""
+        def report(progress: dict):
+            if progress.get("out_time") is not None:
+                progress = {**progress, "out_time": progress["out_time"] + seconds}
+            self(progress)
+        return report
+
+
+def probe_keyframes(video_path: Path) -> dict:
+    """
+    Reads the stream parameters and the keyframe timestamps of a file with ffprobe (no decoding).
 
-def process_clip(clip_id: int, db: Session) -> str:
+    "video" and "audio" hold the first stream of each kind (audio is None when there is
+    none); smart cuts use them to encode the edges exactly like the copied GOPs.
+    """
+    streams_command = [
+        'ffprobe', '-v', 'error',
+        '-show_entries', 'stream=codec_type,codec_name,profile,level,pix_fmt,time_base,sample_rate,channels',
+        '-of', 'json', str(video_path)
+    ]
+    packets_command = [
+        'ffprobe', '-v', 'error', '-select_streams', 'v:0',
+        '-show_entries', 'packet=pts_time,flags', '-of', 'csv=p=0', str(video_path)
+    ]
+    try:
+        streams_result = subprocess.run(streams_command, capture_output=True, text=True)
+        packets_result = subprocess.run(packets_command, capture_output=True, text=True)
+    except FileNotFoundError:
+        raise Exception("FFprobe not found. Make sure it's installed and in PATH.")
+    for result in (streams_result, packets_result):
+        if result.returncode != 0:
+            raise Exception(f"FFprobe error: {result.stderr}")
+
+    streams = json.loads(streams_result.stdout or "{}").get("streams", [])
+    video = next((stream for stream in streams if stream.get("codec_type") == "video"), {})
+    audio = next((stream for stream in streams if stream.get("codec_type") == "audio"), None)
+
+    keyframes = []
+    for line in packets_result.stdout.splitlines():
+        pts_time, _, flags = line.partition(",")
+        if "K" in flags and pts_time not in ("", "N/A"):
+            keyframes.append(float(pts_time))
+    keyframes.sort()
+    return {"codec": video.get("codec_name", ""), "video": video, "audio": audio, "keyframes": keyframes}
+
+
+def get_keyframe_index(project_id: int, video_path: Path) -> dict:
+    """
+    Returns the keyframe index of a source video, probing it only once per project.
+
+    The index is cached in the project media folder and is invalidated when the source
+    file changes size or modification time.
+    """
+    index_path = Path(settings.MEDIA_ROOT_PATH) / f"project_{project_id}" / KEYFRAME_INDEX_FILENAME
+    stat = video_path.stat()
+    cache = {}
+    if index_path.exists():
+        try:
+            cache = json.loads(index_path.read_text())
+        except ValueError:
+            cache = {}
+
+    entry = cache.get(str(video_path))
+    # Entradas sem "video" são de antes dos parâmetros de stream: sondar de novo
+    if entry and entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns and "video" in entry:
+        return entry
+
+    entry = probe_keyframes(video_path)
+    entry.update({"size": stat.st_size, "mtime_ns": stat.st_mtime_ns})
+    cache[str(video_path)] = entry
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = index_path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(cache))
+    os.replace(tmp_path, index_path)
+    return entry
+
+
+def plan_smart_cut(keyframes: list[float], start: float, end: float) -> list[tuple[str, float, float]]:
+    """
+    Splits [start, end) into ("encode" | "copy", start, end) pieces.
+
+    The span between the first keyframe at/after start and the last keyframe at/before end
+    can be stream-copied; only the partial GOPs before and after it are re-encoded.
+    """
+    first_index = bisect.bisect_left(keyframes, start)
+    last_index = bisect.bisect_right(keyframes, end) - 1
+    if first_index >= len(keyframes) or last_index < first_index:
+        return [("encode", start, end)]
+
+    first_keyframe = keyframes[first_index]
+    last_keyframe = keyframes[last_index]
+    if last_keyframe <= first_keyframe:
+        return [("encode", start, end)]
+
+    plan = []
+    if first_keyframe > start:
+        plan.append(("encode", start, first_keyframe))
+    plan.append(("copy", first_keyframe, last_keyframe))
+    if end > last_keyframe:
+        plan.append(("encode", last_keyframe, end))
+    return plan
+
+
+def smart_cut_encoder_args(keyframe_index: dict) -> Optional[tuple[list[str], list[str]]]:
+    """
+    Returns (edge encoder args, concat args) that make re-encoded edges match the source
+    stream (codec, profile, level, pix_fmt, timebase, audio codec/rate/channels), or None
+    when any of them can't be matched; the whole clip is then re-encoded instead.
+    """
+    video = keyframe_index.get("video") or {}
+    encoder = SMART_CUT_CODECS.get(video.get("codec_name"))
+    profile = SMART_CUT_X264_PROFILES.get(video.get("profile"))
+    level = video.get("level")
+    pix_fmt = video.get("pix_fmt")
+    timescale = (video.get("time_base") or "").partition("/")[2]
+    if not (encoder and profile and isinstance(level, int) and level > 0 and pix_fmt and timescale.isdigit()):
+        return None
+
+    encode_args = ['-c:v', encoder, '-profile:v', profile, '-level:v', f"{level / 10:g}", '-pix_fmt', pix_fmt]
+    concat_args = ['-video_track_timescale', timescale]
+    audio = keyframe_index.get("audio")
+    if audio is None:
+        encode_args += ['-an']
+    else:
+        audio_encoder = SMART_CUT_AUDIO_CODECS.get(audio.get("codec_name"))
+        sample_rate, channels = audio.get("sample_rate"), audio.get("channels")
+        if not (audio_encoder and audio.get("profile") in SMART_CUT_AUDIO_PROFILES and sample_rate and channels):
+            return None
+        encode_args += ['-c:a', audio_encoder, '-ar', str(sample_rate), '-ac', str(channels)]
+        concat_args += ['-bsf:a', 'aac_adtstoasc']
+    return encode_args, concat_args
+
+
+def smart_cut_clip(original_video_path: Path, start: float, end: float, output_path: Path, keyframe_index: dict,
+                   run_command: Callable[..., None] = run_ffmpeg_command,
+                   progress: Optional[ClipProgressReporter] = None):
+    """Cuts [start, end) without scaling, stream-copying whole GOPs and re-encoding only the edges."""
+    matched = smart_cut_encoder_args(keyframe_index)
+    plan = plan_smart_cut(keyframe_index.get("keyframes", []), start, end) if matched else [("encode", start, end)]
+
+    if len(plan) == 1 and plan[0][0] == "encode":
+        if matched is None:
+            print(f"Smart cut disabled for {original_video_path}: source stream parameters can't be matched, re-encoding the whole clip.")
+        run_command([
+            'ffmpeg', '-y',
+            '-ss', str(start),
+            '-i', str(original_video_path),
+            '-t', str(end - start),
+            '-c:v', 'libx264',
+            '-c:a', 'aac',
+            '-avoid_negative_ts', 'make_zero',
+            str(output_path)
+        ], on_progress=progress)
+        return
+
+    encode_args, concat_args = matched
+    parts_dir = output_path.parent / f".{output_path.stem}_parts"
+    parts_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        part_paths = []
+        for i, (kind, part_start, part_end) in enumerate(plan):
+            part_path = parts_dir / f"part_{i}.ts"
+            # Partes em MPEG-TS: cada uma leva seu SPS/PPS em banda, então as bordas
+            # reencodadas não dependem do extradata do trecho copiado
+            codec_args = ['-c', 'copy', '-bsf:v', 'h264_mp4toannexb'] if kind == "copy" else encode_args
+            command = [
+                'ffmpeg', '-y',
+                '-ss', str(part_start),
+                '-i', str(original_video_path),
+                '-t', str(part_end - part_start),
+                *codec_args,
+                '-avoid_negative_ts', 'make_zero',
+                '-f', SMART_CUT_PART_FORMAT,
+                str(part_path)
+            ]
+            print(f"Smart cut part {i} ({kind} {part_start}-{part_end}): {' '.join(command)}")
+            run_command(command, on_progress=progress.shifted(part_start - start) if progress else None)
+            part_paths.append(part_path)
+
+        concat_list_path = parts_dir / "concat.txt"
+        concat_list_path.write_text("".join(f"file '{path}'\n" for path in part_paths))
+        run_command([
+            'ffmpeg', '-y',
+            '-f', 'concat', '-safe', '0',
+            '-i', str(concat_list_path),
+            '-c', 'copy',
+            *concat_args,
+            str(output_path)
+        ])
+    finally:
+        for leftover in parts_dir.iterdir():
+            leftover.unlink()
+        parts_dir.rmdir()
+
+
+def resolve_clip_source(project: models.Project, start_time: float, end_time: float) -> tuple[Path, float]:
+    """
+    Returns the local file holding [start_time, end_time) and the offset of that file
+    on the original video timeline.
+
+    Projects downloaded in full use original_video_path (offset 0); projects downloaded
+    with the "segments" strategy use the segment in source_segments_json covering the range.
+    """
+    if project.original_video_path and Path(project.original_video_path).exists():
+        return Path(project.original_video_path), 0
+    for segment in project.source_segments_json or []:
+        if segment["start"] <= start_time and end_time <= segment["end"] and Path(segment["path"]).exists():
+            return Path(segment["path"]), segment["start"]
+    if project.source_segments_json:
+        raise ValueError(f"No downloaded segment of project {project.id} covers {start_time}-{end_time}s.")
+    raise ValueError(f"Original video for project {project.id} not found at {project.original_video_path}.")
+
+
+def process_clip(clip_id: int, db: Session, render_mode: str = RENDER_MODE_VERTICAL,
+                 run_command: Callable[..., None] = run_ffmpeg_command) -> str:
     clip = db.query(models.SuggestedClip).filter(models.SuggestedClip.id == clip_id).first()
     if not clip:
         raise ValueError(f"SuggestedClip with id {clip_id} not found.")
 
     try:
         clip.processing_status = "processing"
+        clip.processing_progress = 0.0
         db.commit()
 
         if not clip.project:
             raise ValueError(f"Project not found for clip id {clip_id}.")
-        if not clip.project.original_video_path or not Path(clip.project.original_video_path).exists():
-            raise ValueError(f"Original video for project {clip.project_id} not found at {clip.project.original_video_path}.")
 
-        original_video_path = Path(clip.project.original_video_path)
+        # Timestamps abaixo são relativos ao arquivo de origem (vídeo completo ou segmento)
+        original_video_path, source_offset = resolve_clip_source(
+            clip.project, clip.timestamp_inicio_segundos, clip.timestamp_fim_segundos
+        )
         project_media_path = Path(settings.MEDIA_ROOT_PATH) / f"project_{clip.project_id}"
         clips_dir = project_media_path / "clips"
         clips_dir.mkdir(parents=True, exist_ok=True)
@@ -40,43 +386,64 @@ def process_clip(clip_id: int, db: Session) -> str:
         processed_clip_filename = f"clip_{clip.id}.mp4"
         output_path = clips_dir / processed_clip_filename
 
-        # If the processed file already exists, skip the expensive processing step.
-        if output_path.exists():
-            print(f"Clip {clip_id} output file already exists. Skipping processing.")
+        start_time = clip.timestamp_inicio_segundos - source_offset
+        end_time = clip.timestamp_fim_segundos - source_offset
+        duration = end_time - start_time
+
+        if duration <= 0:
+            raise ValueError("Clip duration must be positive.")
+        if render_mode not in RENDER_MODES:
+            raise ValueError(f"Unknown render mode: {render_mode}")
+
+        # Normalização de loudness com a medição pré-calculada da fonte (sem segunda decodificação)
+        audio_filter = ""
+        if render_mode == RENDER_MODE_VERTICAL:
+            audio_filter = clip_loudnorm_filter(clip.project, clip.timestamp_inicio_segundos, clip.timestamp_fim_segundos)
+
+        # Reuse an identical earlier render (same source, range, filters and encoder settings).
+        render_cache = get_render_cache()
+        render_key = clip_render_key(original_video_path, start_time, end_time, render_mode, audio_filter)
+        if render_cache.fetch(render_key, output_path):
+            print(f"Clip {clip_id} served from render cache ({render_key}).")
             clip.processed_clip_path = str(output_path)
             clip.processing_status = "processed"
+            clip.processing_progress = 100.0
             db.commit()
             return str(output_path)
 
-        start_time = clip.timestamp_inicio_segundos
-        end_time = clip.timestamp_fim_segundos
-        duration = end_time - start_time
+        # The previous output may be a hard link into the cache; never write through it.
+        output_path.unlink(missing_ok=True)
+        progress = ClipProgressReporter(db, [(clip, 0, duration)])
 
-        if duration <= 0:
-            raise ValueError("Clip duration must be positive.")
+        if render_mode == RENDER_MODE_STRAIGHT_CUT:
+            # Sem crop/scale: copiar GOPs inteiros e reencodar apenas as bordas
+            keyframe_index = get_keyframe_index(clip.project_id, original_video_path)
+            smart_cut_clip(original_video_path, start_time, end_time, output_path, keyframe_index,
+                           run_command=run_command, progress=progress)
+        else:
+            # FFmpeg command for cutting and reformatting to 9:16 (center crop)
+            vf_opts = build_vertical_filter()
 
-        # FFmpeg command for cutting and reformatting to 9:16 (center crop)
-        target_w = 720
-        target_h = 1280
-        vf_opts = f"scale={target_w}:-2,crop={target_w}:{target_h}:(iw-{target_w})/2:(ih-{target_h})/2"
+            ffmpeg_command = [
+                'ffmpeg',
+                '-ss', str(start_time),
+                '-i', str(original_video_path),
+                '-t', str(duration),
+                '-vf', vf_opts,
+                *(['-af', audio_filter] if audio_filter else []),
+                *VERTICAL_ENCODER_ARGS,
+                '-y',
+                str(output_path)
+            ]
 
-        ffmpeg_command = [
-            'ffmpeg',
-            '-ss', str(start_time),
-            '-i', str(original_video_path),
-            '-t', str(duration),
-            '-vf', vf_opts,
-            '-c:a', 'aac',
-            '-strict', '-2',
-            '-y',
-            str(output_path)
-        ]
+            print(f"Running FFmpeg command: {' '.join(ffmpeg_command)}")
+            run_command(ffmpeg_command, on_progress=progress)
 
-        print(f"Running FFmpeg command: {' '.join(ffmpeg_command)}")
-        run_ffmpeg_command(ffmpeg_command)
+        render_cache.store(render_key, output_path)
 
         clip.processed_clip_path = str(output_path)
         clip.processing_status = "processed"
+        clip.processing_progress = 100.0
         db.commit()
         return str(output_path)
 
@@ -86,3 +453,175 @@ def process_clip(clip_id: int, db: Session) -> str:
         db.commit()
         print(f"Error processing clip {clip_id}: {e}")
         raise
+
+
+def build_batch_render_command(original_video_path: Path, ranges: list[tuple[float, float]], output_paths: list[Path],
+                               audio_filters: Optional[list[str]] = None, has_audio: bool = True) -> list[str]:
+    """
+    Builds a single FFmpeg invocation that renders every (start, end) range from one decode pass.
+
+    The input is seeked once to the earliest start and read only up to the latest end.
+    The decoded streams are split into one branch per range, each branch is trimmed to
+    its range and reformatted, and each branch is mapped to its own output. Sources
+    without an audio stream (has_audio=False) get video-only outputs.
+    """
+    seek_start = min(start for start, _ in ranges)
+    read_end = max(end for _, end in ranges)
+    vf_opts = build_vertical_filter()
+    count = len(ranges)
+
+    video_labels = "".join(f"[v{i}]" for i in range(count))
+    graph = [f"[0:v]split={count}{video_labels}"]
+    if has_audio: # "[0:a]" sem stream de áudio faz o ffmpeg falhar o lote inteiro
+        graph.append(f"[0:a]asplit={count}" + "".join(f"[a{i}]" for i in range(count)))
+    for i, (range_start, range_end) in enumerate(ranges):
+        start = range_start - seek_start
+        end = range_end - seek_start
+        graph.append(f"[v{i}]trim=start={start}:end={end},setpts=PTS-STARTPTS,{vf_opts}[vout{i}]")
+        if has_audio:
+            audio_filter = f",{audio_filters[i]}" if audio_filters and audio_filters[i] else ""
+            graph.append(f"[a{i}]atrim=start={start}:end={end},asetpts=PTS-STARTPTS{audio_filter}[aout{i}]")
+
+    ffmpeg_command = [
+        'ffmpeg',
+        '-y',
+        '-ss', str(seek_start),
+        '-t', str(read_end - seek_start),
+        '-i', str(original_video_path),
+        '-filter_complex', ";".join(graph),
+    ]
+    for i, output_path in enumerate(output_paths):
+        ffmpeg_command += [
+            '-map', f'[vout{i}]',
+            *(['-map', f'[aout{i}]'] if has_audio else []),
+            *VERTICAL_ENCODER_ARGS,
+            str(output_path)
+        ]
+    return ffmpeg_command
+
+
+def process_project_clips(project_id: int, db: Session,
+                          run_command: Callable[..., None] = run_ffmpeg_command,
+                          clip_ids: Optional[Iterable[int]] = None) -> dict[int, str | None]:
+    """
+    Renders every approved clip of a project (only those in clip_ids, when given) with one
+    FFmpeg process per source file (a single process when the full video was downloaded).
+
+    Returns a mapping of clip id to processed path (None for clips that failed). Each clip
+    gets its own processing_status/processing_error_detail. If a batch invocation itself
+    fails, its clips are rendered one by one with process_clip so that the failure is
+    attributed to the clip that caused it.
+    """
+    project = db.query(models.Project).filter(models.Project.id == project_id).first()
+    if not project:
+        raise ValueError(f"Project with id {project_id} not found.")
+
+    clips = db.query(models.SuggestedClip).filter(
+        models.SuggestedClip.project_id == project_id,
+        models.SuggestedClip.status_aprovacao == "approved"
+    ).order_by(models.SuggestedClip.timestamp_inicio_segundos).all()
+    if clip_ids is not None:
+        wanted = set(clip_ids)
+        clips = [clip for clip in clips if clip.id in wanted]
+    if not clips:
+        return {}
+
+    results: dict[int, str | None] = {}
+    clips_dir = Path(settings.MEDIA_ROOT_PATH) / f"project_{project_id}" / "clips"
+    clips_dir.mkdir(parents=True, exist_ok=True)
+    render_cache = get_render_cache()
+
+    # Agrupar por arquivo de origem; clipes já renderizados com os mesmos parâmetros saem do cache
+    batches: dict[Path, list[dict]] = {}
+    for clip in clips:
+        try:
+            if clip.timestamp_fim_segundos - clip.timestamp_inicio_segundos <= 0:
+                raise ValueError("Clip duration must be positive.")
+            source_path, offset = resolve_clip_source(project, clip.timestamp_inicio_segundos, clip.timestamp_fim_segundos)
+        except ValueError as e:
+            clip.processing_status = "processing_failed"
+            clip.processing_error_detail = str(e)
+            results[clip.id] = None
+            continue
+
+        start = clip.timestamp_inicio_segundos - offset
+        end = clip.timestamp_fim_segundos - offset
+        output_path = clips_dir / f"clip_{clip.id}.mp4"
+        audio_filter = clip_loudnorm_filter(project, clip.timestamp_inicio_segundos, clip.timestamp_fim_segundos)
+        render_key = clip_render_key(source_path, start, end, audio_filter=audio_filter)
+        if render_cache.fetch(render_key, output_path):
+            clip.processed_clip_path = str(output_path)
+            clip.processing_status = "processed"
+            clip.processing_progress = 100.0
+            results[clip.id] = str(output_path)
+            continue
+
+        output_path.unlink(missing_ok=True)
+        clip.processing_status = "processing"
+        clip.processing_error_detail = None
+        clip.processing_progress = 0.0
+        batches.setdefault(source_path, []).append(
+            {"clip": clip, "start": start, "end": end, "output_path": output_path, "render_key": render_key,
+             "audio_filter": audio_filter}
+        )
+    db.commit()
+
+    for source_path, items in batches.items():
+        results.update(_render_batch(project_id, source_path, items, db, render_cache, run_command))
+    return results
+
+
+def _source_has_audio(project_id: int, source_path: Path) -> bool:
+    """Whether the source has an audio stream, from the (cached) probe the smart cut also uses."""
+    try:
+        return get_keyframe_index(project_id, source_path).get("audio") is not None
+    except Exception as e:
+        # Sem probe, manter o áudio: se ele faltar, o lote falha e cai no render por clipe
+        print(f"Could not probe {source_path} for audio: {e}")
+        return True
+
+
+def _render_batch(project_id: int, source_path: Path, items: list[dict], db: Session,
+                  render_cache: RenderCache, run_command: Callable[..., None]) -> dict[int, str | None]:
+    results: dict[int, str | None] = {}
+    ranges = [(item["start"], item["end"]) for item in items]
+    output_paths = [item["output_path"] for item in items]
+    ffmpeg_command = build_batch_render_command(source_path, ranges, output_paths,
+                                                 [item["audio_filter"] for item in items],
+                                                 has_audio=_source_has_audio(project_id, source_path))
+    # A saída do comando em lote começa no início do primeiro clipe
+    seek_start = min(start for start, _ in ranges)
+    progress = ClipProgressReporter(db, [
+        (item["clip"], item["start"] - seek_start, item["end"] - item["start"]) for item in items
+    ])
+    try:
+        print(f"Running batch FFmpeg command for project {project_id} ({len(items)} clips): {' '.join(ffmpeg_command)}")
+        run_command(ffmpeg_command, on_progress=progress)
+    except Exception as e:
+        print(f"Batch render failed for project {project_id}: {e}. Falling back to per-clip rendering.")
+        # Outputs of a failed batch may be truncated; never let them be reused.
+        for output_path in output_paths:
+            output_path.unlink(missing_ok=True)
+        for item in items:
+            clip = item["clip"]
+            try:
+                results[clip.id] = process_clip(clip.id, db, run_command=run_command)
+            except Exception:
+                # process_clip already recorded the error on the clip
+                results[clip.id] = None
+        return results
+
+    for item in items:
+        clip, output_path = item["clip"], item["output_path"]
+        if output_path.exists() and output_path.stat().st_size > 0:
+            render_cache.store(item["render_key"], output_path)
+            clip.processed_clip_path = str(output_path)
+            clip.processing_status = "processed"
+            clip.processing_progress = 100.0
+            results[clip.id] = str(output_path)
+        else:
+            clip.processing_status = "processing_failed"
+            clip.processing_error_detail = f"Batch render did not produce an output file at {output_path}."
+            results[clip.id] = None
+    db.commit()
+    return results
@@ -1,6 +1,18 @@
-from typing import List, Tuple, Any
+from typing import List, Tuple, Any, Optional, Callable
+from collections import deque, OrderedDict
 import random
 import json # Adicionado para salvar JSON
+import threading
+import time
+import uuid
+import numpy as np
+from app.core.config import settings
+from app.services.stage_metrics import RETENTION_CACHE_LOOKUPS, RETENTION_CACHE_EVICTIONS
+from app.services.youtube_urls import extract_video_id
+
+# Limites de duração de um clipe sugerido (Ex: Passo C do briefing)
+CLIP_MIN_DURATION_SECONDS = 10
+CLIP_MAX_DURATION_SECONDS = 180
 
 # Mock data para simular a API do YouTube Analytics
 def get_mock_audience_retention(video_duration_seconds: int = 900) -> List[Tuple[int, float]]:
@@ -51,36 +63,25 @@ class YouTubeAnalyzerService:
         mock_data = get_mock_audience_retention(video_duration_seconds=random.randint(600, 1800))
         return mock_data
 
+    def get_cached_audience_retention_data(self, cache: Optional["RetentionCache"] = None) -> List[Tuple[int, float]]:
+        """get_audience_retention_data through the retention cache, keyed by the YouTube video ID."""
+        cache = cache or get_retention_cache()
+        video_key = extract_video_id(self.video_id) or self.video_id
+        return cache.get_or_fetch(video_key, self.get_audience_retention_data)
+
     def _calculate_moving_average(self, data: List[float], window_size: int) -> List[float]:
-        """Calculates the moving average of a list of numbers."""
-        moving_averages = []
-        for i in range(len(data)):
-            start_index = max(0, i - window_size // 2)
-            end_index = min(len(data), i + window_size // 2 + 1)
-            window = data[start_index:end_index]
-            moving_averages.append(sum(window) / len(window))
-        return moving_averages
+        """Calculates the centered moving average of a list of numbers."""
+        if not data:
+            return []
+        return moving_average_matrix(np.asarray([data], dtype=float), np.asarray([len(data)]), window_size)[0].tolist()
 
     def _merge_peaks(self, peaks: List[Tuple[int, int]], merge_distance_seconds: int) -> List[Tuple[int, int]]:
         """Merges adjacent peaks that are closer than the specified distance."""
         if not peaks:
             return []
-
-        merged_peaks = []
-        current_peak = peaks[0]
-
-        for next_peak in peaks[1:]:
-            # If the gap between the end of the current peak and the start of the next is small enough
-            if next_peak[0] - current_peak[1] <= merge_distance_seconds:
-                # Merge by extending the end time of the current peak
-                current_peak = (current_peak[0], next_peak[1])
-            else:
-                # The gap is too large, so finalize the current peak and start a new one
-                merged_peaks.append(current_peak)
-                current_peak = next_peak
-
-        merged_peaks.append(current_peak) # Add the last processed peak
-        return merged_peaks
+        starts, ends = np.asarray(peaks).T
+        rows = np.zeros(len(peaks), dtype=int)
+        return merge_peak_arrays(rows, starts, ends, merge_distance_seconds, 1)[0]
 
     def detect_retention_peaks(
         self,
@@ -91,36 +92,561 @@ class YouTubeAnalyzerService:
     ) -> List[Tuple[int, int]]:
         if not retention_data:
             return []
+        merged_peaks = detect_retention_peaks_batch(
+            [retention_data], moving_average_window, peak_threshold_factor, merge_distance_seconds
+        )[0]
+        print(f"Detected {len(merged_peaks)} merged peaks: {merged_peaks}")
+        return merged_peaks
 
-        timestamps, retention_values = zip(*retention_data)
 
-        moving_average = self._calculate_moving_average(list(retention_values), moving_average_window)
+def pad_retention_series(retention_series: List[List[Tuple[int, float]]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Packs series of different lengths into zero-padded (n_series, max_len) timestamp and
+    retention matrices. Returns (timestamps, values, lengths).
+    """
+    lengths = np.fromiter((len(series) for series in retention_series), dtype=int, count=len(retention_series))
+    max_len = int(lengths.max()) if len(lengths) else 0
+    first_timestamp = next((series[0][0] for series in retention_series if series), 0)
+    timestamps = np.zeros((len(retention_series), max_len), dtype=np.asarray(first_timestamp).dtype)
+    values = np.zeros((len(retention_series), max_len), dtype=float)
+    for row, series in enumerate(retention_series):
+        if series:
+            series_array = np.asarray(series, dtype=float)
+            timestamps[row, :len(series)] = series_array[:, 0]
+            values[row, :len(series)] = series_array[:, 1]
+    return timestamps, values, lengths
+
+
+def moving_average_matrix(values: np.ndarray, lengths: np.ndarray, window_size: int) -> np.ndarray:
+    """
+    Centered moving average of every row (window clipped at the series edges), in O(n)
+    per row via float64 cumulative sums of the row rebased on its mean. Positions past
+    a row's length are undefined.
+
+    The result may differ from `sum(window) / len(window)` in the last bits; peak
+    detection runs it through settle_moving_average_ties, which redoes the points where
+    those bits could flip a comparison.
+    """
+    n_rows, max_len = values.shape
+    lo, hi = _window_bounds(max_len, lengths, window_size)
+    base, rebased = _rebase_rows(values, lengths)
+    cumulative = np.zeros((n_rows, max_len + 1))
+    np.cumsum(rebased, axis=1, out=cumulative[:, 1:])
+    window_sums = np.take_along_axis(cumulative, hi, axis=1) - cumulative[:, lo]
+    return window_sums / np.maximum(hi - lo, 1) + base # max(): só afeta o padding, evita divisão por zero
+
+
+def settle_moving_average_ties(values: np.ndarray, moving_average: np.ndarray, lengths: np.ndarray,
+                               window_size: int, peak_threshold_factor) -> np.ndarray:
+    """
+    Recomputes, summing the window left to right like `sum(window) / len(window)`, the
+    moving average of the points whose peak open/close comparison is within the cumsum
+    rounding error (plateaus, where retention equals its own average), so the peaks
+    match the per-point loop exactly. O(window) per settled point; returns a new matrix
+    when any point is settled.
+
+    peak_threshold_factor may be a scalar or a (n_rows, 1) array of per-row factors.
+    """
+    eps = np.finfo(float).eps
+    n_rows, max_len = values.shape
+    lo, hi = _window_bounds(max_len, lengths, window_size)
+    base, rebased = _rebase_rows(values, lengths)
+    valid = np.arange(max_len)[None, :] < lengths[:, None]
+    # Limites do erro da soma recursiva: prefixos do cumsum (com o rebase) e a própria soma da janela na referência
+    abs_rebased = np.zeros((n_rows, max_len + 1))
+    np.cumsum(np.abs(rebased), axis=1, out=abs_rebased[:, 1:])
+    abs_values = np.zeros((n_rows, max_len + 1))
+    np.cumsum(np.abs(np.where(valid, values, 0.0)), axis=1, out=abs_values[:, 1:])
+    count = np.maximum(hi - lo, 1)
+    prefix_error = eps * (hi + 2) * (np.take_along_axis(abs_rebased, hi, axis=1) + abs_rebased[:, lo])
+    window_error = eps * count * (np.take_along_axis(abs_values, hi, axis=1) - abs_values[:, lo])
+    bound = (prefix_error + window_error) / count + 4 * eps * (np.abs(moving_average) + np.abs(base))
+
+    factor = np.abs(np.asarray(peak_threshold_factor, dtype=float))
+    near = valid & ((np.abs(values - moving_average) <= bound) |
+                    (np.abs(values - moving_average * peak_threshold_factor) <= (bound + 2 * eps * np.abs(moving_average)) * factor))
+    if not near.any():
+        return moving_average
+    rows, cols = np.nonzero(near)
+    settled = moving_average.copy()
+    settled[rows, cols] = _exact_window_average(values, lengths, window_size, rows, cols)
+    return settled
+
+
+def _window_bounds(max_len: int, lengths: np.ndarray, window_size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Window [lo, hi) of every position: lo per column, hi per row and column."""
+    half = window_size // 2
+    index = np.arange(max_len)
+    return np.maximum(index - half, 0), np.minimum(index[None, :] + half + 1, lengths[:, None])
+
+
+def _rebase_rows(values: np.ndarray, lengths: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-row mean of the valid points and the values minus it (0.0 in the padding)."""
+    valid = np.arange(values.shape[1])[None, :] < lengths[:, None]
+    base = (np.where(valid, values, 0.0).sum(axis=1) / np.maximum(lengths, 1))[:, None]
+    return base, np.where(valid, values - base, 0.0)
 
-        raw_peaks = []
-        in_peak = False
-        current_peak_start_time = 0
 
-        segment_duration = 5 # Default segment duration
-        if len(timestamps) > 1:
-            segment_duration = timestamps[1] - timestamps[0]
+def _exact_window_average(values: np.ndarray, lengths: np.ndarray, window_size: int,
+                          rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+    """`sum(window) / len(window)` at the given points, bit for bit (same summation order)."""
+    half = window_size // 2
+    max_len = values.shape[1]
+    lo = np.maximum(cols - half, 0)
+    hi = np.minimum(cols + half + 1, lengths[rows])
+    window_sums = np.zeros(len(rows))
+    for offset in range(2 * half + 1):
+        position = lo + offset
+        # Fora da janela soma 0.0, que não altera o acumulado (x + 0.0 == x)
+        window_sums += np.where(position < hi, values[rows, np.minimum(position, max_len - 1)], 0.0)
+    return window_sums / np.maximum(hi - lo, 1)
 
-        for i, (timestamp, retention) in enumerate(retention_data):
-            threshold = moving_average[i] * peak_threshold_factor
-            if retention > threshold and not in_peak:
+
+def peak_state_matrix(values: np.ndarray, moving_average: np.ndarray, lengths: np.ndarray,
+                      peak_threshold_factor) -> np.ndarray:
+    """
+    Boolean "inside a peak" state per point. A peak opens when retention goes above
+    moving_average * factor and closes when it drops below the moving average; the
+    hysteresis is resolved with a forward fill of the last open/close event.
+
+    peak_threshold_factor may be a scalar or a (n_rows, 1) array of per-row factors.
+    """
+    n_rows, max_len = values.shape
+    valid = np.arange(max_len)[None, :] < lengths[:, None]
+    opens = (values > moving_average * peak_threshold_factor) & valid
+    closes = (values < moving_average) & valid
+    if np.any(opens & closes):
+        # Fator < 1: abrir e fechar no mesmo ponto depende do estado anterior, resolver em loop
+        return _peak_state_loop(opens, closes, lengths)
+
+    event_index = np.where(opens | closes, np.arange(max_len)[None, :], -1)
+    np.maximum.accumulate(event_index, axis=1, out=event_index)
+    state = np.take_along_axis(opens, np.maximum(event_index, 0), axis=1) & (event_index >= 0)
+    return state & valid
+
+
+def _peak_state_loop(opens: np.ndarray, closes: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    state = np.zeros(opens.shape, dtype=bool)
+    for row, length in enumerate(lengths):
+        in_peak = False
+        for i in range(length):
+            if opens[row, i] and not in_peak:
                 in_peak = True
-                current_peak_start_time = timestamp
-            elif retention < moving_average[i] and in_peak: # End peak when it drops below the simple moving average
+            elif closes[row, i] and in_peak:
                 in_peak = False
-                peak_end_time = retention_data[i-1][0] + segment_duration
-                raw_peaks.append((current_peak_start_time, peak_end_time))
+            state[row, i] = in_peak
+    return state
 
-        if in_peak: # If still in peak at the end of data
-            peak_end_time = retention_data[-1][0] + segment_duration
-            raw_peaks.append((current_peak_start_time, peak_end_time))
 
-        print(f"Detected {len(raw_peaks)} raw peaks: {raw_peaks}")
+def merged_peak_arrays(rows: np.ndarray, starts: np.ndarray, ends: np.ndarray,
+                       merge_distance_seconds: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Merges consecutive peaks of the same row whose gap is <= merge_distance_seconds.
+    Peaks must be sorted by (row, start). A merged peak spans from its first start to
+    its last end. Returns the merged (rows, starts, ends) arrays.
+    """
+    if len(starts) == 0:
+        return rows, starts, ends
+    new_group = np.ones(len(starts), dtype=bool)
+    new_group[1:] = (rows[1:] != rows[:-1]) | (starts[1:] - ends[:-1] > merge_distance_seconds)
+    group_first = np.flatnonzero(new_group)
+    group_last = np.append(group_first[1:] - 1, len(starts) - 1)
+    return rows[group_first], starts[group_first], ends[group_last]
 
-        merged_peaks = self._merge_peaks(raw_peaks, merge_distance_seconds)
-        print(f"Detected {len(merged_peaks)} merged peaks: {merged_peaks}")
 
-        return merged_peaks
+def merge_peak_arrays(rows: np.ndarray, starts: np.ndarray, ends: np.ndarray,
+                      merge_distance_seconds: float, n_rows: int) -> List[List[Tuple[int, int]]]:
+    """merged_peak_arrays, returned as one list of (start, end) tuples per row."""
+    merged: List[List[Tuple[int, int]]] = [[] for _ in range(n_rows)]
+    for row, start, end in zip(*(array.tolist() for array in merged_peak_arrays(rows, starts, ends, merge_distance_seconds))):
+        merged[row].append((start, end))
+    return merged
+
+
+def raw_peak_arrays(timestamps: np.ndarray, state: np.ndarray, lengths: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Turns a peak state matrix into unmerged (rows, starts, ends) arrays, sorted by row
+    and start. A peak ends one segment after its last point.
+    """
+    n_rows, max_len = state.shape
+    # Duração do segmento: diferença entre os dois primeiros pontos (5s por padrão)
+    segment_duration = np.where(lengths > 1, timestamps[:, min(1, max_len - 1)] - timestamps[:, 0], 5)
+
+    # state é False depois do fim de cada série, então o padding fecha picos abertos no último ponto
+    padded_state = np.zeros((n_rows, max_len + 2), dtype=bool)
+    padded_state[:, 1:-1] = state
+    start_rows, start_index = np.nonzero(state & ~padded_state[:, :-2])
+    end_rows, end_index = np.nonzero(state & ~padded_state[:, 2:]) # Último ponto dentro do pico
+    return start_rows, timestamps[start_rows, start_index], timestamps[end_rows, end_index] + segment_duration[end_rows]
+
+
+def detect_retention_peaks_batch(
+    retention_series: List[List[Tuple[int, float]]],
+    moving_average_window: int = 12,
+    peak_threshold_factor: float = 1.15,
+    merge_distance_seconds: int = 15
+) -> List[List[Tuple[int, int]]]:
+    """
+    Detects retention peaks of many series at once (bulk re-analysis). Same semantics
+    as YouTubeAnalyzerService.detect_retention_peaks, which delegates here; returns one
+    list of merged (start, end) peaks per input series.
+    """
+    if not retention_series:
+        return []
+    timestamps, values, lengths = pad_retention_series(retention_series)
+    n_rows, max_len = values.shape
+    if max_len == 0:
+        return [[] for _ in retention_series]
+
+    moving_average = moving_average_matrix(values, lengths, moving_average_window)
+    moving_average = settle_moving_average_ties(values, moving_average, lengths, moving_average_window, peak_threshold_factor)
+    state = peak_state_matrix(values, moving_average, lengths, peak_threshold_factor)
+
+    rows, starts, ends = raw_peak_arrays(timestamps, state, lengths)
+    return merge_peak_arrays(rows, starts, ends, merge_distance_seconds, n_rows)
+
+
+class StreamingPeakDetector:
+    """
+    Online version of detect_retention_peaks for retention data that arrives in chunks.
+
+    Uses the same centered moving average, open/close thresholds and merge rule. A point
+    is evaluated once the `window_size // 2` points after it have arrived. A merged peak
+    is emitted as soon as a later point proves no further peak can merge into it. State
+    is O(window) and serializable (to_dict/from_dict), so a worker can resume it later.
+    """
+
+    def __init__(self, moving_average_window: int = 12, peak_threshold_factor: float = 1.15,
+                 merge_distance_seconds: int = 15):
+        self.moving_average_window = moving_average_window
+        self.peak_threshold_factor = peak_threshold_factor
+        self.merge_distance_seconds = merge_distance_seconds
+        self.half = moving_average_window // 2
+        self.points: deque = deque() # (timestamp, retention) de índices [window_start, total)
+        self.window_start = 0 # Índice do primeiro ponto em self.points
+        self.total = 0 # Pontos recebidos
+        self.next_index = 0 # Próximo ponto a avaliar
+        self.first_timestamp = None
+        self.segment_duration = None
+        self.in_peak = False
+        self.peak_start = None
+        self.last_timestamp = None # Timestamp do último ponto avaliado
+        self.pending_peak: Optional[Tuple[int, int]] = None # Pico mesclado ainda aberto a merges
+        self.closed = False
+
+    def feed(self, chunk: List[Tuple[int, float]]) -> List[Tuple[int, int]]:
+        """Adds retention points (in timestamp order) and returns the peaks finalized by them."""
+        if self.closed:
+            raise ValueError("StreamingPeakDetector already closed.")
+        finalized = []
+        for timestamp, retention in chunk:
+            if self.first_timestamp is None:
+                self.first_timestamp = timestamp
+            elif self.segment_duration is None:
+                self.segment_duration = timestamp - self.first_timestamp
+            self.points.append((timestamp, retention))
+            self.total += 1
+            if self.total > self.next_index + self.half:
+                self._evaluate_next(finalized)
+        return finalized
+
+    def close(self) -> List[Tuple[int, int]]:
+        """Marks the end of the series, evaluating the remaining points and flushing open peaks."""
+        finalized = []
+        while self.next_index < self.total:
+            self._evaluate_next(finalized)
+        if self.in_peak:
+            self.in_peak = False
+            self._add_raw_peak((self.peak_start, self.last_timestamp + self._segment_duration()), finalized)
+        if self.pending_peak:
+            finalized.append(self.pending_peak)
+            self.pending_peak = None
+        self.closed = True
+        return finalized
+
+    def last_received_timestamp(self) -> Optional[int]:
+        """Timestamp of the newest point fed so far (None before the first one)."""
+        return self.points[-1][0] if self.points else self.last_timestamp
+
+    def _segment_duration(self):
+        return self.segment_duration if self.segment_duration is not None else 5
+
+    def context_seconds(self) -> float:
+        """History before a peak that the centered moving average of its points still reads."""
+        return (self.half + 1) * self._segment_duration()
+
+    def _evaluate_next(self, finalized: list):
+        i = self.next_index
+        window_end = min(self.total, i + self.half + 1)
+        window = [value for _, value in list(self.points)[:window_end - self.window_start]]
+        moving_average = sum(window) / len(window)
+        timestamp, retention = self.points[i - self.window_start]
+
+        if self.pending_peak and not self.in_peak and timestamp - self.pending_peak[1] > self.merge_distance_seconds:
+            # Qualquer pico futuro começa em timestamp ou depois: não pode mais ser mesclado
+            # (um pico já aberto começou perto o bastante para ser mesclado ao fechar)
+            finalized.append(self.pending_peak)
+            self.pending_peak = None
+
+        if retention > moving_average * self.peak_threshold_factor and not self.in_peak:
+            self.in_peak = True
+            self.peak_start = timestamp
+        elif retention < moving_average and self.in_peak:
+            self.in_peak = False
+            self._add_raw_peak((self.peak_start, self.last_timestamp + self._segment_duration()), finalized)
+
+        self.last_timestamp = timestamp
+        self.next_index += 1
+        # Manter só os pontos que ainda entram na janela de algum ponto não avaliado
+        while self.window_start < self.next_index - self.half:
+            self.points.popleft()
+            self.window_start += 1
+
+    def _add_raw_peak(self, peak: Tuple[int, int], finalized: list):
+        if self.pending_peak and peak[0] - self.pending_peak[1] <= self.merge_distance_seconds:
+            self.pending_peak = (self.pending_peak[0], peak[1])
+        else:
+            if self.pending_peak:
+                finalized.append(self.pending_peak)
+            self.pending_peak = peak
+
+    def to_dict(self) -> dict:
+        return {
+            "moving_average_window": self.moving_average_window,
+            "peak_threshold_factor": self.peak_threshold_factor,
+            "merge_distance_seconds": self.merge_distance_seconds,
+            "points": [list(point) for point in self.points],
+            "window_start": self.window_start,
+            "total": self.total,
+            "next_index": self.next_index,
+            "first_timestamp": self.first_timestamp,
+            "segment_duration": self.segment_duration,
+            "in_peak": self.in_peak,
+            "peak_start": self.peak_start,
+            "last_timestamp": self.last_timestamp,
+            "pending_peak": list(self.pending_peak) if self.pending_peak else None,
+            "closed": self.closed,
+        }
+
+    @classmethod
+    def from_dict(cls, state: dict) -> "StreamingPeakDetector":
+        detector = cls(state["moving_average_window"], state["peak_threshold_factor"], state["merge_distance_seconds"])
+        detector.points = deque(tuple(point) for point in state["points"])
+        for key in ("window_start", "total", "next_index", "first_timestamp", "segment_duration",
+                    "in_peak", "peak_start", "last_timestamp", "closed"):
+            setattr(detector, key, state[key])
+        detector.pending_peak = tuple(state["pending_peak"]) if state["pending_peak"] else None
+        return detector
+
+
+class InMemoryLRUBackend:
+    """Process-local cache backend: bounded LRU with per-entry expiry. on_evict is called for every entry dropped to fit max_entries."""
+
+    def __init__(self, max_entries: int = 512, clock=time.monotonic, on_evict: Optional[Callable[[], None]] = None):
+        self.max_entries = max_entries
+        self._clock = clock
+        self.on_evict = on_evict
+        self.evictions = 0
+        self._entries: OrderedDict = OrderedDict() # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= self._clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: str, ttl_seconds: int):
+        with self._lock:
+            self._entries[key] = (self._clock() + ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+                if self.on_evict:
+                    self.on_evict()
+
+
+class RedisCacheBackend:
+    """
+    Shared cache backend on Redis (or any client with the same get/set/delete API).
+    Also provides the cross-process lock used for single-flight fetches.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisCacheBackend":
+        import redis # Dependência opcional: só necessária com RETENTION_CACHE_REDIS_URL configurado
+        return cls(redis.Redis.from_url(url))
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.client.get(key)
+        return value.decode("utf-8") if isinstance(value, bytes) else value
+
+    def set(self, key: str, value: str, ttl_seconds: int):
+        self.client.set(key, value, ex=ttl_seconds)
+
+    # Compare-and-delete atômico: só o dono apaga a lock (a dele pode ter expirado e outro processo a pegou)
+    RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+    def acquire_lock(self, key: str, ttl_seconds: float) -> Optional[str]:
+        """Returns the owner token of the lock (SET NX PX), or None when another process holds it."""
+        token = uuid.uuid4().hex
+        if self.client.set(f"{key}:lock", token, nx=True, px=max(1, int(ttl_seconds * 1000))):
+            return token
+        return None
+
+    def release_lock(self, key: str, token: str) -> bool:
+        """Releases the lock only if `token` still owns it; False when it expired and was taken."""
+        return bool(self.client.eval(self.RELEASE_LOCK_SCRIPT, 1, f"{key}:lock", token))
+
+
+class RetentionCache:
+    """
+    Cache of audience-retention series keyed by video ID.
+
+    Lookups go through the local LRU, then the optional shared backend. On a miss, only
+    one caller fetches. Concurrent callers in the same process wait on that fetch, and
+    callers in other processes wait on the shared backend's lock. Hit/miss/eviction
+    counters are available through stats() and exported to Prometheus (stage_metrics).
+    """
+
+    KEY_PREFIX = "retention:"
+
+    def __init__(self, local: InMemoryLRUBackend, shared: Optional[RedisCacheBackend] = None,
+                 ttl_seconds: int = 3600, lock_timeout_seconds: float = 60.0, poll_interval_seconds: float = 0.2):
+        self.local = local
+        self.shared = shared
+        self.ttl_seconds = ttl_seconds
+        self.lock_timeout_seconds = lock_timeout_seconds
+        self.poll_interval_seconds = poll_interval_seconds
+        self._in_flight: dict = {}
+        self._lock = threading.Lock()
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.coalesced = 0 # Chamadas que esperaram o fetch de outra thread
+        self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.local_hits + self.shared_hits + self.coalesced
+            return {
+                "local_hits": self.local_hits,
+                "shared_hits": self.shared_hits,
+                "coalesced": self.coalesced,
+                "hits": hits,
+                "misses": self.misses,
+                "hit_ratio": hits / (hits + self.misses) if hits + self.misses else 0.0,
+                "evictions": self.local.evictions,
+            }
+
+    _METRIC_RESULTS = {"local_hits": "local_hit", "shared_hits": "shared_hit", "coalesced": "coalesced", "misses": "miss"}
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+        RETENTION_CACHE_LOOKUPS.labels(self._METRIC_RESULTS[counter]).inc()
+
+    def _lookup(self, key: str) -> Tuple[Optional[str], Optional[str]]:
+        value = self.local.get(key)
+        if value is not None:
+            return value, "local_hits"
+        if self.shared:
+            value = self.shared.get(key)
+            if value is not None:
+                self.local.set(key, value, self.ttl_seconds)
+                return value, "shared_hits"
+        return None, None
+
+    def get_or_fetch(self, video_id: str, fetch: Callable[[], List[Tuple[int, float]]]) -> List[Tuple[int, float]]:
+        key = self.KEY_PREFIX + video_id
+        value, counter = self._lookup(key)
+        if value is not None:
+            self._count(counter)
+            return _decode_retention(value)
+
+        while True:
+            with self._lock:
+                flight = self._in_flight.get(key)
+                is_leader = flight is None
+                if is_leader:
+                    flight = self._in_flight[key] = threading.Event()
+            if not is_leader:
+                flight.wait()
+                value, _ = self._lookup(key)
+                if value is not None:
+                    self._count("coalesced")
+                    return _decode_retention(value)
+                continue # O fetch do líder falhou: tentar de novo (talvez como líder)
+
+            try:
+                return _decode_retention(self._fetch_shared(key, fetch))
+            finally:
+                with self._lock:
+                    del self._in_flight[key]
+                flight.set()
+
+    def _fetch_shared(self, key: str, fetch: Callable[[], List[Tuple[int, float]]]) -> str:
+        """Fetches under the shared lock (when there is a shared backend) and fills both tiers."""
+        lock_token = None
+        if self.shared:
+            deadline = time.monotonic() + self.lock_timeout_seconds
+            lock_token = self.shared.acquire_lock(key, self.lock_timeout_seconds)
+            while not lock_token and time.monotonic() < deadline:
+                # Outro processo está buscando o mesmo vídeo: esperar o resultado dele
+                time.sleep(self.poll_interval_seconds)
+                value = self.shared.get(key)
+                if value is not None:
+                    self.local.set(key, value, self.ttl_seconds)
+                    self._count("shared_hits")
+                    return value
+                lock_token = self.shared.acquire_lock(key, self.lock_timeout_seconds)
+
+        try:
+            self._count("misses")
+            value = _encode_retention(fetch())
+            self.local.set(key, value, self.ttl_seconds)
+            if self.shared:
+                self.shared.set(key, value, self.ttl_seconds)
+            return value
+        finally:
+            if lock_token and not self.shared.release_lock(key, lock_token):
+                print(f"Retention cache lock for {key} expired during the fetch; left the current holder's lock in place.")
+
+
+def _encode_retention(retention_data: List[Tuple[int, float]]) -> str:
+    return json.dumps([list(point) for point in retention_data])
+
+
+def _decode_retention(value: str) -> List[Tuple[int, float]]:
+    return [tuple(point) for point in json.loads(value)]
+
+
+_retention_cache: Optional[RetentionCache] = None
+_retention_cache_lock = threading.Lock()
+
+
+def get_retention_cache() -> RetentionCache:
+    """Process-wide retention cache configured from settings."""
+    global _retention_cache
+    with _retention_cache_lock:
+        if _retention_cache is None:
+            shared = RedisCacheBackend.from_url(settings.RETENTION_CACHE_REDIS_URL) if settings.RETENTION_CACHE_REDIS_URL else None
+            _retention_cache = RetentionCache(
+                InMemoryLRUBackend(settings.RETENTION_CACHE_MAX_ENTRIES, on_evict=RETENTION_CACHE_EVICTIONS.inc),
+                shared,
+                ttl_seconds=settings.RETENTION_CACHE_TTL_SECONDS,
+            )
+        return _retention_cache
@@ -1,133 +1,221 @@
-import time
+import asyncio
 import random
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+import httpx
 from app.db import models
 from sqlalchemy.orm import Session
 from app.core.config import settings # Para GOOGLE_CLIENT_ID, etc.
-# from google.oauth2.credentials import Credentials # Para uso real
-# from googleapiclient.discovery import build # Para uso real
-# from googleapiclient.http import MediaFileUpload # Para uso real
+from app.services.upload_engine import AsyncUploadEngine, UploadJob, UploadResult
+from app.services.stage_metrics import record_stage_event
+from app.services.task_leases import (
+    acquire_lease, complete_lease, fail_lease, new_owner, publish_lease_key, LEASE_DONE
+)
+
+class GoogleTokenExpired(Exception):
+    """The user's Google access token expired and could not be refreshed."""
+
+
+def refresh_google_access_token(db: Session, user: models.User, client: Optional[httpx.Client] = None) -> str:
+    """
+    Exchanges the user's refresh token for a new access token at the Google token
+    endpoint and stores it (with its expiry) on the user. Raises GoogleTokenExpired.
+    """
+    if not user.google_refresh_token:
+        raise GoogleTokenExpired("Google access token expired and no refresh token is stored; reconnect the YouTube account.")
+    data = {
+        "grant_type": "refresh_token",
+        "refresh_token": user.google_refresh_token,
+        "client_id": settings.GOOGLE_CLIENT_ID,
+        "client_secret": settings.GOOGLE_CLIENT_SECRET,
+    }
+    try:
+        if client is not None:
+            response = client.post(settings.GOOGLE_TOKEN_URL, data=data)
+        else:
+            response = httpx.post(settings.GOOGLE_TOKEN_URL, data=data, timeout=30.0)
+    except httpx.HTTPError as e:
+        raise GoogleTokenExpired(f"Google access token expired and the refresh request failed: {e}")
+    if response.status_code != 200:
+        # invalid_grant: refresh token revogado/expirado, só reconectando a conta
+        raise GoogleTokenExpired(f"Google access token expired and could not be refreshed ({response.status_code}): {response.text[:200]}")
+    payload = response.json()
+    user.google_auth_token = payload["access_token"]
+    user.google_token_expires_at = datetime.utcnow() + timedelta(seconds=int(payload.get("expires_in", 3600)))
+    if payload.get("refresh_token"): # O Google pode rotacionar o refresh token
+        user.google_refresh_token = payload["refresh_token"]
+    db.commit()
+    print(f"Refreshed Google access token of user {user.id} (expires at {user.google_token_expires_at}).")
+    return user.google_auth_token
+
 
 class YouTubePublishingService:
-    def __init__(self, db_session: Session):
+    """
+    Publishes scheduled clips. Uploads run on AsyncUploadEngine: one worker process
+    uploads a whole batch of publications concurrently (resumable, chunked), instead of
+    blocking for each one. All DB reads/writes happen outside the event loop.
+    """
+
+    def __init__(self, db_session: Session, engine: Optional[AsyncUploadEngine] = None,
+                 oauth_client: Optional[httpx.Client] = None):
         self.db = db_session
+        self.oauth_client = oauth_client # Cliente do token endpoint do Google (testes injetam um MockTransport)
+        self.engine = engine or AsyncUploadEngine(
+            settings.YOUTUBE_UPLOAD_URL,
+            max_concurrent=settings.PUBLISH_MAX_CONCURRENT_UPLOADS,
+            per_account_limit=settings.PUBLISH_MAX_UPLOADS_PER_ACCOUNT,
+            chunk_size=settings.PUBLISH_UPLOAD_CHUNK_BYTES,
+            max_retries=settings.PUBLISH_UPLOAD_MAX_RETRIES,
+        )
+
+    def publish_short_to_youtube(self, publication_id: int, owner: Optional[str] = None,
+                                 enqueued_at: Optional[datetime] = None) -> bool:
+        return self.publish_many([publication_id], owner, enqueued_at).get(publication_id, False)
+
+    def publish_many(self, publication_ids: List[int], owner: Optional[str] = None,
+                     enqueued_at: Optional[datetime] = None) -> Dict[int, bool]:
+        """
+        Publishes every publication concurrently. Returns {publication_id: published}.
+        Each publication is leased (owner = Celery task id): a duplicate execution skips
+        it and reports the result of the one that holds the lease. Every upload is
+        recorded as a "publish" stage event.
+        """
+        owner = owner or new_owner()
+        outcome = {}
+        jobs = []
+        for publication_id in publication_ids:
+            lease = acquire_lease(self.db, publish_lease_key(publication_id), owner)
+            if not lease.acquired:
+                print(f"Publication {publication_id} is already handled by task {lease.owner} ({lease.status}); skipping duplicate.")
+                outcome[publication_id] = lease.status == LEASE_DONE and bool((lease.result or {}).get("video_id"))
+                continue
+            job = self._prepare_upload(publication_id)
+            if job is None:
+                fail_lease(self.db, publish_lease_key(publication_id), owner)
+                outcome[publication_id] = False
+            else:
+                jobs.append(job)
+        if jobs:
+            for result in asyncio.run(self._upload(jobs)):
+                outcome[result.publication_id] = self._record_result(result, owner, enqueued_at)
+                if result.ok:
+                    complete_lease(self.db, publish_lease_key(result.publication_id), owner, {"video_id": result.video_id})
+                else:
+                    fail_lease(self.db, publish_lease_key(result.publication_id), owner)
+        return outcome
+
+    def _fail(self, publication: models.ScheduledPublication, error: str):
+        publication.status_publicacao = "failed"
+        publication.publication_error = error
+        self.db.commit()
 
-    def publish_short_to_youtube(self, publication_id: int) -> bool:
+    def _access_token(self, user: models.User) -> str:
+        """A Google access token valid for at least GOOGLE_TOKEN_REFRESH_MARGIN_SECONDS, refreshing it if needed."""
+        expires_at = user.google_token_expires_at
+        margin = timedelta(seconds=settings.GOOGLE_TOKEN_REFRESH_MARGIN_SECONDS)
+        if user.google_auth_token and expires_at is not None and expires_at - datetime.utcnow() > margin:
+            return user.google_auth_token
+        # Expirado, perto de expirar (o upload falharia com 401 no meio) ou expiração desconhecida
+        return refresh_google_access_token(self.db, user, self.oauth_client)
+
+    def _prepare_upload(self, publication_id: int) -> Optional[UploadJob]:
+        """Validates a publication and marks it publishing. Returns its upload job, or None if it failed."""
         publication = self.db.query(models.ScheduledPublication).filter(models.ScheduledPublication.id == publication_id).first()
         if not publication:
             print(f"Publication {publication_id} not found.")
-            return False
+            return None
+
+        if publication.status_publicacao not in ("pending", "queued"): # Já publicada/em andamento: nunca enviar de novo
+            print(f"Publication {publication_id} is {publication.status_publicacao}; skipping.")
+            return None
 
         clip = publication.suggested_clip
         if not clip:
-            publication.status_publicacao = "failed"
-            publication.publication_error = "SuggestedClip not found."
-            self.db.commit()
-            return False
+            self._fail(publication, "SuggestedClip not found.")
+            return None
 
         project = clip.project
         if not project:
-            publication.status_publicacao = "failed"
-            publication.publication_error = "Project not found for clip."
-            self.db.commit()
-            return False
+            self._fail(publication, "Project not found for clip.")
+            return None
 
         user = project.owner
         if not user:
-            publication.status_publicacao = "failed"
-            publication.publication_error = "User (owner) not found for project."
-            self.db.commit()
-            return False
+            self._fail(publication, "User (owner) not found for project.")
+            return None
 
         if not clip.processed_clip_path:
-            publication.status_publicacao = "failed"
-            publication.publication_error = "Processed clip path is missing."
-            self.db.commit()
-            return False
+            self._fail(publication, "Processed clip path is missing.")
+            return None
+
+        access_token = user.google_auth_token or ""
+        if not settings.PUBLISH_SIMULATE:
+            if not user.google_auth_token and not user.google_refresh_token:
+                self._fail(publication, "User not authenticated with Google or missing YouTube scopes.")
+                return None
+            try:
+                access_token = self._access_token(user)
+            except GoogleTokenExpired as e:
+                self._fail(publication, str(e))
+                return None
 
-        # Simulação de publicação
-        print(f"Simulating YouTube Short publication for publication ID: {publication.id}")
-        print(f"  User: {user.email}, Clip ID: {clip.id}, Path: {clip.processed_clip_path}")
-        print(f"  Title: {clip.titulo_personalizado or project.title_base or 'My Awesome Short'}")
-        print(f"  Description: {clip.descricao_personalizada or project.description_base or 'Check out this cool short!'}")
-        print(f"  Hashtags: {clip.hashtags_personalizadas or project.hashtags_base or ['#short', '#viral']}" )
+        title = clip.titulo_personalizado or project.title_base or 'My Awesome Short'
+        print(f"Publishing YouTube Short for publication ID: {publication.id}")
+        print(f"  User: {user.email}, Clip ID: {clip.id}, Path: {clip.processed_clip_path}, Title: {title}")
 
         publication.status_publicacao = "publishing"
         self.db.commit()
+        return UploadJob(
+            publication_id=publication.id,
+            account_id=user.id,
+            access_token=access_token,
+            file_path=Path(clip.processed_clip_path),
+            metadata={
+                'snippet': {
+                    'title': title,
+                    'description': clip.descricao_personalizada or project.description_base or 'Check out this cool short!',
+                    'tags': clip.hashtags_personalizadas or project.hashtags_base or ['#short', '#viral'],
+                    'categoryId': '22' # Exemplo: People & Blogs. Varia conforme o conteúdo.
+                },
+                'status': {
+                    'privacyStatus': 'private', # 'public', 'private', or 'unlisted'
+                    'selfDeclaredMadeForKids': False # Importante
+                }
+            },
+        )
 
-        # Simular tempo de upload e processamento da API
-        time.sleep(random.randint(5, 15)) # Simula o tempo de upload
+    async def _upload(self, jobs: List[UploadJob]) -> List[UploadResult]:
+        if settings.PUBLISH_SIMULATE:
+            return await asyncio.gather(*(self._simulate_upload(job) for job in jobs))
+        return await self.engine.upload_many(jobs)
 
-        # Simular sucesso ou falha
+    async def _simulate_upload(self, job: UploadJob) -> UploadResult:
+        # Simular tempo de upload e processamento da API, sem bloquear o worker
+        started_at = datetime.utcnow()
+        await asyncio.sleep(random.randint(5, 15))
         if random.random() < 0.9: # 90% de chance de sucesso na simulação
+            return UploadResult(job.publication_id, video_id=f"mock_youtube_id_{random.randint(10000, 99999)}",
+                                started_at=started_at, finished_at=datetime.utcnow())
+        return UploadResult(job.publication_id, error="Simulated API error during YouTube upload.",
+                            started_at=started_at, finished_at=datetime.utcnow())
+
+    def _record_result(self, result: UploadResult, owner: Optional[str] = None,
+                       enqueued_at: Optional[datetime] = None) -> bool:
+        publication = self.db.query(models.ScheduledPublication).filter(models.ScheduledPublication.id == result.publication_id).first()
+        if result.ok:
             publication.status_publicacao = "published"
-            publication.id_publicacao_plataforma = f"mock_youtube_id_{random.randint(10000, 99999)}"
-            print(f"Mock publication successful for {publication.id}. YouTube ID: {publication.id_publicacao_plataforma}")
+            publication.id_publicacao_plataforma = result.video_id
+            print(f"Publication {publication.id} successful. YouTube ID: {result.video_id}")
         else:
             publication.status_publicacao = "failed"
-            publication.publication_error = "Simulated API error during YouTube upload."
-            print(f"Mock publication failed for {publication.id}: {publication.publication_error}")
-
+            publication.publication_error = result.error
+            print(f"Publication {publication.id} failed: {result.error}")
         self.db.commit()
-        return publication.status_publicacao == "published"
-
-        # ----- INÍCIO DA LÓGICA REAL (COMENTADA PARA MVP) -----
-        # if not user.google_auth_token: # Ou melhor, verificar se o token é válido e tem os escopos
-        #     publication.status_publicacao = "failed"
-        #     publication.publication_error = "User not authenticated with Google or missing YouTube scopes."
-        #     self.db.commit()
-        #     return False
-        #
-        # try:
-        #     credentials = Credentials(
-        #         token=user.google_auth_token,
-        #         refresh_token=user.google_refresh_token, # Essencial para obter novos access_tokens
-        #         token_uri='https://oauth2.googleapis.com/token',
-        #         client_id=settings.GOOGLE_CLIENT_ID,
-        #         client_secret=settings.GOOGLE_CLIENT_SECRET,
-        #         scopes=settings.YOUTUBE_API_SCOPES
-        #     )
-        #
-        #     if credentials.expired and credentials.refresh_token:
-        #         # Lidar com refresh do token aqui se necessário, ou assumir que o frontend/auth lida com isso
-        #         # credentials.refresh(Request()) # Request de google.auth.transport.requests
-        #         pass
-        #
-        #     youtube_service = build('youtube', 'v3', credentials=credentials)
-        #
-        #     video_title = clip.titulo_personalizado or project.title_base or f"Clip from {project.title_base}"
-        #     video_description = clip.descricao_personalizada or project.description_base or "Uploaded by ViralClipper AI"
-        #     video_tags = clip.hashtags_personalizadas or project.hashtags_base or []
-        #
-        #     media_body = MediaFileUpload(clip.processed_clip_path, chunksize=-1, resumable=True)
-        #
-        #     request_body = {
-        #         'snippet': {
-        #             'title': video_title,
-        #             'description': video_description,
-        #             'tags': video_tags,
-        #             'categoryId': '22' # Exemplo: People & Blogs. Varia conforme o conteúdo.
-        #         },
-        #         'status': {
-        #             'privacyStatus': 'private', # 'public', 'private', or 'unlisted'
-        #             'selfDeclaredMadeForKids': False # Importante
-        #         }
-        #     }
-        #
-        #     response = youtube_service.videos().insert(
-        #         part='snippet,status',
-        #         body=request_body,
-        #         media_body=media_body
-        #     ).execute()
-        #
-        #     publication.status_publicacao = "published"
-        #     publication.id_publicacao_plataforma = response.get('id')
-        #     self.db.commit()
-        #     return True
-        #
-        # except Exception as e:
-        #     publication.status_publicacao = "failed"
-        #     publication.publication_error = str(e)
-        #     self.db.commit()
-        #     print(f"Error publishing to YouTube for publication {publication.id}: {e}")
-        #     return False
-        # ----- FIM DA LÓGICA REAL -----
+        clip = publication.suggested_clip
+        record_stage_event(
+            self.db, "publish", result.started_at, result.finished_at,
+            project_id=clip.project_id, clip_id=clip.id, task_id=owner, enqueued_at=enqueued_at,
+            status="ok" if result.ok else "failed", bytes_transferred=result.bytes_sent or None,
+        )
+        return result.ok
@@ -0,0 +1,28 @@
+import re
+from typing import Optional
+from urllib.parse import urlparse, parse_qs
+
+VIDEO_ID_RE = re.compile(r"^[A-Za-z0-9_-]{11}$")
+YOUTUBE_HOSTS = {"youtube.com", "www.youtube.com", "m.youtube.com", "music.youtube.com", "youtube-nocookie.com", "www.youtube-nocookie.com"}
+
+
+def extract_video_id(youtube_url: str) -> Optional[str]:
+    """
+    Normalizes the many YouTube URL shapes (watch, youtu.be, shorts, embed, live)
+    to the 11 character video ID. Returns None for URLs that are not YouTube videos.
+    """
+    parsed = urlparse(str(youtube_url).strip())
+    host = (parsed.hostname or "").lower()
+    candidate = None
+    if host in ("youtu.be", "www.youtu.be"):
+        candidate = parsed.path.lstrip("/").split("/")[0]
+    elif host in YOUTUBE_HOSTS:
+        if parsed.path == "/watch":
+            candidate = (parse_qs(parsed.query).get("v") or [None])[0]
+        else:
+            parts = [part for part in parsed.path.split("/") if part]
+            if len(parts) >= 2 and parts[0] in ("shorts", "embed", "live", "v"):
+                candidate = parts[1]
+    if candidate and VIDEO_ID_RE.match(candidate):
+        return candidate
+    return None
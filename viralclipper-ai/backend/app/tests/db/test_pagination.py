@@ -0,0 +1,116 @@
+import pytest
+from datetime import datetime, timedelta
+from fastapi import HTTPException, Response
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.db.database import Base
+from app.db.models import User, Project, SuggestedClip, ScheduledPublication
+from app.db.pagination import paginate, encode_cursor, decode_cursor, InvalidCursor, NEXT_CURSOR_HEADER
+from app.apis.projects import list_user_projects
+from app.apis.clips import list_clips_for_project
+from app.apis.publications import list_schedules_for_project
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    session.add_all([User(id=1, email="a@b.c", hashed_password="x"), User(id=2, email="d@e.f", hashed_password="x")])
+    session.commit()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def projects(db):
+    created = datetime(2024, 1, 1)
+    # Pares com o mesmo created_at: o id desempata
+    db.add_all([Project(id=i, youtube_url=f"u{i}", owner_id=1, created_at=created + timedelta(minutes=i // 2)) for i in range(1, 8)])
+    db.add(Project(id=8, youtube_url="other", owner_id=2, created_at=created))
+    db.commit()
+
+
+class TestCursor:
+
+    def test_round_trip(self):
+        cursor = encode_cursor([datetime(2024, 1, 1, 12, 30, 0, 250), 42])
+        assert decode_cursor(cursor, [Project.created_at, Project.id]) == (datetime(2024, 1, 1, 12, 30, 0, 250), 42)
+
+    @pytest.mark.parametrize("cursor", ["not base64!", encode_cursor([1]), encode_cursor(["x", 1]), "e30"])
+    def test_invalid(self, cursor):
+        with pytest.raises(InvalidCursor):
+            decode_cursor(cursor, [Project.created_at, Project.id])
+
+
+class TestPaginate:
+
+    def test_descending_pages_cover_every_row_once(self, db, projects):
+        query = db.query(Project).filter(Project.owner_id == 1)
+        seen, cursor = [], None
+        while True:
+            page, cursor = paginate(query, [Project.created_at, Project.id], 3, cursor, descending=True)
+            seen.extend(project.id for project in page)
+            if cursor is None:
+                break
+        assert seen == [7, 6, 5, 4, 3, 2, 1]
+
+    def test_exact_last_page_has_no_cursor(self, db):
+        db.add(Project(id=1, youtube_url="u", owner_id=1))
+        for start in (30, 10, 20, 10):
+            db.add(SuggestedClip(project_id=1, timestamp_inicio_segundos=start, timestamp_fim_segundos=start + 30))
+        db.commit()
+        query = db.query(SuggestedClip).filter(SuggestedClip.project_id == 1)
+        first, cursor = paginate(query, [SuggestedClip.timestamp_inicio_segundos, SuggestedClip.id], 2)
+        second, last = paginate(query, [SuggestedClip.timestamp_inicio_segundos, SuggestedClip.id], 2, cursor)
+        assert [(c.timestamp_inicio_segundos, c.id) for c in first + second] == [(10, 2), (10, 4), (20, 3), (30, 1)]
+        assert last is None
+
+
+class TestListingEndpoints:
+
+    def test_projects_next_cursor_header(self, db, projects):
+        response = Response()
+        page = list_user_projects(response, db=db, current_user_id="1", cursor=None, limit=5)
+        assert [project.id for project in page] == [7, 6, 5, 4, 3]
+
+        following = Response()
+        rest = list_user_projects(following, db=db, current_user_id="1", cursor=response.headers[NEXT_CURSOR_HEADER], limit=5)
+        assert [project.id for project in rest] == [2, 1]
+        assert NEXT_CURSOR_HEADER not in following.headers
+
+    def test_invalid_cursor_is_bad_request(self, db, projects):
+        with pytest.raises(HTTPException) as error:
+            list_clips_for_project(1, Response(), db=db, current_user_id="1", cursor="garbage", limit=10)
+        assert error.value.status_code == 400
+
+    def test_project_schedules_page_across_clips(self, db, projects):
+        clips = [SuggestedClip(project_id=1, timestamp_inicio_segundos=start, timestamp_fim_segundos=start + 30) for start in (0, 60)]
+        db.add_all(clips)
+        db.commit()
+        at = datetime(2024, 6, 1)
+        # Mesmo horário em clipes diferentes: o id desempata
+        for clip, minutes in [(clips[0], 10), (clips[1], 0), (clips[1], 10), (clips[0], 5)]:
+            db.add(ScheduledPublication(suggested_clip_id=clip.id, plataforma_destino="youtube_shorts",
+                                        data_agendamento=at + timedelta(minutes=minutes)))
+        db.commit()
+
+        response = Response()
+        first = list_schedules_for_project(1, response, db=db, current_user_id="1", cursor=None, limit=3)
+        rest = list_schedules_for_project(1, Response(), db=db, current_user_id="1", cursor=response.headers[NEXT_CURSOR_HEADER], limit=3)
+        assert [schedule.id for schedule in first + rest] == [2, 4, 1, 3]
+
+
+class TestKeysetSchema:
+
+    def test_schedule_order_index_exists(self):
+        indexes = {index.name: [column.name for column in index.columns] for index in ScheduledPublication.__table__.indexes}
+        assert indexes["ix_scheduled_publications_agendamento_id"] == ["data_agendamento", "id"]
+
+    def test_project_created_at_is_never_null(self, db):
+        assert Project.__table__.c.created_at.nullable is False
+        # Inserções fora do ORM (scripts, SQL manual) recebem o default do banco
+        db.execute(text("INSERT INTO projects (id, youtube_url, owner_id) VALUES (50, 'raw', 1)"))
+        db.commit()
+        assert db.get(Project, 50).created_at is not None
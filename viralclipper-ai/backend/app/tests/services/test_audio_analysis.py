@@ -0,0 +1,126 @@
+import re
+import pytest
+import numpy as np
+from unittest.mock import patch, MagicMock
+from pathlib import Path
+from app.services.audio_analysis import (
+    parse_loudness_metadata, measure_range, build_loudnorm_filter, clip_loudnorm_filter,
+    analyze_loudness, build_loudness_track, SILENCE_LUFS
+)
+from app.services.clip_scoring import score_clip_candidates
+from app.workers.render_pool import RenderScheduler
+
+METADATA = """frame:0    pts:0       pts_time:0
+lavfi.r128.M=-120.691
+lavfi.r128.true_peak=0.000000
+frame:1    pts:4800    pts_time:0.5
+lavfi.r128.M=-20.000
+lavfi.r128.true_peak=0.250000
+frame:2    pts:48000   pts_time:1
+lavfi.r128.M=-18.000
+lavfi.r128.true_peak=0.500000
+frame:3    pts:52800   pts_time:1.5
+lavfi.r128.M=-18.000
+lavfi.r128.true_peak=0.400000
+"""
+
+
+def fake_ffmpeg(metadata_by_source):
+    """run_command que escreve o arquivo do ametadata=print como o ffmpeg faria."""
+    def run(command):
+        source = command[command.index('-i') + 1]
+        metadata_file = re.search(r"file='([^']+)'", command[command.index('-af') + 1]).group(1)
+        Path(metadata_file).write_text(metadata_by_source[source])
+    return run
+
+
+@pytest.fixture
+def audio_settings(tmp_path):
+    with patch('app.services.audio_analysis.settings') as mock_settings:
+        mock_settings.MEDIA_ROOT_PATH = str(tmp_path)
+        mock_settings.AUDIO_LOUDNORM_ENABLED = True
+        mock_settings.LOUDNORM_TARGET_I = -14.0
+        mock_settings.LOUDNORM_TARGET_TP = -1.5
+        mock_settings.LOUDNORM_TARGET_LRA = 11.0
+        yield mock_settings
+
+
+class TestLoudnessTrack:
+
+    def test_parse_aggregates_per_second(self):
+        track = parse_loudness_metadata(METADATA)
+        # Segundo 0: média de energia de -70 (piso do silêncio) e -20 LUFS
+        assert track["loudness"] == [round(10 * np.log10((10 ** -7 + 10 ** -2) / 2), 1), -18.0]
+        assert track["true_peak"] == [round(20 * np.log10(0.25), 1), round(20 * np.log10(0.5), 1)]
+
+    def test_analyze_runs_audio_only_pass(self, tmp_path):
+        commands = []
+        run = fake_ffmpeg({"/media/source.mp4": METADATA})
+        track = analyze_loudness(Path("/media/source.mp4"), tmp_path, run_command=lambda c: (commands.append(c), run(c)))
+        assert len(track["loudness"]) == 2
+        assert '-vn' in commands[0]
+        assert "ebur128=metadata=1:peak=true" in commands[0][commands[0].index('-af') + 1]
+        assert not (tmp_path / "loudness_metadata.txt").exists()
+
+    def test_command_survives_render_scheduler_thread_budget(self, tmp_path):
+        commands = []
+        run = fake_ffmpeg({"/media/source.mp4": METADATA})
+        scheduler = RenderScheduler(cpus=2, max_jobs=1, runner=lambda c: (commands.append(c), run(c)))
+
+        track = analyze_loudness(Path("/media/source.mp4"), tmp_path, run_command=scheduler.run)
+        assert len(track["loudness"]) == 2
+        command = commands[0]
+        assert command[command.index('-dn') + 1] == '-af'
+        assert command[command.index('-af') + 1].startswith("ebur128=")
+        assert command[-5:] == ['-f', 'null', '-threads', '2', '-']
+
+    def test_segments_are_placed_on_original_timeline(self, audio_settings):
+        project = MagicMock(id=3, original_video_path=None,
+                            source_segments_json=[{"start": 0, "path": "/s/a.mp4"}, {"start": 4, "path": "/s/b.mp4"}])
+        db = MagicMock()
+        track = build_loudness_track(project, db, fake_ffmpeg({"/s/a.mp4": METADATA, "/s/b.mp4": METADATA}))
+        assert len(track["loudness"]) == 6
+        assert track["loudness"][2:4] == [None, None] # Fora dos segmentos baixados
+        assert track["loudness"][5] == -18.0
+        assert project.audio_loudness_json == track
+        db.commit.assert_called_once()
+
+
+class TestLoudnorm:
+
+    def test_measure_range_gates_silence(self):
+        track = {"loudness": [SILENCE_LUFS, -20.0, -20.0, -20.0, None], "true_peak": [SILENCE_LUFS, -3.0, -1.0, -2.0, None]}
+        measurement = measure_range(track, 0, 5)
+        assert measurement["measured_I"] == -20.0
+        assert measurement["measured_LRA"] == 0.0
+        assert measurement["measured_TP"] == -1.0
+        assert measurement["measured_thresh"] == -30.0
+        assert measure_range(track, 0, 1) is None
+
+    def test_filter_uses_precomputed_measurement(self, audio_settings):
+        af = build_loudnorm_filter({"measured_I": -20.0, "measured_LRA": 0.0, "measured_TP": -1.0, "measured_thresh": -30.0})
+        assert af == ("loudnorm=I=-14.0:TP=-1.5:LRA=11.0:measured_I=-20.0:measured_LRA=0.0:"
+                      "measured_TP=-1.0:measured_thresh=-30.0:linear=true,aresample=48000")
+        assert build_loudnorm_filter(None) == ""
+
+    def test_clip_filter_disabled_or_without_track(self, audio_settings):
+        project = MagicMock(audio_loudness_json={"loudness": [-20.0] * 10, "true_peak": [-3.0] * 10})
+        assert clip_loudnorm_filter(project, 0, 10).startswith("loudnorm=")
+        audio_settings.AUDIO_LOUDNORM_ENABLED = False
+        assert clip_loudnorm_filter(project, 0, 10) == ""
+        audio_settings.AUDIO_LOUDNORM_ENABLED = True
+        assert clip_loudnorm_filter(MagicMock(audio_loudness_json=None), 0, 10) == ""
+
+
+class TestAudioScoring:
+
+    def test_louder_clip_scores_higher(self):
+        retention = [(t, 50.0) for t in range(0, 100, 5)] # Retenção plana: só o áudio diferencia
+        loudness = {"loudness": [-30.0] * 50 + [-12.0] * 50, "true_peak": [-6.0] * 100}
+        weights = {"height": 0.45, "area": 0.25, "slope": 0.15, "audio": 0.15}
+        candidates = [(10, 30), (60, 80)]
+        quiet, loud = score_clip_candidates(retention, candidates, weights=weights, loudness=loudness)
+        assert loud > quiet
+        # Sem trilha de loudness os pesos restantes são renormalizados
+        without = score_clip_candidates(retention, candidates, weights=weights)
+        assert without[0] == without[1]
@@ -0,0 +1,50 @@
+import random
+import numpy as np
+import pytest
+from unittest.mock import patch
+from app.services.clip_scoring import score_clip_candidates, top_k_clips, rank_clip_candidates
+from app.services.youtube_analyzer import get_mock_audience_retention, YouTubeAnalyzerService
+
+WEIGHTS = {"height": 0.5, "area": 0.3, "slope": 0.2}
+
+
+@pytest.fixture(autouse=True)
+def scoring_settings():
+    with patch('app.services.clip_scoring.settings') as mock_settings:
+        mock_settings.CLIP_SCORE_WEIGHTS = WEIGHTS
+        mock_settings.CLIP_TOP_K = 3
+        yield mock_settings
+
+
+class TestClipScoring:
+
+    def test_higher_and_rising_peak_scores_better(self):
+        data = [(i * 5, 40.0) for i in range(60)]
+        for i in range(10, 16): # Pico baixo e decaindo
+            data[i] = (i * 5, 48.0 - (i - 10))
+        for i in range(40, 46): # Pico alto e subindo
+            data[i] = (i * 5, 70.0 + (i - 40) * 2)
+        scores = score_clip_candidates(data, [(50, 80), (200, 230)])
+        assert scores[1] > scores[0]
+        assert all(0 <= score <= 100 for score in scores)
+
+    def test_scores_match_per_candidate_computation(self):
+        random.seed(5)
+        data = get_mock_audience_retention(video_duration_seconds=3600)
+        peaks = [(start, start + random.choice([15, 30, 60])) for start in range(100, 3400, 250)]
+        batch = score_clip_candidates(data, peaks)
+        single = [score_clip_candidates(data, [peak])[0] for peak in peaks]
+        np.testing.assert_allclose(batch, single)
+
+    def test_top_k_keeps_best_in_order(self):
+        candidates = [(0, 20), (30, 50), (60, 80), (90, 110)]
+        assert top_k_clips(candidates, [10.0, 90.0, 50.0, 70.0], 2) == [(30, 50, 90.0), (90, 110, 70.0)]
+
+    def test_rank_filters_durations_and_limits_to_top_k(self):
+        random.seed(9)
+        data = get_mock_audience_retention(video_duration_seconds=1800)
+        peaks = [(0, 5), (100, 400)] + [(start, start + 30) for start in range(500, 1500, 100)]
+        ranked = rank_clip_candidates(data, peaks)
+        assert len(ranked) == 3
+        assert all(10 <= end - start <= 180 for start, end, _ in ranked)
+        assert [score for _, _, score in ranked] == sorted((score for _, _, score in ranked), reverse=True)
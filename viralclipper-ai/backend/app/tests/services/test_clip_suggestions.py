@@ -0,0 +1,98 @@
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.db.database import Base
+from app.db.models import User, Project, SuggestedClip
+from app.services.clip_suggestions import IntervalIndex, interval_overlap, sync_suggested_clips
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    session = sessionmaker(autoflush=False, bind=engine)()
+    user = User(email="a@b.c", hashed_password="x")
+    session.add(user)
+    session.commit()
+    session.add(Project(id=1, youtube_url="u", owner_id=user.id))
+    session.commit()
+    yield session
+    session.close()
+
+
+def add_clip(db, start, end, status="pending", score=0.5, processing_status=None):
+    clip = SuggestedClip(project_id=1, timestamp_inicio_segundos=start, timestamp_fim_segundos=end,
+                         status_aprovacao=status, score_viralidade_inicial=score, processing_status=processing_status)
+    db.add(clip)
+    db.commit()
+    return clip.id
+
+
+def clip_rows(db):
+    return sorted((c.timestamp_inicio_segundos, c.timestamp_fim_segundos, c.status_aprovacao)
+                  for c in db.query(SuggestedClip).filter(SuggestedClip.project_id == 1))
+
+
+class TestIntervalIndex:
+
+    def test_overlap(self):
+        assert interval_overlap(0, 30, 0, 30) == 1.0
+        assert interval_overlap(0, 30, 15, 45) == pytest.approx(15 / 45)
+        assert interval_overlap(0, 30, 30, 60) == 0.0
+
+    def test_best_match_finds_long_interval_starting_far_before(self):
+        index = IntervalIndex()
+        index.add(0, 170, "long")
+        index.add(150, 180, "short")
+        index.add(400, 430, "far")
+        assert index.best_match(10, 160)[2] == "long"
+        assert index.best_match(152, 181)[2] == "short"
+        assert index.best_match(300, 330) is None
+
+
+class TestSyncSuggestedClips:
+
+    def test_reanalysis_keeps_decisions_and_does_not_duplicate(self, db):
+        add_clip(db, 10, 40, status="approved")
+        add_clip(db, 60, 90, status="rejected")
+        kept = add_clip(db, 100, 130, score=0.4)
+        add_clip(db, 200, 230) # Não reaparece na nova análise
+        candidates = [(11, 41, 0.9), (61, 90, 0.8), (101, 131, 0.7), (300, 330, 0.6)]
+
+        result = sync_suggested_clips(db, 1, candidates)
+        db.commit()
+
+        assert (result.inserted, result.updated, result.deleted, result.total) == (1, 1, 1, 4)
+        assert clip_rows(db) == [(10, 40, "approved"), (60, 90, "rejected"), (100, 130, "pending"), (300, 330, "pending")]
+        assert db.get(SuggestedClip, kept).score_viralidade_inicial == 0.7
+
+        again = sync_suggested_clips(db, 1, candidates)
+        db.commit()
+        assert (again.inserted, again.updated, again.deleted) == (0, 0, 0)
+
+    def test_overlapping_candidates_keep_the_best(self, db):
+        result = sync_suggested_clips(db, 1, [(100, 130, 0.2), (102, 132, 0.9), (5, 8, 1.0)])
+        db.commit()
+        assert result.inserted == 1 # O de 3s é curto demais
+        assert db.query(SuggestedClip.timestamp_inicio_segundos, SuggestedClip.score_viralidade_inicial).one() == (102, 0.9)
+
+    def test_pending_clips_queued_for_render_or_additive_sync_are_kept(self, db):
+        add_clip(db, 100, 130, processing_status="processing_queued")
+        add_clip(db, 200, 230)
+
+        assert sync_suggested_clips(db, 1, [(300, 330, 0.5)], replace_pending=False).deleted == 0
+        assert sync_suggested_clips(db, 1, [(300, 330, 0.5), (400, 430, 0.5)]).deleted == 1
+        db.commit()
+        assert [start for start, _, _ in clip_rows(db)] == [100, 300, 400]
+
+    def test_single_insert_statement(self, db):
+        add_clip(db, 0, 30)
+        statements = []
+        event.listen(db.get_bind(), "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: statements.append(statement.split()[0]))
+
+        sync_suggested_clips(db, 1, [(100 * i, 100 * i + 30, 0.5) for i in range(1, 51)])
+
+        assert statements == ["SELECT", "DELETE", "INSERT"]
+        assert db.query(SuggestedClip).count() == 50
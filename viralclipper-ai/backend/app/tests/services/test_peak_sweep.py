@@ -0,0 +1,39 @@
+import random
+import pytest
+from unittest.mock import patch
+from app.services.peak_sweep import sweep_peak_parameters, main
+from app.services.youtube_analyzer import get_mock_audience_retention, detect_retention_peaks_batch
+
+
+@pytest.fixture
+def series():
+    random.seed(11)
+    return [get_mock_audience_retention(video_duration_seconds=random.randint(120, 1800)) for _ in range(15)]
+
+
+class TestPeakSweep:
+
+    def test_each_combination_matches_batch_detection(self, series):
+        windows, factors, merge_distances = [4, 12], [0.98, 1.1, 1.15], [5, 15, 30]
+        results = sweep_peak_parameters(series, windows, factors, merge_distances)
+
+        assert len(results) == len(windows) * len(factors) * len(merge_distances)
+        for result in results:
+            peaks = detect_retention_peaks_batch(
+                series, result["moving_average_window"], result["peak_threshold_factor"], result["merge_distance_seconds"]
+            )
+            durations = [end - start for per_series in peaks for start, end in per_series]
+            assert result["peaks"] == len(durations)
+            assert result["clips"] == sum(10 <= d <= 180 for d in durations)
+            assert result["too_short"] == sum(d < 10 for d in durations)
+
+    def test_empty_input(self):
+        assert sweep_peak_parameters([], [12], [1.15], [15]) == []
+
+    @patch('app.services.peak_sweep.load_stored_retention_series')
+    def test_cli_writes_json(self, mock_load, series, tmp_path, capsys):
+        mock_load.return_value = series
+        output = tmp_path / "sweep.json"
+        main(["--windows", "12", "--factors", "1.1,1.15", "--merge-distances", "15", "--output", str(output)])
+        assert output.exists()
+        assert "clips_per_series" in capsys.readouterr().out
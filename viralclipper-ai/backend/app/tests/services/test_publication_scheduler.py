@@ -0,0 +1,95 @@
+import pytest
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import sessionmaker
+from app.db.database import Base
+from app.db.models import User, Project, SuggestedClip, ScheduledPublication
+from app.services.publication_scheduler import (
+    due_publications_query, claim_due_publications, requeue_stale_publications, bucket_by_eta, to_utc_naive
+)
+
+NOW = datetime(2024, 5, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    user = User(email="a@b.c", hashed_password="x")
+    session.add(user)
+    session.commit()
+    project = Project(youtube_url="u", owner_id=user.id)
+    session.add(project)
+    session.commit()
+    clip = SuggestedClip(project_id=project.id, timestamp_inicio_segundos=0, timestamp_fim_segundos=30)
+    session.add(clip)
+    session.commit()
+    for offset, status in [(-120, "pending"), (-5, "pending"), (30, "pending"), (600, "pending"), (-60, "published")]:
+        session.add(ScheduledPublication(suggested_clip_id=clip.id, plataforma_destino="youtube_shorts",
+                                         data_agendamento=NOW + timedelta(seconds=offset), status_publicacao=status))
+    session.commit()
+    yield session
+    session.close()
+
+
+class TestPublicationScheduler:
+
+    def test_claim_uses_skip_locked_on_postgres(self, db):
+        sql = str(due_publications_query(db, NOW, 10).statement.compile(dialect=postgresql.dialect()))
+        assert "FOR UPDATE SKIP LOCKED" in sql
+        assert "ORDER BY scheduled_publications.data_agendamento" in sql
+
+    def test_status_date_index_exists(self):
+        indexes = {index.name: [column.name for column in index.columns] for index in ScheduledPublication.__table__.indexes}
+        assert indexes["ix_scheduled_publications_status_agendamento"] == ["status_publicacao", "data_agendamento"]
+
+    def test_claims_due_pending_rows_in_batches_once(self, db):
+        until = NOW + timedelta(seconds=60)
+        first = claim_due_publications(db, until, batch_size=2)
+        second = claim_due_publications(db, until, batch_size=2)
+        third = claim_due_publications(db, until, batch_size=2)
+
+        assert [scheduled_at for _, scheduled_at in first] == [NOW - timedelta(seconds=120), NOW - timedelta(seconds=5)]
+        assert [scheduled_at for _, scheduled_at in second] == [NOW + timedelta(seconds=30)]
+        assert third == []
+        statuses = sorted(status for (status,) in db.query(ScheduledPublication.status_publicacao))
+        assert statuses == ["pending", "published", "queued", "queued", "queued"]
+
+    def test_requeues_only_queued_rows_stale_past_their_eta(self, db):
+        claimed_at = NOW - timedelta(hours=1)
+        rows = db.query(ScheduledPublication).filter(ScheduledPublication.status_publicacao == "pending").order_by(ScheduledPublication.data_agendamento).all()
+        for row in rows[:2]:
+            row.status_publicacao = "queued"
+            row.updated_at = claimed_at
+        db.commit()
+
+        requeued = requeue_stale_publications(db, NOW, stale_after_seconds=60)
+
+        # Só a de -120s passou do ETA + margem; -60s publicada e -5s ainda dentro da margem
+        assert requeued == 1
+        statuses = [row.status_publicacao for row in db.query(ScheduledPublication).order_by(ScheduledPublication.data_agendamento)]
+        assert statuses == ["pending", "published", "queued", "pending", "pending"]
+
+    def test_recently_claimed_rows_are_not_requeued(self, db):
+        row = db.query(ScheduledPublication).order_by(ScheduledPublication.data_agendamento).first()
+        row.status_publicacao = "queued"
+        row.updated_at = NOW
+        db.commit()
+
+        assert requeue_stale_publications(db, NOW, stale_after_seconds=60) == 0
+
+    def test_buckets_never_publish_early(self):
+        claimed = [(1, NOW + timedelta(seconds=1)), (2, NOW + timedelta(seconds=8)), (3, NOW + timedelta(seconds=12)),
+                   (4, NOW + timedelta(seconds=2)), (5, NOW + timedelta(seconds=3))]
+        buckets = bucket_by_eta(claimed, bucket_seconds=10, max_batch=2)
+        assert buckets == {
+            NOW + timedelta(seconds=8): [[1, 2], [4, 5]],
+            NOW + timedelta(seconds=12): [[3]],
+        }
+
+    def test_to_utc_naive(self):
+        aware = datetime(2024, 5, 1, 9, 0, tzinfo=timezone(timedelta(hours=-3)))
+        assert to_utc_naive(aware) == datetime(2024, 5, 1, 12, 0)
+        assert to_utc_naive(NOW) == NOW
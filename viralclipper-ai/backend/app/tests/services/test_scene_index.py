@@ -0,0 +1,88 @@
+import re
+import pytest
+from unittest.mock import patch, MagicMock
+from pathlib import Path
+from app.services.scene_index import (
+    parse_scene_metadata, nearest_cut, snap_clip_bounds, detect_scene_cuts, build_scene_index
+)
+from app.workers.render_pool import RenderScheduler
+
+METADATA = """frame:0    pts:62062   pts_time:4.1375
+lavfi.scene_score=0.512
+frame:1    pts:190190  pts_time:12.6793
+lavfi.scene_score=0.431
+"""
+
+
+def fake_ffmpeg(metadata_by_source):
+    """run_command que escreve o arquivo de metadata=print como o ffmpeg faria."""
+    def run(command):
+        source = command[command.index('-i') + 1]
+        metadata_file = re.search(r"file='([^']+)'", command[command.index('-vf') + 1]).group(1)
+        Path(metadata_file).write_text(metadata_by_source[source])
+    return run
+
+
+@pytest.fixture
+def scene_settings(tmp_path):
+    with patch('app.services.scene_index.settings') as mock_settings:
+        mock_settings.MEDIA_ROOT_PATH = str(tmp_path)
+        mock_settings.SCENE_DETECTION_THRESHOLD = 0.3
+        mock_settings.SCENE_DETECTION_SCALE_WIDTH = 320
+        mock_settings.SCENE_SNAP_MAX_SHIFT_SECONDS = 3.0
+        yield mock_settings
+
+
+class TestSceneIndex:
+
+    def test_parse_scene_metadata(self):
+        assert parse_scene_metadata(METADATA) == [4.138, 12.679]
+
+    def test_nearest_cut_binary_search(self):
+        cuts = [4.1, 12.7, 30.0, 61.5]
+        assert nearest_cut(cuts, 13, 3) == 12.7
+        assert nearest_cut(cuts, 60, 3) == 61.5
+        assert nearest_cut(cuts, 45, 3) is None
+        assert nearest_cut([], 10, 3) is None
+
+    def test_snap_rounds_inward(self, scene_settings):
+        # Início arredonda para cima e fim para baixo: nenhum fragmento do plano vizinho
+        assert snap_clip_bounds(10, 60, [7.0, 12.4, 61.5]) == (13, 61)
+        assert snap_clip_bounds(10, 60, [40.0]) == (10, 60)
+        assert snap_clip_bounds(10, 60, None) == (10, 60)
+
+    def test_snap_keeps_bounds_when_too_short(self, scene_settings):
+        assert snap_clip_bounds(10, 15, [12.5, 13.0], min_duration=10) == (10, 15)
+
+    def test_detect_scene_cuts_uses_downscaled_video_only_stream(self, scene_settings, tmp_path):
+        commands = []
+        run = fake_ffmpeg({"/media/source.mp4": METADATA})
+        cuts = detect_scene_cuts(Path("/media/source.mp4"), tmp_path, run_command=lambda c: (commands.append(c), run(c)))
+        assert cuts == [4.138, 12.679]
+        assert '-an' in commands[0]
+        assert "scale=320:-2,select='gt(scene,0.3)'" in commands[0][commands[0].index('-vf') + 1]
+
+    def test_command_survives_render_scheduler_thread_budget(self, scene_settings, tmp_path):
+        commands = []
+        run = fake_ffmpeg({"/media/source.mp4": METADATA})
+        scheduler = RenderScheduler(cpus=2, max_jobs=1, runner=lambda c: (commands.append(c), run(c)))
+
+        assert detect_scene_cuts(Path("/media/source.mp4"), tmp_path, run_command=scheduler.run) == [4.138, 12.679]
+        command = commands[0]
+        assert command[command.index('-dn') + 1] == '-vf'
+        assert command[command.index('-vf') + 1].startswith("scale=320:-2,select=")
+        assert command[-5:] == ['-f', 'null', '-threads', '2', '-']
+
+    def test_build_scene_index_shifts_segment_cuts(self, scene_settings):
+        project = MagicMock(id=1, original_video_path=None, source_segments_json=[
+            {"start": 100, "end": 160, "path": "/media/seg_100.mp4"},
+            {"start": 400, "end": 460, "path": "/media/seg_400.mp4"},
+        ])
+        db = MagicMock()
+        run = fake_ffmpeg({
+            "/media/seg_100.mp4": "frame:0 pts:1 pts_time:5.5\n",
+            "/media/seg_400.mp4": "frame:0 pts:1 pts_time:20.25\n",
+        })
+        assert build_scene_index(project, db, run_command=run) == [105.5, 420.25]
+        assert project.scene_cuts_json == [105.5, 420.25]
+        db.commit.assert_called_once()
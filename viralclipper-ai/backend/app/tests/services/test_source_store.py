@@ -0,0 +1,114 @@
+import json
+import threading
+import time
+import pytest
+from unittest.mock import patch, MagicMock
+from pathlib import Path
+from app.services import source_store
+from app.services.youtube_urls import extract_video_id
+from app.db.models import Project
+from sqlalchemy.orm import Session
+
+
+@pytest.fixture
+def media_root(tmp_path):
+    with patch('app.services.source_store.settings') as mock_settings:
+        mock_settings.MEDIA_ROOT_PATH = str(tmp_path)
+        mock_settings.SOURCE_STORE_GC_GRACE_SECONDS = 0
+        yield tmp_path
+
+
+def fake_downloader(calls):
+    def download(target_dir):
+        calls.append(target_dir)
+        time.sleep(0.05) # Mantém o lock tempo suficiente para os concorrentes esperarem
+        path = target_dir / "original_video.mp4"
+        path.write_bytes(b"video")
+        return str(path), 120
+    return download
+
+
+class TestVideoIds:
+
+    @pytest.mark.parametrize("url", [
+        "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+        "https://youtube.com/watch?v=dQw4w9WgXcQ&t=42s",
+        "https://youtu.be/dQw4w9WgXcQ?si=abc",
+        "https://m.youtube.com/shorts/dQw4w9WgXcQ",
+        "https://www.youtube.com/embed/dQw4w9WgXcQ",
+    ])
+    def test_extract_video_id_normalizes_urls(self, url):
+        assert extract_video_id(url) == "dQw4w9WgXcQ"
+
+    def test_extract_video_id_rejects_other_hosts(self):
+        assert extract_video_id("https://vimeo.com/123456") is None
+
+
+class TestSourceStore:
+
+    def test_concurrent_requests_share_one_download(self, media_root):
+        calls, results = [], []
+        downloader = fake_downloader(calls)
+        threads = [
+            threading.Thread(target=lambda: results.append(source_store.acquire_source("dQw4w9WgXcQ", "fmt", downloader)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(calls) == 1
+        assert len(set(results)) == 1
+        assert results[0][1] == 120
+
+    def test_different_formats_are_separate_entries(self, media_root):
+        calls = []
+        path_a, _ = source_store.acquire_source("dQw4w9WgXcQ", "fmt-a", fake_downloader(calls))
+        path_b, _ = source_store.acquire_source("dQw4w9WgXcQ", "fmt-b", fake_downloader(calls))
+        assert path_a != path_b
+        assert len(calls) == 2
+
+    def test_release_deletes_only_when_unreferenced(self, media_root):
+        path, _ = source_store.acquire_source("dQw4w9WgXcQ", "fmt", fake_downloader([]))
+        db = MagicMock(spec=Session)
+        project = Project(id=1, original_video_path=path)
+
+        db.query.return_value.filter.return_value.count.return_value = 1 # Outro projeto ainda usa
+        assert source_store.release_source(db, project) is False
+        assert Path(path).exists()
+        assert project.original_video_path is None
+
+        project.original_video_path = path
+        db.query.return_value.filter.return_value.count.return_value = 0
+        assert source_store.release_source(db, project) is True
+        assert not Path(path).exists()
+
+    def test_release_keeps_source_just_acquired_by_another_project(self, media_root):
+        path, _ = source_store.acquire_source("dQw4w9WgXcQ", "fmt", fake_downloader([]))
+        db = MagicMock(spec=Session)
+        db.query.return_value.filter.return_value.count.return_value = 0
+        source_store.settings.SOURCE_STORE_GC_GRACE_SECONDS = 3600 # settings é o mock da fixture media_root
+        # Download antigo, mas outro projeto acabou de reaproveitá-lo (ainda sem commit da referência)
+        entry_path = Path(path).parent / source_store.ENTRY_FILENAME
+        entry = json.loads(entry_path.read_text())
+        entry["created_at"] -= 7200
+        entry_path.write_text(json.dumps(entry))
+        assert source_store.acquire_source("dQw4w9WgXcQ", "fmt", fake_downloader([]))[0] == path
+
+        assert source_store.release_source(db, Project(id=1, original_video_path=path)) is False
+        assert Path(path).exists()
+        assert source_store.collect_unreferenced_sources(db) == []
+        assert source_store.collect_unreferenced_sources(db, grace_seconds=0) == [path] # Depois da carência o GC recolhe
+
+    def test_gc_collects_zero_refcount_entries(self, media_root):
+        kept, _ = source_store.acquire_source("aaaaaaaaaaa", "fmt", fake_downloader([]))
+        orphan, _ = source_store.acquire_source("bbbbbbbbbbb", "fmt", fake_downloader([]))
+        db = MagicMock(spec=Session)
+        refcounts = {kept: 2, orphan: 0}
+        db.query.return_value.filter.side_effect = lambda criterion: MagicMock(count=lambda: refcounts[criterion.right.value])
+
+        deleted = source_store.collect_unreferenced_sources(db)
+
+        assert deleted == [orphan]
+        assert Path(kept).exists()
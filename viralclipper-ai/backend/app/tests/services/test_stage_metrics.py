@@ -0,0 +1,82 @@
+import time
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.db.database import Base
+from app.db.models import StageEvent
+from app.services.stage_metrics import (
+    StageSpan, record_stage_event, task_enqueued_at, stamp_enqueue_time, metrics_registry
+)
+
+
+@pytest.fixture
+def session_factory():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine)
+
+
+def fake_task(task_id="task-1", enqueued_at=None, eta=None):
+    task = MagicMock()
+    task.request = MagicMock(spec=["id", "enqueued_at", "headers", "eta"], id=task_id, enqueued_at=enqueued_at,
+                             headers=None, eta=eta)
+    return task
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+class TestStageMetrics:
+
+    def test_record_stage_event_persists_and_observes(self, session_factory):
+        db = session_factory()
+        before = sample("viralclipper_stage_duration_seconds_count", stage="download", status="ok")
+        started = datetime(2024, 5, 1, 12, 0, 0)
+        record_stage_event(db, "download", started, started + timedelta(seconds=42), project_id=7,
+                           enqueued_at=started - timedelta(seconds=3), bytes_transferred=10_000_000)
+
+        event = db.query(StageEvent).one()
+        assert (event.project_id, event.stage, event.status, event.bytes_transferred) == (7, "download", "ok", 10_000_000)
+        assert sample("viralclipper_stage_duration_seconds_count", stage="download", status="ok") == before + 1
+        assert sample("viralclipper_stage_queue_wait_seconds_bucket", stage="download", le="5.0") >= 1
+        db.close()
+
+    def test_span_records_queue_wait_and_render_speed(self, session_factory):
+        span = StageSpan("render", fake_task(enqueued_at=time.time() - 2), project_id=1, clip_id=2)
+        span.media_seconds = 30
+        assert span.finish(session_factory) is not None
+
+        event = session_factory().query(StageEvent).one()
+
+        assert event.task_id == "task-1"
+        assert 1.5 < (event.started_at - event.enqueued_at).total_seconds() < 3
+        assert event.render_speed_ratio > 30 # Render "instantâneo" no teste
+
+    def test_failed_span_and_broken_session_never_raise(self, session_factory):
+        span = StageSpan("analysis", None, project_id=1)
+        span.fail()
+        span.finish(session_factory)
+        assert session_factory().query(StageEvent.status).scalar() == "failed"
+
+        broken = MagicMock()
+        broken.return_value.commit.side_effect = Exception("db down")
+        assert StageSpan("analysis").finish(broken) is None
+
+    def test_enqueue_time_uses_eta_when_later(self):
+        headers = {}
+        stamp_enqueue_time(headers)
+        enqueued = datetime.utcfromtimestamp(headers["enqueued_at"])
+        eta = (enqueued + timedelta(minutes=5)).isoformat()
+        assert task_enqueued_at(fake_task(enqueued_at=headers["enqueued_at"])) == enqueued
+        assert task_enqueued_at(fake_task(enqueued_at=headers["enqueued_at"], eta=eta)) == enqueued + timedelta(minutes=5)
+        assert task_enqueued_at(None) is None
+
+    def test_multiprocess_registry(self, tmp_path, monkeypatch):
+        assert metrics_registry() is REGISTRY
+        monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+        assert metrics_registry() is not REGISTRY
@@ -0,0 +1,66 @@
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.db.database import Base
+from app.db.models import TaskLease
+from app.services.task_leases import (
+    acquire_lease, complete_lease, fail_lease, lease_in_flight, render_lease_key, render_params_hash, LEASE_RUNNING, LEASE_DONE
+)
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+class TestTaskLeases:
+
+    def test_render_key_is_per_clip_and_params_hash_depends_on_parameters(self):
+        assert render_lease_key(1) == "render:clip:1"
+        assert render_params_hash(10, 40, "vertical") == render_params_hash(10, 40, "vertical")
+        assert render_params_hash(10, 40, "vertical") != render_params_hash(10, 41, "vertical")
+        assert render_params_hash(10, 40, "vertical") != render_params_hash(10, 40, "straight_cut")
+
+    def test_lease_carries_params_of_running_job(self, db):
+        key = render_lease_key(1)
+        assert acquire_lease(db, key, "task-a", reuse_done=False, params_hash="old").acquired
+        other = acquire_lease(db, key, "task-b", reuse_done=False, params_hash="new")
+        assert not other.acquired # Mesmo arquivo de saída: nunca dois renders ao mesmo tempo
+        assert other.params_hash == "old"
+        assert lease_in_flight(db, key, "old")
+        assert not lease_in_flight(db, key, "new")
+        assert lease_in_flight(db, key)
+
+    def test_duplicate_collapses_into_in_flight_job(self, db):
+        assert acquire_lease(db, "k", "task-a", ttl_seconds=60).acquired
+        duplicate = acquire_lease(db, "k", "task-b", ttl_seconds=60)
+        assert not duplicate.acquired
+        assert (duplicate.owner, duplicate.status) == ("task-a", LEASE_RUNNING)
+        assert lease_in_flight(db, "k")
+
+    def test_redelivery_of_same_task_takes_over(self, db):
+        acquire_lease(db, "k", "task-a", ttl_seconds=60)
+        assert acquire_lease(db, "k", "task-a", ttl_seconds=60).acquired
+
+    def test_result_is_shared_until_it_expires(self, db, monkeypatch):
+        acquire_lease(db, "k", "task-a")
+        complete_lease(db, "k", "task-a", {"video_id": "abc"})
+        duplicate = acquire_lease(db, "k", "task-b")
+        assert (duplicate.acquired, duplicate.status, duplicate.result) == (False, LEASE_DONE, {"video_id": "abc"})
+        assert acquire_lease(db, "k", "task-c", reuse_done=False).acquired # Render: só duplicatas em andamento colapsam
+
+    def test_failed_or_expired_lease_can_be_taken(self, db):
+        acquire_lease(db, "failed", "task-a")
+        fail_lease(db, "failed", "task-a")
+        assert acquire_lease(db, "failed", "task-b").acquired
+
+        acquire_lease(db, "expired", "task-a")
+        db.get(TaskLease, "expired").expires_at = datetime.utcnow() - timedelta(seconds=1)
+        db.commit()
+        assert not lease_in_flight(db, "expired")
+        assert acquire_lease(db, "expired", "task-b").acquired
@@ -0,0 +1,179 @@
+import asyncio
+import re
+from datetime import datetime, timedelta
+import pytest
+import httpx
+from unittest.mock import patch, MagicMock
+from app.services.upload_engine import AsyncUploadEngine, UploadJob, CHUNK_ALIGNMENT
+from app.services.youtube_publisher import YouTubePublishingService
+
+CHUNK = CHUNK_ALIGNMENT
+
+
+class FakeResumableApi:
+    """Handler de httpx.MockTransport com o protocolo resumable do YouTube."""
+
+    def __init__(self, fail_chunks=(), latency=0.0):
+        self.received = {}
+        self.fail_chunks = set(fail_chunks) # Offsets cujo primeiro PUT responde 503
+        self.latency = latency
+        self.in_flight = {}
+        self.max_in_flight = {}
+        self.chunk_sizes = []
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        account = request.headers["authorization"]
+        self.in_flight[account] = self.in_flight.get(account, 0) + 1
+        self.max_in_flight[account] = max(self.max_in_flight.get(account, 0), self.in_flight[account])
+        try:
+            await asyncio.sleep(self.latency)
+            return self._handle(request)
+        finally:
+            self.in_flight[account] -= 1
+
+    def _handle(self, request):
+        if request.method == "POST":
+            session = len(self.received) + 1
+            self.received[session] = 0
+            return httpx.Response(200, headers={"Location": f"https://upload.test/session/{session}"})
+        session = int(request.url.path.rsplit("/", 1)[1])
+        start, total = re.match(r"bytes (\*|\d+)-?\d*/(\d+)", request.headers["content-range"]).groups()
+        if start != "*":
+            if int(start) in self.fail_chunks:
+                self.fail_chunks.discard(int(start))
+                return httpx.Response(503)
+            self.chunk_sizes.append(len(request.content))
+            self.received[session] += len(request.content)
+        if self.received[session] >= int(total):
+            return httpx.Response(200, json={"id": f"video_{session}"})
+        return httpx.Response(308, headers={"Range": f"bytes=0-{self.received[session] - 1}"})
+
+
+def make_job(tmp_path, publication_id=1, account_id=1, size=CHUNK * 2 + 100):
+    path = tmp_path / f"clip_{publication_id}.mp4"
+    path.write_bytes(b"x" * size)
+    return UploadJob(publication_id=publication_id, account_id=account_id, access_token=f"token_{account_id}",
+                     file_path=path, metadata={"snippet": {"title": "t"}, "status": {"privacyStatus": "private"}})
+
+
+def engine_for(api, **kwargs):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(api))
+    return AsyncUploadEngine("https://upload.test/videos", chunk_size=CHUNK, backoff_seconds=0, client=client, **kwargs)
+
+
+class TestAsyncUploadEngine:
+
+    def test_uploads_in_bounded_chunks(self, tmp_path):
+        api = FakeResumableApi()
+        result = asyncio.run(engine_for(api).upload(make_job(tmp_path)))
+        assert result.ok and result.video_id == "video_1"
+        assert result.bytes_sent == CHUNK * 2 + 100
+        assert api.chunk_sizes == [CHUNK, CHUNK, 100]
+
+    def test_resumes_after_server_error(self, tmp_path):
+        api = FakeResumableApi(fail_chunks=[CHUNK])
+        result = asyncio.run(engine_for(api).upload(make_job(tmp_path)))
+        assert result.ok
+        assert result.retries == 1
+        assert api.chunk_sizes == [CHUNK, CHUNK, 100] # O primeiro chunk não é reenviado
+
+    def test_gives_up_after_max_retries(self, tmp_path):
+        api = FakeResumableApi(fail_chunks=[0])
+        result = asyncio.run(engine_for(api, max_retries=0).upload(make_job(tmp_path)))
+        assert not result.ok
+        assert "Giving up" in result.error
+
+    def test_per_account_concurrency_limit(self, tmp_path):
+        api = FakeResumableApi(latency=0.01)
+        jobs = [make_job(tmp_path, publication_id=i, account_id=i % 2, size=CHUNK) for i in range(8)]
+        results = asyncio.run(engine_for(api, per_account_limit=2, max_concurrent=8).upload_many(jobs))
+        assert [r.publication_id for r in results] == list(range(8))
+        assert all(r.ok for r in results)
+        assert max(api.max_in_flight.values()) == 2
+
+    def test_chunk_size_must_be_aligned(self):
+        with pytest.raises(ValueError):
+            AsyncUploadEngine("https://upload.test/videos", chunk_size=CHUNK + 1)
+
+
+class TestPublishingService:
+
+    @patch('app.services.youtube_publisher.settings')
+    def test_publish_many_records_each_outcome(self, mock_settings, tmp_path):
+        mock_settings.PUBLISH_SIMULATE = False
+        mock_settings.GOOGLE_TOKEN_REFRESH_MARGIN_SECONDS = 900
+        db = MagicMock()
+        publications = {}
+        for publication_id in (1, 2):
+            publication = MagicMock(id=publication_id, status_publicacao="queued")
+            publication.suggested_clip.processed_clip_path = str(make_job(tmp_path, publication_id).file_path)
+            publication.suggested_clip.project.owner.id = publication_id
+            publication.suggested_clip.project.owner.google_auth_token = "token"
+            publication.suggested_clip.project.owner.google_token_expires_at = datetime.utcnow() + timedelta(hours=1)
+            publication.suggested_clip.titulo_personalizado = f"Clip {publication_id}"
+            publication.suggested_clip.descricao_personalizada = "desc"
+            publication.suggested_clip.hashtags_personalizadas = ["#short"]
+            publications[publication_id] = publication
+        publications[2].suggested_clip.processed_clip_path = None
+        db.query.return_value.filter.return_value.first.side_effect = [publications[1], publications[2], publications[1]]
+
+        service = YouTubePublishingService(db, engine=engine_for(FakeResumableApi()))
+        outcome = service.publish_many([1, 2])
+
+        assert outcome == {1: True, 2: False}
+        assert publications[1].status_publicacao == "published"
+        assert publications[1].id_publicacao_plataforma == "video_1"
+        assert publications[2].status_publicacao == "failed"
+
+    def _expired_publication(self, tmp_path):
+        publication = MagicMock(id=1, status_publicacao="queued")
+        publication.suggested_clip.processed_clip_path = str(make_job(tmp_path, 1).file_path)
+        user = publication.suggested_clip.project.owner
+        user.id = 7
+        user.google_auth_token = "expired-token"
+        user.google_refresh_token = "refresh-token"
+        user.google_token_expires_at = datetime.utcnow() - timedelta(minutes=1)
+        publication.suggested_clip.titulo_personalizado = "Clip"
+        publication.suggested_clip.descricao_personalizada = "desc"
+        publication.suggested_clip.hashtags_personalizadas = ["#short"]
+        db = MagicMock()
+        db.query.return_value.filter.return_value.first.return_value = publication
+        return db, publication, user
+
+    def _settings(self, mock_settings):
+        mock_settings.PUBLISH_SIMULATE = False
+        mock_settings.GOOGLE_TOKEN_REFRESH_MARGIN_SECONDS = 900
+        mock_settings.GOOGLE_TOKEN_URL = "https://oauth.test/token"
+
+    @patch('app.services.youtube_publisher.settings')
+    def test_expired_token_is_refreshed_before_upload(self, mock_settings, tmp_path):
+        self._settings(mock_settings)
+        db, publication, user = self._expired_publication(tmp_path)
+        token_requests = []
+
+        def token_endpoint(request):
+            token_requests.append(request.content.decode())
+            return httpx.Response(200, json={"access_token": "fresh-token", "expires_in": 3599})
+
+        api = FakeResumableApi()
+        service = YouTubePublishingService(db, engine=engine_for(api), oauth_client=httpx.Client(transport=httpx.MockTransport(token_endpoint)))
+        assert service.publish_many([1]) == {1: True}
+
+        assert "grant_type=refresh_token" in token_requests[0] and "refresh_token=refresh-token" in token_requests[0]
+        assert user.google_auth_token == "fresh-token"
+        assert user.google_token_expires_at > datetime.utcnow() + timedelta(minutes=59)
+        assert list(api.max_in_flight) == ["Bearer fresh-token"] # O upload nunca usou o token expirado
+
+    @patch('app.services.youtube_publisher.settings')
+    def test_failed_refresh_fails_publication_without_uploading(self, mock_settings, tmp_path):
+        self._settings(mock_settings)
+        db, publication, user = self._expired_publication(tmp_path)
+        oauth_client = httpx.Client(transport=httpx.MockTransport(lambda request: httpx.Response(400, json={"error": "invalid_grant"})))
+
+        api = FakeResumableApi()
+        service = YouTubePublishingService(db, engine=engine_for(api), oauth_client=oauth_client)
+        assert service.publish_many([1]) == {1: False}
+
+        assert publication.status_publicacao == "failed"
+        assert "token expired" in publication.publication_error and "invalid_grant" in publication.publication_error
+        assert api.received == {}
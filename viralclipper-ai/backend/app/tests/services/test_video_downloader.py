@@ -0,0 +1,102 @@
+import pytest
+from unittest.mock import patch, MagicMock
+from pathlib import Path
+from app.services.video_downloader import pad_and_merge_ranges, ensure_clip_segments, select_format, resolve_video_format, VIDEO_FORMAT
+from app.db.models import SuggestedClip, Project
+from sqlalchemy.orm import Session
+
+
+class TestSegmentRanges:
+
+    def test_pad_and_merge_ranges_merges_overlaps(self):
+        ranges = [(100, 130), (140, 160), (400, 420)]
+        assert pad_and_merge_ranges(ranges, padding=10) == [(90, 170), (390, 430)]
+
+    def test_pad_and_merge_ranges_clamps_to_video(self):
+        assert pad_and_merge_ranges([(2, 20), (590, 598)], padding=5, duration=600) == [(0, 25), (585, 600)]
+
+    @patch('app.services.video_downloader.download_video_segments')
+    def test_ensure_clip_segments_skips_covered_clips(self, mock_download):
+        project = Project(id=1, youtube_url="https://youtu.be/abc", source_segments_json=[{"start": 90, "end": 170, "path": "/x.mp4"}])
+        clip = SuggestedClip(timestamp_inicio_segundos=100, timestamp_fim_segundos=130)
+
+        ensure_clip_segments(project, [clip], MagicMock(spec=Session))
+
+        mock_download.assert_not_called()
+
+    @patch('app.services.video_downloader.settings')
+    @patch('app.services.video_downloader.download_video_segments')
+    def test_ensure_clip_segments_downloads_edited_clip(self, mock_download, mock_settings):
+        mock_settings.SEGMENT_PADDING_SECONDS = 5
+        project = Project(id=1, youtube_url="https://youtu.be/abc", duracao_video_original_segundos=600,
+                          source_segments_json=[{"start": 90, "end": 170, "path": "/x.mp4"}])
+        clip = SuggestedClip(timestamp_inicio_segundos=150, timestamp_fim_segundos=200) # Estendido além do segmento
+
+        ensure_clip_segments(project, [clip], MagicMock(spec=Session))
+
+        args, _ = mock_download.call_args
+        assert args[2] == [(145, 205)]
+
+
+PROFILE_720 = {"output_width": 720, "output_height": 1280, "video_codecs": ["avc1", "h264"], "video_ext": "mp4", "audio_ext": "m4a", "min_audio_bitrate": 96}
+
+YOUTUBE_FORMATS = [
+    {"format_id": "140", "ext": "m4a", "vcodec": "none", "acodec": "mp4a.40.2", "abr": 129},
+    {"format_id": "139", "ext": "m4a", "vcodec": "none", "acodec": "mp4a.40.5", "abr": 48},
+    {"format_id": "251", "ext": "webm", "vcodec": "none", "acodec": "opus", "abr": 160},
+    {"format_id": "134", "ext": "mp4", "vcodec": "avc1.4d401e", "acodec": "none", "width": 640, "height": 360, "tbr": 600},
+    {"format_id": "135", "ext": "mp4", "vcodec": "avc1.4d401f", "acodec": "none", "width": 854, "height": 480, "tbr": 1100},
+    {"format_id": "136", "ext": "mp4", "vcodec": "avc1.4d401f", "acodec": "none", "width": 1280, "height": 720, "tbr": 2300},
+    {"format_id": "137", "ext": "mp4", "vcodec": "avc1.640028", "acodec": "none", "width": 1920, "height": 1080, "tbr": 4400},
+    {"format_id": "247", "ext": "webm", "vcodec": "vp9", "acodec": "none", "width": 1280, "height": 720, "tbr": 1500},
+    {"format_id": "271", "ext": "webm", "vcodec": "vp9", "acodec": "none", "width": 2560, "height": 1440, "tbr": 9000},
+    {"format_id": "313", "ext": "webm", "vcodec": "vp9", "acodec": "none", "width": 3840, "height": 2160, "tbr": 18000},
+    {"format_id": "18", "ext": "mp4", "vcodec": "avc1.42001E", "acodec": "mp4a.40.2", "width": 640, "height": 360, "tbr": 700},
+]
+
+# Fonte já vertical (Shorts): 720x1280 cobre o quadro de saída sem ampliar
+PORTRAIT_FORMATS = [
+    {"format_id": "140", "ext": "m4a", "vcodec": "none", "acodec": "mp4a.40.2", "abr": 129},
+    {"format_id": "135", "ext": "mp4", "vcodec": "avc1.4d401f", "acodec": "none", "width": 480, "height": 854, "tbr": 1100},
+    {"format_id": "136", "ext": "mp4", "vcodec": "avc1.4d401f", "acodec": "none", "width": 720, "height": 1280, "tbr": 2300},
+    {"format_id": "137", "ext": "mp4", "vcodec": "avc1.640028", "acodec": "none", "width": 1080, "height": 1920, "tbr": 4400},
+]
+
+
+class TestFormatSelection:
+
+    def test_picks_smallest_h264_stream_meeting_target(self):
+        # 720x1280 H.264 + menor m4a que atende ao bitrate mínimo; nada de 1080p
+        assert select_format(PORTRAIT_FORMATS, PROFILE_720) == "136+140"
+
+    def test_higher_profile_picks_larger_stream(self):
+        assert select_format(PORTRAIT_FORMATS, {**PROFILE_720, "output_width": 1080, "output_height": 1920}) == "137+140"
+
+    def test_landscape_source_needs_height_of_output_frame(self):
+        # 16:9: o crop 9:16 usa a altura inteira, que precisa chegar a 1280 px. Nenhum H.264
+        # chega lá, então o codec é relaxado (1440p VP9) em vez de ampliar 854x480 ou 720p
+        assert select_format(YOUTUBE_FORMATS, PROFILE_720) == "271+140"
+
+    def test_keeps_preferred_codec_when_nothing_meets_target(self):
+        landscape_720 = [f for f in YOUTUBE_FORMATS if f["format_id"] in ("135", "136", "247", "140")]
+        assert select_format(landscape_720, PROFILE_720) == "136+140"
+
+    def test_falls_back_to_largest_below_target(self):
+        low_res = [f for f in YOUTUBE_FORMATS if f["format_id"] in ("134", "140")]
+        assert select_format(low_res, PROFILE_720) == "134+140"
+
+    def test_relaxes_codec_when_no_preferred_codec(self):
+        vp9_only = [f for f in YOUTUBE_FORMATS if f["format_id"] in ("247", "271", "313", "251")]
+        assert select_format(vp9_only, PROFILE_720) == "271+251"
+
+    def test_muxed_only_formats(self):
+        muxed = [f for f in YOUTUBE_FORMATS if f["format_id"] == "18"]
+        assert select_format(muxed, PROFILE_720) == "18"
+        assert select_format([], PROFILE_720) is None
+
+    @patch('app.services.video_downloader.settings')
+    def test_resolve_video_format_keeps_generic_fallback(self, mock_settings):
+        mock_settings.OUTPUT_PROFILES = {"vertical_720": PROFILE_720}
+        mock_settings.DEFAULT_OUTPUT_PROFILE = "vertical_720"
+        assert resolve_video_format({"formats": YOUTUBE_FORMATS}) == f"271+140/{VIDEO_FORMAT}"
+        assert resolve_video_format({"formats": []}) == VIDEO_FORMAT
@@ -1,8 +1,11 @@
 import pytest
 from unittest.mock import patch, MagicMock
 from pathlib import Path
+import io
+import json
 import subprocess # Import subprocess here
-from app.services.video_processor import process_clip, run_ffmpeg_command
+from app.services.video_processor import process_clip, build_vertical_filter, run_ffmpeg_command, build_batch_render_command, process_project_clips, plan_smart_cut, get_keyframe_index, smart_cut_clip, ClipProgressReporter, resolve_clip_source
+from app.services.render_cache import RenderCache
 from app.db.models import SuggestedClip, Project # Importar modelos
 from sqlalchemy.orm import Session # Para type hinting
 
@@ -17,6 +20,9 @@ def mock_settings_fixture(tmp_path): # tmp_path é uma fixture do pytest para cr
     media_root.mkdir(exist_ok=True)
     settings_mock = MagicMock()
     settings_mock.MEDIA_ROOT_PATH = str(media_root)
+    settings_mock.RENDER_CACHE_MAX_BYTES = 1024 ** 3
+    settings_mock.FFMPEG_STDERR_TAIL_LINES = 50
+    settings_mock.FFMPEG_PROGRESS_WRITE_INTERVAL_SECONDS = 0
     return settings_mock
 
 
@@ -42,6 +48,20 @@ def mock_clip(mock_project): # Depends on mock_project
     )
     return clip
 
+def _ffmpeg_process(returncode=0, stdout=b'', stderr=b''):
+    """Mock of a streaming ffmpeg Popen object (stdout = -progress output)."""
+    process = MagicMock()
+    process.returncode = returncode
+    process.wait.return_value = returncode
+    process.stdout = io.BytesIO(stdout)
+    process.stderr = io.BytesIO(stderr)
+    return process
+
+def _write_output(output_path, process):
+    """Simulates ffmpeg producing its output file."""
+    Path(output_path).write_bytes(b"video")
+    return process
+
 class TestVideoProcessor:
 
     @patch('app.services.video_processor.subprocess.Popen')
@@ -49,11 +69,12 @@ class TestVideoProcessor:
     def test_process_clip_success(self, mock_settings_import, mock_popen, mock_db_session, mock_clip, mock_project, tmp_path, mock_settings_fixture):
         # Configure the imported settings mock
         mock_settings_import.MEDIA_ROOT_PATH = mock_settings_fixture.MEDIA_ROOT_PATH
+        mock_settings_import.RENDER_CACHE_MAX_BYTES = mock_settings_fixture.RENDER_CACHE_MAX_BYTES
+        mock_settings_import.FFMPEG_STDERR_TAIL_LINES = mock_settings_fixture.FFMPEG_STDERR_TAIL_LINES
+        mock_settings_import.FFMPEG_PROGRESS_WRITE_INTERVAL_SECONDS = mock_settings_fixture.FFMPEG_PROGRESS_WRITE_INTERVAL_SECONDS
 
-        mock_process = MagicMock()
-        mock_process.returncode = 0
-        mock_process.communicate.return_value = (b'stdout', b'stderr')
-        mock_popen.return_value = mock_process
+        mock_process = _ffmpeg_process(0, b'progress=end\n', b'stderr')
+        mock_popen.side_effect = lambda command, **kwargs: _write_output(command[-1], mock_process)
 
         mock_db_session.query(SuggestedClip).filter(SuggestedClip.id == mock_clip.id).first.return_value = mock_clip
 
@@ -84,10 +105,11 @@ class TestVideoProcessor:
     @patch('app.services.video_processor.settings')
     def test_process_clip_ffmpeg_error(self, mock_settings_import, mock_popen, mock_db_session, mock_clip, mock_settings_fixture):
         mock_settings_import.MEDIA_ROOT_PATH = mock_settings_fixture.MEDIA_ROOT_PATH
+        mock_settings_import.RENDER_CACHE_MAX_BYTES = mock_settings_fixture.RENDER_CACHE_MAX_BYTES
+        mock_settings_import.FFMPEG_STDERR_TAIL_LINES = mock_settings_fixture.FFMPEG_STDERR_TAIL_LINES
+        mock_settings_import.FFMPEG_PROGRESS_WRITE_INTERVAL_SECONDS = mock_settings_fixture.FFMPEG_PROGRESS_WRITE_INTERVAL_SECONDS
 
-        mock_process = MagicMock()
-        mock_process.returncode = 1
-        mock_process.communicate.return_value = (b'', b'ffmpeg error output')
+        mock_process = _ffmpeg_process(1, b'', b'ffmpeg error output')
         mock_popen.return_value = mock_process
 
         mock_db_session.query(SuggestedClip).filter(SuggestedClip.id == mock_clip.id).first.return_value = mock_clip
@@ -102,6 +124,9 @@ class TestVideoProcessor:
     @patch('app.services.video_processor.settings')
     def test_process_clip_original_video_not_found(self, mock_settings_import, mock_db_session, mock_clip, tmp_path, mock_settings_fixture):
         mock_settings_import.MEDIA_ROOT_PATH = mock_settings_fixture.MEDIA_ROOT_PATH
+        mock_settings_import.RENDER_CACHE_MAX_BYTES = mock_settings_fixture.RENDER_CACHE_MAX_BYTES
+        mock_settings_import.FFMPEG_STDERR_TAIL_LINES = mock_settings_fixture.FFMPEG_STDERR_TAIL_LINES
+        mock_settings_import.FFMPEG_PROGRESS_WRITE_INTERVAL_SECONDS = mock_settings_fixture.FFMPEG_PROGRESS_WRITE_INTERVAL_SECONDS
 
         mock_clip.project.original_video_path = str(tmp_path / "non_existent_video.mp4")
         mock_db_session.query(SuggestedClip).filter(SuggestedClip.id == mock_clip.id).first.return_value = mock_clip
@@ -115,20 +140,330 @@ class TestVideoProcessor:
 
     @patch('app.services.video_processor.subprocess.Popen')
     def test_run_ffmpeg_command_success(self, mock_popen):
-        mock_process = MagicMock()
-        mock_process.returncode = 0
-        mock_process.communicate.return_value = (b'stdout', b'stderr')
+        mock_process = _ffmpeg_process(0, b'progress=end\n', b'stderr')
         mock_popen.return_value = mock_process
 
         run_ffmpeg_command(['ffmpeg', '-i', 'input.mp4', 'output.mp4'])
-        mock_popen.assert_called_once_with(['ffmpeg', '-i', 'input.mp4', 'output.mp4'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        mock_popen.assert_called_once_with(['ffmpeg', '-progress', 'pipe:1', '-nostats', '-i', 'input.mp4', 'output.mp4'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
 
     @patch('app.services.video_processor.subprocess.Popen')
     def test_run_ffmpeg_command_error(self, mock_popen):
-        mock_process = MagicMock()
-        mock_process.returncode = 1
-        mock_process.communicate.return_value = (b'', b'ffmpeg error')
+        mock_process = _ffmpeg_process(1, b'', b'ffmpeg error')
         mock_popen.return_value = mock_process
 
         with pytest.raises(Exception, match="FFmpeg error: ffmpeg error"):
             run_ffmpeg_command(['ffmpeg', '-i', 'input.mp4', 'output.mp4'])
+
+    def test_vertical_filter_scales_to_cover_before_cropping(self):
+        # "scale=720:-2" deixava uma fonte 1280x720 com 405 px de altura e o crop 720x1280 falhava
+        scale, crop = build_vertical_filter().split(",")
+        assert scale == "scale=720:1280:force_original_aspect_ratio=increase"
+        assert crop == "crop=720:1280:(iw-720)/2:(ih-1280)/2"
+        assert build_vertical_filter(1080, 1920).startswith("scale=1080:1920:force_original_aspect_ratio=increase,")
+
+
+class TestBatchRender:
+
+    def test_build_batch_render_command_single_decode(self, mock_project):
+        ranges = [(30, 45), (100, 130)]
+        outputs = [Path("/tmp/clip_1.mp4"), Path("/tmp/clip_2.mp4")]
+
+        command = build_batch_render_command(Path(mock_project.original_video_path), ranges, outputs)
+
+        assert command.count('-i') == 1
+        # Input is seeked once to the first clip and read until the last clip ends
+        assert command[command.index('-ss') + 1] == '30'
+        assert command[command.index('-t') + 1] == '100'
+        graph = command[command.index('-filter_complex') + 1]
+        assert "split=2" in graph and "asplit=2" in graph
+        assert "trim=start=0:end=15" in graph
+        assert "trim=start=70:end=100" in graph
+        assert command[-1] == "/tmp/clip_2.mp4"
+        assert "/tmp/clip_1.mp4" in command
+
+    def test_build_batch_render_command_applies_per_clip_loudnorm(self, mock_project):
+        ranges = [(30, 45), (100, 130)]
+        outputs = [Path("/tmp/clip_1.mp4"), Path("/tmp/clip_2.mp4")]
+        command = build_batch_render_command(Path(mock_project.original_video_path), ranges, outputs,
+                                             ["loudnorm=I=-14.0:linear=true", ""])
+
+        graph = command[command.index('-filter_complex') + 1]
+        assert "asetpts=PTS-STARTPTS,loudnorm=I=-14.0:linear=true[aout0]" in graph
+        assert "asetpts=PTS-STARTPTS[aout1]" in graph
+
+    def test_build_batch_render_command_without_audio_stream(self, mock_project):
+        ranges = [(30, 45), (100, 130)]
+        outputs = [Path("/tmp/clip_1.mp4"), Path("/tmp/clip_2.mp4")]
+        command = build_batch_render_command(Path(mock_project.original_video_path), ranges, outputs,
+                                             ["loudnorm=I=-14.0:linear=true", ""], has_audio=False)
+
+        graph = command[command.index('-filter_complex') + 1]
+        assert "[0:a]" not in graph and "aout" not in graph
+        assert [command[i + 1] for i, arg in enumerate(command) if arg == '-map'] == ['[vout0]', '[vout1]']
+
+    @patch('app.services.video_processor.subprocess.Popen')
+    @patch('app.services.video_processor.get_keyframe_index', return_value={"audio": None, "keyframes": []})
+    @patch('app.services.video_processor.settings')
+    def test_batch_render_of_silent_source_maps_video_only(self, mock_settings_import, mock_index, mock_popen, mock_db_session, mock_project, mock_settings_fixture):
+        mock_settings_import.MEDIA_ROOT_PATH = mock_settings_fixture.MEDIA_ROOT_PATH
+        mock_settings_import.RENDER_CACHE_MAX_BYTES = mock_settings_fixture.RENDER_CACHE_MAX_BYTES
+        mock_settings_import.FFMPEG_STDERR_TAIL_LINES = mock_settings_fixture.FFMPEG_STDERR_TAIL_LINES
+        mock_settings_import.FFMPEG_PROGRESS_WRITE_INTERVAL_SECONDS = mock_settings_fixture.FFMPEG_PROGRESS_WRITE_INTERVAL_SECONDS
+        clip = SuggestedClip(id=1, project_id=1, timestamp_inicio_segundos=10, timestamp_fim_segundos=20, status_aprovacao="approved")
+        mock_db_session.query.return_value.filter.return_value.first.return_value = mock_project
+        mock_db_session.query.return_value.filter.return_value.order_by.return_value.all.return_value = [clip]
+        clips_dir = Path(mock_settings_fixture.MEDIA_ROOT_PATH) / "project_1" / "clips"
+        mock_popen.side_effect = lambda command, **kwargs: _write_output(clips_dir / "clip_1.mp4", _ffmpeg_process(0, b'progress=end\n', b''))
+
+        results = process_project_clips(1, mock_db_session)
+
+        command = mock_popen.call_args.args[0]
+        assert "asplit" not in command[command.index('-filter_complex') + 1]
+        assert results[1] == str(clips_dir / "clip_1.mp4")
+
+    @patch('app.services.video_processor.subprocess.Popen')
+    @patch('app.services.video_processor.get_keyframe_index', return_value={"audio": {"codec_name": "aac"}, "keyframes": []})
+    @patch('app.services.video_processor.settings')
+    def test_process_project_clips_records_per_clip_failure(self, mock_settings_import, mock_index, mock_popen, mock_db_session, mock_project, mock_settings_fixture):
+        mock_settings_import.MEDIA_ROOT_PATH = mock_settings_fixture.MEDIA_ROOT_PATH
+        mock_settings_import.RENDER_CACHE_MAX_BYTES = mock_settings_fixture.RENDER_CACHE_MAX_BYTES
+        mock_settings_import.FFMPEG_STDERR_TAIL_LINES = mock_settings_fixture.FFMPEG_STDERR_TAIL_LINES
+        mock_settings_import.FFMPEG_PROGRESS_WRITE_INTERVAL_SECONDS = mock_settings_fixture.FFMPEG_PROGRESS_WRITE_INTERVAL_SECONDS
+
+        mock_process = _ffmpeg_process(0, b'progress=end\n', b'stderr')
+        clip_ok = SuggestedClip(id=1, project_id=1, timestamp_inicio_segundos=10, timestamp_fim_segundos=20, status_aprovacao="approved")
+        clip_missing = SuggestedClip(id=2, project_id=1, timestamp_inicio_segundos=30, timestamp_fim_segundos=50, status_aprovacao="approved")
+        mock_db_session.query.return_value.filter.return_value.first.return_value = mock_project
+        mock_db_session.query.return_value.filter.return_value.order_by.return_value.all.return_value = [clip_ok, clip_missing]
+
+        # Only the first output is produced by the (mocked) ffmpeg run
+        clips_dir = Path(mock_settings_fixture.MEDIA_ROOT_PATH) / "project_1" / "clips"
+        mock_popen.side_effect = lambda command, **kwargs: _write_output(clips_dir / "clip_1.mp4", mock_process)
+
+        results = process_project_clips(1, mock_db_session)
+
+        mock_popen.assert_called_once()
+        assert results[1] == str(clips_dir / "clip_1.mp4")
+        assert results[2] is None
+        assert clip_ok.processing_status == "processed"
+        assert clip_missing.processing_status == "processing_failed"
+        assert "clip_2.mp4" in clip_missing.processing_error_detail
+
+
+class TestSmartCut:
+
+    def test_plan_smart_cut_copies_whole_gops(self):
+        keyframes = [0.0, 2.0, 4.0, 6.0, 8.0, 10.0]
+        plan = plan_smart_cut(keyframes, 1.5, 9.0)
+        assert plan == [("encode", 1.5, 2.0), ("copy", 2.0, 8.0), ("encode", 8.0, 9.0)]
+
+    def test_plan_smart_cut_aligned_boundaries_need_no_reencode(self):
+        keyframes = [0.0, 2.0, 4.0, 6.0]
+        assert plan_smart_cut(keyframes, 2.0, 6.0) == [("copy", 2.0, 6.0)]
+
+    def test_plan_smart_cut_inside_single_gop_reencodes(self):
+        keyframes = [0.0, 10.0]
+        assert plan_smart_cut(keyframes, 2.0, 8.0) == [("encode", 2.0, 8.0)]
+
+    @patch('app.services.video_processor.subprocess.run')
+    @patch('app.services.video_processor.settings')
+    def test_keyframe_index_is_probed_once_per_project(self, mock_settings_import, mock_run, mock_project, mock_settings_fixture):
+        mock_settings_import.MEDIA_ROOT_PATH = mock_settings_fixture.MEDIA_ROOT_PATH
+        mock_settings_import.RENDER_CACHE_MAX_BYTES = mock_settings_fixture.RENDER_CACHE_MAX_BYTES
+        mock_settings_import.FFMPEG_STDERR_TAIL_LINES = mock_settings_fixture.FFMPEG_STDERR_TAIL_LINES
+        mock_settings_import.FFMPEG_PROGRESS_WRITE_INTERVAL_SECONDS = mock_settings_fixture.FFMPEG_PROGRESS_WRITE_INTERVAL_SECONDS
+        mock_run.side_effect = [
+            MagicMock(returncode=0, stdout=json.dumps({"streams": [
+                {"codec_type": "video", "codec_name": "h264", "profile": "High", "level": 40, "pix_fmt": "yuv420p", "time_base": "1/15360"},
+                {"codec_type": "audio", "codec_name": "aac", "profile": "LC", "sample_rate": "48000", "channels": 2},
+            ]}), stderr=""),
+            MagicMock(returncode=0, stdout="0.000000,K__\n0.040000,___\n2.000000,K__\n", stderr=""),
+        ]
+        video_path = Path(mock_project.original_video_path)
+
+        first = get_keyframe_index(mock_project.id, video_path)
+        second = get_keyframe_index(mock_project.id, video_path)
+
+        assert first["codec"] == "h264"
+        assert first["video"]["profile"] == "High"
+        assert first["audio"]["sample_rate"] == "48000"
+        assert first["keyframes"] == [0.0, 2.0]
+        assert second["keyframes"] == [0.0, 2.0]
+        assert mock_run.call_count == 2 # streams + packets, only on the first call
+
+    def _keyframe_index(self, video_overrides=None, audio_overrides=None):
+        video = {"codec_type": "video", "codec_name": "h264", "profile": "Main", "level": 31, "pix_fmt": "yuv420p", "time_base": "1/90000"}
+        audio = {"codec_type": "audio", "codec_name": "aac", "profile": "LC", "sample_rate": "44100", "channels": 2}
+        return {"codec": "h264", "keyframes": [0.0, 2.0, 4.0, 6.0, 8.0, 10.0],
+                "video": {**video, **(video_overrides or {})}, "audio": {**audio, **(audio_overrides or {})}}
+
+    def _smart_cut(self, tmp_path, keyframe_index):
+        commands = []
+        smart_cut_clip(tmp_path / "source.mp4", 1.5, 9.0, tmp_path / "clip.mp4", keyframe_index,
+                       run_command=lambda command, on_progress=None: commands.append(command))
+        return commands
+
+    def test_smart_cut_edges_match_source_stream_parameters(self, tmp_path):
+        commands = self._smart_cut(tmp_path, self._keyframe_index())
+
+        assert len(commands) == 4 # head, copy, tail, concat
+        head, copy, tail, concat = commands
+        for edge in (head, tail):
+            assert edge[edge.index('-profile:v') + 1] == "main"
+            assert edge[edge.index('-level:v') + 1] == "3.1"
+            assert edge[edge.index('-pix_fmt') + 1] == "yuv420p"
+            assert edge[edge.index('-c:a') + 1] == "aac"
+            assert edge[edge.index('-ar') + 1] == "44100"
+            assert edge[edge.index('-ac') + 1] == "2"
+        assert copy[copy.index('-c') + 1] == "copy"
+        for part in (head, copy, tail):
+            assert part[part.index('-f') + 1] == "mpegts"
+        assert concat[concat.index('-video_track_timescale') + 1] == "90000"
+        assert not (tmp_path / ".clip_parts").exists()
+
+    @pytest.mark.parametrize("video_overrides, audio_overrides", [
+        ({"profile": "Extended"}, None), # perfil que o libx264 não gera
+        ({"time_base": None}, None),
+        (None, {"codec_name": "opus"}), # áudio copiado não seria AAC
+        (None, {"profile": "HE-AAC"}),
+    ])
+    def test_smart_cut_reencodes_whole_clip_when_source_cannot_be_matched(self, tmp_path, video_overrides, audio_overrides):
+        commands = self._smart_cut(tmp_path, self._keyframe_index(video_overrides, audio_overrides))
+
+        assert len(commands) == 1
+        command = commands[0]
+        assert command[command.index('-ss') + 1] == "1.5"
+        assert command[command.index('-t') + 1] == "7.5"
+        assert '-f' not in command and 'copy' not in command
+        assert command[-1] == str(tmp_path / "clip.mp4")
+
+    def test_smart_cut_without_audio_drops_audio_on_edges(self, tmp_path):
+        keyframe_index = self._keyframe_index()
+        keyframe_index["audio"] = None
+
+        head, _, tail, concat = self._smart_cut(tmp_path, keyframe_index)
+
+        assert '-an' in head and '-an' in tail
+        assert '-bsf:a' not in concat
+
+
+class TestRenderCache:
+
+    def _run_clip(self, mock_db_session, mock_clip):
+        mock_db_session.query(SuggestedClip).filter(SuggestedClip.id == mock_clip.id).first.return_value = mock_clip
+        return process_clip(mock_clip.id, mock_db_session)
+
+    @patch('app.services.video_processor.subprocess.Popen')
+    @patch('app.services.video_processor.settings')
+    def test_identical_render_is_served_from_cache(self, mock_settings_import, mock_popen, mock_db_session, mock_clip, mock_settings_fixture):
+        mock_settings_import.MEDIA_ROOT_PATH = mock_settings_fixture.MEDIA_ROOT_PATH
+        mock_settings_import.RENDER_CACHE_MAX_BYTES = mock_settings_fixture.RENDER_CACHE_MAX_BYTES
+        mock_settings_import.FFMPEG_STDERR_TAIL_LINES = mock_settings_fixture.FFMPEG_STDERR_TAIL_LINES
+        mock_settings_import.FFMPEG_PROGRESS_WRITE_INTERVAL_SECONDS = mock_settings_fixture.FFMPEG_PROGRESS_WRITE_INTERVAL_SECONDS
+        mock_popen.side_effect = lambda command, **kwargs: _write_output(command[-1], _ffmpeg_process())
+
+        first = self._run_clip(mock_db_session, mock_clip)
+        second = self._run_clip(mock_db_session, mock_clip)
+
+        assert first == second
+        assert mock_popen.call_count == 1
+        assert Path(second).exists()
+
+    @patch('app.services.video_processor.subprocess.Popen')
+    @patch('app.services.video_processor.settings')
+    def test_changed_timestamps_render_fresh(self, mock_settings_import, mock_popen, mock_db_session, mock_clip, mock_settings_fixture):
+        mock_settings_import.MEDIA_ROOT_PATH = mock_settings_fixture.MEDIA_ROOT_PATH
+        mock_settings_import.RENDER_CACHE_MAX_BYTES = mock_settings_fixture.RENDER_CACHE_MAX_BYTES
+        mock_settings_import.FFMPEG_STDERR_TAIL_LINES = mock_settings_fixture.FFMPEG_STDERR_TAIL_LINES
+        mock_settings_import.FFMPEG_PROGRESS_WRITE_INTERVAL_SECONDS = mock_settings_fixture.FFMPEG_PROGRESS_WRITE_INTERVAL_SECONDS
+        mock_popen.side_effect = lambda command, **kwargs: _write_output(command[-1], _ffmpeg_process())
+
+        self._run_clip(mock_db_session, mock_clip)
+        mock_clip.timestamp_fim_segundos = 25 # Re-approved with a new end time
+        self._run_clip(mock_db_session, mock_clip)
+
+        assert mock_popen.call_count == 2
+        args, _ = mock_popen.call_args
+        assert '15' in args[0] # New duration
+
+    def test_lru_eviction_respects_byte_budget(self, tmp_path):
+        cache = RenderCache(tmp_path / "cache", max_bytes=10)
+        for key in ("a", "b", "c"):
+            rendered = tmp_path / f"{key}.mp4"
+            rendered.write_bytes(b"12345")
+            cache.store(key, rendered)
+            if key == "b":
+                cache.fetch("a", tmp_path / "out_a.mp4") # "a" becomes more recent than "b"
+
+        assert cache.total_bytes() <= 10
+        assert cache.fetch("a", tmp_path / "again_a.mp4")
+        assert not cache.fetch("b", tmp_path / "again_b.mp4")
+
+
+class TestFfmpegProgress:
+
+    @patch('app.services.video_processor.subprocess.Popen')
+    def test_run_ffmpeg_command_streams_progress(self, mock_popen):
+        progress_output = (
+            b"frame=10\nfps=25.0\nout_time_us=2000000\nspeed=1.5x\nprogress=continue\n"
+            b"frame=20\nfps=30.0\nout_time_us=4000000\nspeed=2.0x\nprogress=end\n"
+        )
+        mock_popen.return_value = _ffmpeg_process(0, progress_output)
+        reports = []
+
+        run_ffmpeg_command(['ffmpeg', '-i', 'input.mp4', 'output.mp4'], on_progress=reports.append)
+
+        assert [r["out_time"] for r in reports] == [2.0, 4.0]
+        assert reports[0]["fps"] == 25.0
+        assert reports[1]["speed"] == 2.0
+        assert reports[1]["finished"] is True
+
+    @patch('app.services.video_processor.subprocess.Popen')
+    @patch('app.services.video_processor.settings')
+    def test_run_ffmpeg_command_keeps_only_stderr_tail(self, mock_settings_import, mock_popen):
+        mock_settings_import.FFMPEG_STDERR_TAIL_LINES = 2
+        stderr = b"".join(f"line {i}\n".encode() for i in range(1000))
+        mock_popen.return_value = _ffmpeg_process(1, b'', stderr)
+
+        with pytest.raises(Exception) as excinfo:
+            run_ffmpeg_command(['ffmpeg', '-i', 'input.mp4', 'output.mp4'])
+
+        assert str(excinfo.value) == "FFmpeg error: line 998\nline 999"
+
+    def test_progress_reporter_throttles_db_writes(self, mock_db_session, mock_clip):
+        now = [0.0]
+        reporter = ClipProgressReporter(mock_db_session, [(mock_clip, 0, 10)], min_interval=5, clock=lambda: now[0])
+
+        for second in range(10):
+            now[0] = float(second)
+            reporter({"out_time": float(second)})
+
+        # Writes at t=0 and t=5 only
+        assert mock_db_session.commit.call_count == 2
+        assert mock_clip.processing_progress == 50.0
+
+
+class TestClipSourceResolution:
+
+    def test_full_download_uses_original_video(self, mock_project):
+        path, offset = resolve_clip_source(mock_project, 10, 20)
+        assert path == Path(mock_project.original_video_path)
+        assert offset == 0
+
+    def test_segment_download_uses_covering_segment(self, tmp_path):
+        segment_file = tmp_path / "segment_90_170.mp4"
+        segment_file.touch()
+        project = Project(id=1, source_segments_json=[
+            {"start": 0, "end": 40, "path": str(tmp_path / "segment_0_40.mp4")},
+            {"start": 90, "end": 170, "path": str(segment_file)},
+        ])
+
+        path, offset = resolve_clip_source(project, 100, 130)
+
+        assert path == segment_file
+        assert offset == 90
+
+    def test_uncovered_range_is_an_error(self, tmp_path):
+        project = Project(id=1, source_segments_json=[{"start": 90, "end": 170, "path": str(tmp_path / "s.mp4")}])
+        with pytest.raises(ValueError, match="No downloaded segment"):
+            resolve_clip_source(project, 300, 330)
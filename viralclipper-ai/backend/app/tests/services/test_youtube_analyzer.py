@@ -1,5 +1,71 @@
+import json
+import random
+import threading
+import time
+import numpy as np
 import pytest
-from app.services.youtube_analyzer import YouTubeAnalyzerService, get_mock_audience_retention
+from unittest.mock import patch
+from app.services.youtube_analyzer import (
+    YouTubeAnalyzerService, get_mock_audience_retention, detect_retention_peaks_batch,
+    RetentionCache, InMemoryLRUBackend, RedisCacheBackend, moving_average_matrix, settle_moving_average_ties
+)
+
+
+class FakeRedis:
+    """Cliente Redis em memória (get/set com nx/ex/px, delete e o script de release), compartilhado entre "processos" no teste."""
+
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None, px=None, nx=False):
+        with self.lock:
+            if nx and key in self.data:
+                return None
+            self.data[key] = value.encode("utf-8") if isinstance(value, str) else value
+            return True
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def eval(self, script, numkeys, key, token):
+        assert script == RedisCacheBackend.RELEASE_LOCK_SCRIPT
+        with self.lock: # Atômico como o Lua no Redis
+            if self.data.get(key) == token.encode("utf-8"):
+                del self.data[key]
+                return 1
+            return 0
+
+
+def reference_detect_peaks(retention_data, window=12, factor=1.15, merge_distance=15):
+    """Implementação original em Python puro, usada como referência do motor vetorizado."""
+    if not retention_data:
+        return []
+    timestamps, values = zip(*retention_data)
+    moving_average = []
+    for i in range(len(values)):
+        window_values = values[max(0, i - window // 2):min(len(values), i + window // 2 + 1)]
+        moving_average.append(sum(window_values) / len(window_values))
+    segment_duration = timestamps[1] - timestamps[0] if len(timestamps) > 1 else 5
+    raw_peaks, in_peak, peak_start = [], False, 0
+    for i, (timestamp, retention) in enumerate(retention_data):
+        if retention > moving_average[i] * factor and not in_peak:
+            in_peak, peak_start = True, timestamp
+        elif retention < moving_average[i] and in_peak:
+            in_peak = False
+            raw_peaks.append((peak_start, retention_data[i - 1][0] + segment_duration))
+    if in_peak:
+        raw_peaks.append((peak_start, retention_data[-1][0] + segment_duration))
+    merged = []
+    for peak in raw_peaks:
+        if merged and peak[0] - merged[-1][1] <= merge_distance:
+            merged[-1] = (merged[-1][0], peak[1])
+        else:
+            merged.append(peak)
+    return merged
 
 class TestYouTubeAnalyzerService:
 
@@ -91,3 +157,204 @@ class TestYouTubeAnalyzerService:
         assert data[-1][0] < 30 # Timestamp é o início do segmento
         # O último timestamp deve ser video_duration_seconds - step_size (5)
         assert data[-1][0] == 25
+
+
+class TestVectorizedPeakDetection:
+
+    @pytest.mark.parametrize("seed", range(20))
+    def test_matches_reference_implementation(self, seed):
+        random.seed(seed)
+        data = get_mock_audience_retention(video_duration_seconds=random.randint(30, 1800))
+        analyzer = YouTubeAnalyzerService()
+        assert analyzer.detect_retention_peaks(data) == reference_detect_peaks(data)
+        assert analyzer.detect_retention_peaks(data, 4, 1.05, 30) == reference_detect_peaks(data, 4, 1.05, 30)
+
+    def test_mock_series_with_rounding_sensitive_plateau(self):
+        random.seed(198)
+        data = YouTubeAnalyzerService().get_audience_retention_data() # Soma por cumsum dava (590, 600) em vez de (590, 605)
+        assert YouTubeAnalyzerService().detect_retention_peaks(data) == reference_detect_peaks(data)
+
+    def test_moving_average_stays_within_rounding_bound_of_per_point_loop(self):
+        rng = random.Random(2024)
+        for _ in range(2000):
+            window = rng.randint(1, 15)
+            if rng.random() < 0.5:
+                data = [rng.choice([100.0, 0.0]) for _ in range(rng.randint(1, 80))] # Platôs 100/0
+            else:
+                data = [round(rng.uniform(0, 100), 2) for _ in range(rng.randint(1, 80))]
+            expected = []
+            for i in range(len(data)):
+                window_values = data[max(0, i - window // 2):min(len(data), i + window // 2 + 1)]
+                expected.append(sum(window_values) / len(window_values))
+            values, lengths = np.asarray([data]), np.asarray([len(data)])
+            moving_average = moving_average_matrix(values, lengths, window)
+            assert np.allclose(moving_average[0], expected, rtol=1e-12, atol=1e-12)
+            # Pontos em empate (retention == média) são refeitos na ordem da referência, bit a bit
+            settled = settle_moving_average_ties(values, moving_average, lengths, window, 1.15)[0]
+            ties = [i for i, value in enumerate(data) if value == expected[i] or value == expected[i] * 1.15]
+            assert [settled[i] for i in ties] == [expected[i] for i in ties]
+
+    def test_settles_only_near_ties(self):
+        rng = np.random.default_rng(5)
+        values = np.round(rng.uniform(0, 100, (1, 100_000)), 2)
+        lengths = np.asarray([values.shape[1]])
+        moving_average = moving_average_matrix(values, lengths, 12)
+        settled = settle_moving_average_ties(values, moving_average, lengths, 12, 1.15)
+        assert np.count_nonzero(settled != moving_average) < 100 # Ruído sem platôs: quase nada a refazer
+
+    def test_randomized_plateaus_match_reference(self):
+        rng = random.Random(0)
+        series = []
+        for _ in range(2000):
+            levels = rng.choice([(100.0, 0.0), (33.3, 66.7), (0.1, 0.7)]) # Médias de platô não exatas em binário
+            series.append([(i * 5, rng.choice(levels)) for i in range(rng.randint(2, 400))])
+        assert detect_retention_peaks_batch(series) == [reference_detect_peaks(s) for s in series]
+
+    def test_threshold_factor_below_one_matches_reference(self):
+        random.seed(7)
+        data = get_mock_audience_retention(video_duration_seconds=600)
+        analyzer = YouTubeAnalyzerService()
+        assert analyzer.detect_retention_peaks(data, 6, 0.98, 10) == reference_detect_peaks(data, 6, 0.98, 10)
+
+    def test_batch_matches_single_series(self):
+        random.seed(3)
+        series = [get_mock_audience_retention(video_duration_seconds=d) for d in (60, 900, 1800)]
+        series.append([])
+        series.append([(0, 50.0)])
+        batch = detect_retention_peaks_batch(series)
+        assert batch == [reference_detect_peaks(s) for s in series]
+
+
+class TestStreamingPeakDetector:
+
+    def _stream(self, data, chunk_sizes, roundtrip=False, **params):
+        from app.services.youtube_analyzer import StreamingPeakDetector
+        detector = StreamingPeakDetector(**params)
+        peaks, position = [], 0
+        for size in chunk_sizes:
+            peaks += detector.feed(data[position:position + size])
+            position += size
+            if roundtrip:
+                detector = StreamingPeakDetector.from_dict(json.loads(json.dumps(detector.to_dict())))
+        peaks += detector.feed(data[position:])
+        return peaks + detector.close()
+
+    @pytest.mark.parametrize("seed", range(10))
+    def test_chunked_stream_matches_batch(self, seed):
+        random.seed(seed)
+        data = get_mock_audience_retention(video_duration_seconds=random.randint(60, 1800))
+        chunk_sizes = [random.randint(1, 40) for _ in range(len(data) // 10)]
+        assert self._stream(data, chunk_sizes) == reference_detect_peaks(data)
+        assert self._stream(data, chunk_sizes, roundtrip=True, moving_average_window=5,
+                            peak_threshold_factor=1.05, merge_distance_seconds=30) == reference_detect_peaks(data, 5, 1.05, 30)
+
+    def test_peaks_are_emitted_before_the_series_ends(self):
+        from app.services.youtube_analyzer import StreamingPeakDetector
+        data = [(i * 5, 20.0) for i in range(20)] + [(100 + i * 5, 80.0) for i in range(4)] + [(120 + i * 5, 20.0) for i in range(30)]
+        detector = StreamingPeakDetector()
+        emitted = detector.feed(data)
+        assert emitted == reference_detect_peaks(data)
+        assert detector.close() == []
+        assert len(detector.points) <= detector.moving_average_window + 1
+
+
+class TestRetentionCache:
+
+    def _slow_fetch(self, calls):
+        def fetch():
+            calls.append(1)
+            time.sleep(0.05)
+            return [(0, 90.0), (5, 80.5)]
+        return fetch
+
+    def test_hit_after_miss_and_ttl_expiry(self):
+        now = [0.0]
+        cache = RetentionCache(InMemoryLRUBackend(clock=lambda: now[0]), ttl_seconds=60)
+        calls = []
+        assert cache.get_or_fetch("vid", self._slow_fetch(calls)) == [(0, 90.0), (5, 80.5)]
+        cache.get_or_fetch("vid", self._slow_fetch(calls))
+        now[0] = 61.0
+        cache.get_or_fetch("vid", self._slow_fetch(calls))
+        assert len(calls) == 2
+        assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+    def test_lru_evicts_least_recently_used(self):
+        backend = InMemoryLRUBackend(max_entries=2)
+        backend.set("a", "1", 60)
+        backend.set("b", "2", 60)
+        backend.get("a")
+        backend.set("c", "3", 60)
+        assert backend.get("b") is None and backend.get("a") == "1"
+
+    def test_stats_and_prometheus_count_lookups_and_evictions(self):
+        from prometheus_client import REGISTRY
+        from app.services import youtube_analyzer
+        sample = lambda name, **labels: REGISTRY.get_sample_value(name, labels) or 0.0
+        before = {result: sample("viralclipper_retention_cache_lookups_total", result=result) for result in ("local_hit", "miss")}
+        evictions_before = sample("viralclipper_retention_cache_evictions_total")
+
+        with patch.object(youtube_analyzer, "_retention_cache", None), patch.object(youtube_analyzer, "settings") as mock_settings:
+            mock_settings.RETENTION_CACHE_REDIS_URL = ""
+            mock_settings.RETENTION_CACHE_MAX_ENTRIES = 1
+            mock_settings.RETENTION_CACHE_TTL_SECONDS = 60
+            cache = youtube_analyzer.get_retention_cache()
+            cache.get_or_fetch("a", lambda: [(0, 1.0)])
+            cache.get_or_fetch("a", lambda: [(0, 1.0)])
+            cache.get_or_fetch("b", lambda: [(0, 2.0)]) # Expulsa "a" (1 entrada)
+
+        assert (cache.stats()["hits"], cache.stats()["misses"], cache.stats()["evictions"]) == (1, 2, 1)
+        assert sample("viralclipper_retention_cache_lookups_total", result="local_hit") - before["local_hit"] == 1
+        assert sample("viralclipper_retention_cache_lookups_total", result="miss") - before["miss"] == 2
+        assert sample("viralclipper_retention_cache_evictions_total") - evictions_before == 1
+
+    def test_concurrent_fetches_are_single_flight(self):
+        cache = RetentionCache(InMemoryLRUBackend(), ttl_seconds=60)
+        calls, results = [], []
+        threads = [threading.Thread(target=lambda: results.append(cache.get_or_fetch("vid", self._slow_fetch(calls)))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(calls) == 1
+        assert len(results) == 8
+        assert cache.stats()["misses"] == 1
+
+    def test_shared_backend_serves_other_processes(self):
+        redis = FakeRedis()
+        worker_a = RetentionCache(InMemoryLRUBackend(), RedisCacheBackend(redis), ttl_seconds=60)
+        worker_b = RetentionCache(InMemoryLRUBackend(), RedisCacheBackend(redis), ttl_seconds=60, poll_interval_seconds=0.01)
+        calls = []
+        worker_a.get_or_fetch("vid", self._slow_fetch(calls))
+        assert worker_b.get_or_fetch("vid", self._slow_fetch(calls)) == [(0, 90.0), (5, 80.5)]
+        assert len(calls) == 1
+        assert worker_b.stats()["shared_hits"] == 1
+
+    def test_waits_for_fetch_locked_by_other_process(self):
+        redis = FakeRedis()
+        backend = RedisCacheBackend(redis)
+        backend.acquire_lock("retention:vid", 60) # Outro processo está buscando
+        cache = RetentionCache(InMemoryLRUBackend(), backend, ttl_seconds=60, poll_interval_seconds=0.01)
+        threading.Timer(0.05, lambda: backend.set("retention:vid", json.dumps([[0, 50.0]]), 60)).start()
+        calls = []
+        assert cache.get_or_fetch("vid", self._slow_fetch(calls)) == [(0, 50.0)]
+        assert calls == []
+
+    def test_lock_release_only_deletes_own_token(self):
+        redis = FakeRedis()
+        backend = RedisCacheBackend(redis)
+        token_a = backend.acquire_lock("retention:vid", 0.5)
+        assert token_a and backend.acquire_lock("retention:vid", 0.5) is None
+        redis.delete("retention:vid:lock") # A lock de A expirou durante um fetch lento
+        token_b = backend.acquire_lock("retention:vid", 0.5)
+
+        assert backend.release_lock("retention:vid", token_a) is False # A não apaga a lock de B
+        assert redis.get("retention:vid:lock") == token_b.encode("utf-8")
+        assert backend.release_lock("retention:vid", token_b) is True
+        assert redis.get("retention:vid:lock") is None
+
+    def test_analyzer_keys_cache_by_video_id(self):
+        cache = RetentionCache(InMemoryLRUBackend(), ttl_seconds=60)
+        first = YouTubeAnalyzerService(video_id="https://www.youtube.com/watch?v=dQw4w9WgXcQ").get_cached_audience_retention_data(cache)
+        second = YouTubeAnalyzerService(video_id="https://youtu.be/dQw4w9WgXcQ").get_cached_audience_retention_data(cache)
+        assert first == second
+        assert cache.stats()["misses"] == 1
@@ -0,0 +1,548 @@
+import pytest
+from unittest.mock import patch, MagicMock
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.db.database import Base
+from app.db.models import User, Project, SuggestedClip, RetentionChunk
+from app.workers import tasks
+
+
+@pytest.fixture
+def session_factory():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with patch('app.workers.tasks.SessionLocal', factory):
+        yield factory
+
+
+@pytest.fixture
+def approved_clip(session_factory):
+    db = session_factory()
+    user = User(email="a@b.c", hashed_password="x")
+    db.add(user)
+    db.commit()
+    project = Project(youtube_url="https://youtu.be/dQw4w9WgXcQ", owner_id=user.id, status="processing_retention")
+    db.add(project)
+    db.commit()
+    clip = SuggestedClip(project_id=project.id, timestamp_inicio_segundos=10, timestamp_fim_segundos=40, status_aprovacao="approved")
+    db.add(clip)
+    db.commit()
+    ids = project.id, clip.id
+    db.close()
+    return ids
+
+
+class TestParallelPipeline:
+
+    @patch('app.workers.tasks.process_clip')
+    def test_clip_approved_before_download_waits_for_source(self, mock_process_clip, session_factory, approved_clip):
+        project_id, clip_id = approved_clip
+
+        result = tasks.process_video_clip_task(clip_id, render_mode="straight_cut")
+
+        assert result["status"] == "waiting_for_source"
+        mock_process_clip.assert_not_called()
+        db = session_factory()
+        clip = db.get(SuggestedClip, clip_id)
+        assert clip.processing_status == "waiting_for_source"
+        assert clip.requested_render_mode == "straight_cut"
+        db.close()
+
+    @patch('app.workers.tasks.process_clip')
+    def test_duplicate_render_collapses_into_in_flight_job(self, mock_process_clip, session_factory, approved_clip):
+        from app.services.task_leases import acquire_lease, render_lease_key, render_params_hash
+        project_id, clip_id = approved_clip
+        db = session_factory()
+        db.get(Project, project_id).original_video_path = "/media/original_video.mp4"
+        db.commit()
+        acquire_lease(db, render_lease_key(clip_id), "first-task", params_hash=render_params_hash(10, 40, "vertical"))
+        db.close()
+
+        result = tasks.process_video_clip_task(clip_id)
+
+        assert result == {"clip_id": clip_id, "status": "duplicate_in_flight", "lease_owner": "first-task"}
+        mock_process_clip.assert_not_called()
+
+    @patch('app.workers.tasks.process_clip')
+    def test_render_with_new_bounds_waits_for_in_flight_render_of_same_clip(self, mock_process_clip, session_factory, approved_clip):
+        from celery.exceptions import Retry
+        from app.services.task_leases import acquire_lease, render_lease_key, render_params_hash
+        project_id, clip_id = approved_clip
+        db = session_factory()
+        db.get(Project, project_id).original_video_path = "/media/original_video.mp4"
+        db.commit()
+        # Render com os limites antigos ainda gravando clip_{id}.mp4; o clipe foi re-aprovado com 12-40
+        acquire_lease(db, render_lease_key(clip_id), "first-task", params_hash=render_params_hash(10, 40, "vertical"))
+        db.get(SuggestedClip, clip_id).timestamp_inicio_segundos = 12
+        db.commit()
+        db.close()
+
+        with pytest.raises(Retry):
+            tasks.process_video_clip_task(clip_id)
+
+        mock_process_clip.assert_not_called()
+
+    @patch('app.workers.tasks.process_video_clip_task.delay')
+    @patch('app.workers.tasks.get_render_scheduler')
+    @patch('app.workers.tasks.ensure_clip_segments')
+    @patch('app.workers.tasks.process_project_clips')
+    def test_batch_render_leases_each_clip(self, mock_batch, mock_segments, mock_scheduler, mock_delay, session_factory, approved_clip):
+        from app.db.models import TaskLease
+        from app.services.task_leases import acquire_lease, render_lease_key, render_params_hash
+        project_id, clip_id = approved_clip
+        db = session_factory()
+        db.get(Project, project_id).original_video_path = "/media/original_video.mp4"
+        in_flight = SuggestedClip(project_id=project_id, timestamp_inicio_segundos=50, timestamp_fim_segundos=80, status_aprovacao="approved")
+        rebound = SuggestedClip(project_id=project_id, timestamp_inicio_segundos=90, timestamp_fim_segundos=120, status_aprovacao="approved")
+        db.add_all([in_flight, rebound])
+        db.commit()
+        in_flight_id, rebound_id = in_flight.id, rebound.id
+        # Um render individual idêntico em andamento; outro ainda grava os limites antigos (85-120)
+        acquire_lease(db, render_lease_key(in_flight_id), "single-task", params_hash=render_params_hash(50, 80, "vertical"))
+        acquire_lease(db, render_lease_key(rebound_id), "single-task", params_hash=render_params_hash(85, 120, "vertical"))
+        db.close()
+        mock_batch.return_value = {clip_id: "/media/clip.mp4"}
+
+        result = tasks.process_project_clips_task(project_id)
+
+        assert mock_batch.call_args.kwargs["clip_ids"] == [clip_id]
+        assert sorted(result["skipped_clip_ids"]) == sorted([in_flight_id, rebound_id])
+        mock_delay.assert_called_once_with(rebound_id, "vertical") # Espera a lease no render individual
+        db = session_factory()
+        leases = {lease.key: (lease.owner, lease.status) for lease in db.query(TaskLease)}
+        assert leases[render_lease_key(clip_id)][1] == "done"
+        assert leases[render_lease_key(in_flight_id)] == ("single-task", "running")
+        db.close()
+
+    @patch('app.workers.tasks.get_render_scheduler')
+    @patch('app.workers.tasks.ensure_clip_segments')
+    @patch('app.workers.tasks.process_project_clips', side_effect=Exception("ffmpeg failed"))
+    def test_failed_batch_releases_its_leases(self, mock_batch, mock_segments, mock_scheduler, session_factory, approved_clip):
+        from app.db.models import TaskLease
+        from app.services.task_leases import render_lease_key
+        project_id, clip_id = approved_clip
+        db = session_factory()
+        db.get(Project, project_id).original_video_path = "/media/original_video.mp4"
+        db.commit()
+        db.close()
+
+        with pytest.raises(Exception, match="ffmpeg failed"):
+            tasks.process_project_clips_task(project_id)
+
+        db = session_factory()
+        assert db.get(TaskLease, render_lease_key(clip_id)).status == "failed"
+        db.close()
+
+    @patch('app.workers.tasks.build_loudness_track_task.delay')
+    @patch('app.workers.tasks.build_scene_index_task.delay')
+    @patch('app.workers.tasks.process_video_clip_task.delay')
+    def test_finalizer_dispatches_waiting_clips_once(self, mock_delay, mock_scene_index, mock_loudness, session_factory, approved_clip):
+        project_id, clip_id = approved_clip
+        db = session_factory()
+        clip = db.get(SuggestedClip, clip_id)
+        clip.processing_status = "waiting_for_source"
+        clip.requested_render_mode = "straight_cut"
+        clip.project.original_video_path = "/media/original_video.mp4"
+        db.commit()
+        db.close()
+
+        branch_results = [{"project_id": project_id}, {"project_id": project_id, "status": "clips_suggested"}]
+        first = tasks.finalize_project_pipeline_task(branch_results)
+        second = tasks.finalize_project_pipeline_task(branch_results)
+
+        assert first["dispatched_clip_ids"] == [clip_id]
+        assert second["dispatched_clip_ids"] == []
+        mock_delay.assert_called_once_with(clip_id, render_mode="straight_cut")
+        mock_scene_index.assert_called_with(project_id)
+        mock_loudness.assert_called_with(project_id)
+
+    @patch('app.workers.tasks.download_video', side_effect=Exception("HTTP Error 403"))
+    def test_download_failure_fails_waiting_clips(self, mock_download, session_factory, approved_clip):
+        project_id, clip_id = approved_clip
+        db = session_factory()
+        db.get(SuggestedClip, clip_id).processing_status = "waiting_for_source"
+        db.commit()
+        db.close()
+
+        with pytest.raises(Exception):
+            tasks.download_youtube_video_task(project_id, "https://youtu.be/dQw4w9WgXcQ")
+
+        db = session_factory()
+        clip = db.get(SuggestedClip, clip_id)
+        assert clip.processing_status == "processing_failed"
+        assert "HTTP Error 403" in clip.processing_error_detail
+        assert db.get(Project, project_id).status == "download_failed"
+        db.close()
+
+    @patch('app.workers.tasks.YouTubeAnalyzerService')
+    def test_analysis_keeps_download_failure_status(self, mock_analyzer_cls, session_factory, approved_clip):
+        project_id, _ = approved_clip
+        db = session_factory()
+        db.get(Project, project_id).status = "download_failed"
+        db.commit()
+        db.close()
+        analyzer = mock_analyzer_cls.return_value
+        analyzer.get_cached_audience_retention_data.return_value = [(0, 1.0), (30, 0.9)]
+        analyzer.detect_retention_peaks.return_value = [(100, 130)]
+
+        tasks.analyze_retention_task({"project_id": project_id, "youtube_url": "u", "duration_seconds": 300})
+
+        db = session_factory()
+        assert db.get(Project, project_id).status == "download_failed"
+        db.close()
+
+    def test_analysis_of_missing_project_closes_session(self, session_factory):
+        sessions = []
+
+        def tracked_session():
+            session = session_factory()
+            session.close = MagicMock(wraps=session.close)
+            sessions.append(session)
+            return session
+
+        with patch('app.workers.tasks.SessionLocal', side_effect=tracked_session):
+            result = tasks.analyze_retention_task({"project_id": 999, "youtube_url": "u", "duration_seconds": 300})
+
+        assert result == {"project_id": 999, "status": "project_not_found"}
+        sessions[0].close.assert_called_once()
+
+
+class TestRetentionStreaming:
+
+    def test_chunks_suggest_clips_progressively(self, session_factory, approved_clip):
+        project_id, _ = approved_clip
+        low = [(i * 5, 20.0) for i in range(20)]
+        peak = [(100 + i * 5, 80.0) for i in range(4)]
+        tail = [(120 + i * 5, 20.0) for i in range(30)]
+
+        first = tasks.ingest_retention_chunk_task(project_id, low + peak)
+        second = tasks.ingest_retention_chunk_task(project_id, tail)
+        last = tasks.ingest_retention_chunk_task(project_id, [], final=True)
+
+        assert first["peaks_found"] == 0 # O pico ainda pode crescer
+        assert second["clips_added"] == 1
+        assert last["clips_added"] == 0
+        db = session_factory()
+        project = db.get(Project, project_id)
+        assert len(project.retention_data_json) == 54
+        assert project.retention_stream_state is None
+        assert [(c.timestamp_inicio_segundos, c.timestamp_fim_segundos) for c in project.suggested_clips][-1] == (100, 120)
+        assert db.query(RetentionChunk).count() == 0 # Consolidados na série final
+        db.close()
+
+    def test_chunks_store_and_score_only_new_points(self, session_factory, approved_clip):
+        from app.services.clip_scoring import rank_clip_candidates
+        from app.services.retention_store import load_retention_since
+        project_id, _ = approved_clip
+        series = [(i * 5, 20.0 + (i % 7)) for i in range(400)] # Histórico longo sem picos
+        series += [(2000 + i * 5, 80.0) for i in range(4)] + [(2020 + i * 5, 20.0) for i in range(30)]
+        chunks = [series[i:i + 50] for i in range(0, len(series), 50)]
+        loaded = []
+
+        def spy(db, project_id, since):
+            points = load_retention_since(db, project_id, since)
+            loaded.append(len(points))
+            return points
+
+        with patch('app.workers.tasks.load_retention_since', side_effect=spy):
+            added = sum(tasks.ingest_retention_chunk_task(project_id, chunk)["clips_added"] for chunk in chunks)
+
+        db = session_factory()
+        assert db.get(Project, project_id).retention_data_json is None # Nada regravado a cada chunk
+        assert [len(row.points_json) for row in db.query(RetentionChunk).order_by(RetentionChunk.id)] == [len(chunk) for chunk in chunks]
+        assert added == 1 and loaded and max(loaded) < len(series) # Só o trecho recente foi lido para pontuar
+        clip = db.query(SuggestedClip).filter(SuggestedClip.timestamp_inicio_segundos == 2000).one()
+        expected = rank_clip_candidates(series, [(2000, 2020)], top_k=1)[0][2]
+        assert clip.score_viralidade_inicial == expected # Mesmo score que sobre a série inteira
+        db.close()
+
+    def test_redelivered_chunk_does_not_rewind_detector(self, session_factory, approved_clip):
+        project_id, _ = approved_clip
+        low = [(i * 5, 20.0) for i in range(20)]
+        peak = [(100 + i * 5, 80.0) for i in range(4)]
+        tail = [(120 + i * 5, 20.0) for i in range(30)]
+
+        tasks.ingest_retention_chunk_task(project_id, low + peak)
+        tasks.ingest_retention_chunk_task(project_id, tail)
+        state = session_factory().get(Project, project_id).retention_stream_state
+        replay = tasks.ingest_retention_chunk_task(project_id, tail) # Reentrega (acks_late) do mesmo chunk
+
+        db = session_factory()
+        assert (replay["peaks_found"], replay["clips_added"]) == (0, 0)
+        assert db.get(Project, project_id).retention_stream_state == state
+        assert sum(len(row.points_json) for row in db.query(RetentionChunk)) == 54 # Nada gravado em dobro
+        db.close()
+
+    def test_reports_inserted_and_trimmed_clips_separately(self, session_factory, approved_clip):
+        project_id, _ = approved_clip
+        series = [(i * 5, 20.0) for i in range(20)] + [(100 + i * 5, 80.0) for i in range(4)]
+        series += [(120 + i * 5, 20.0) for i in range(30)] + [(270 + i * 5, 90.0) for i in range(4)]
+        series += [(290 + i * 5, 20.0) for i in range(30)]
+
+        with patch.object(tasks.settings, "CLIP_TOP_K", 1):
+            result = tasks.ingest_retention_chunk_task(project_id, series, final=True)
+
+        assert (result["clips_added"], result["clips_trimmed"]) == (2, 1)
+        assert result["status"] == "clips_suggested"
+
+    def test_locks_project_row_while_ingesting(self, session_factory, approved_clip):
+        from sqlalchemy import event
+        from sqlalchemy.dialects import postgresql
+        project_id, _ = approved_clip
+        statements = []
+        event.listen(session_factory, "do_orm_execute",
+                     lambda state: statements.append(str(state.statement.compile(dialect=postgresql.dialect()))))
+
+        tasks.ingest_retention_chunk_task(project_id, [(0, 20.0)])
+
+        assert "FOR UPDATE" in statements[0] and "FROM projects" in statements[0]
+
+
+class TestSceneIndexTask:
+
+    @patch('app.workers.tasks.get_render_scheduler')
+    @patch('app.workers.tasks.build_scene_index', return_value=[12.4, 41.8, 95.0])
+    def test_snaps_only_pending_clips(self, mock_build, mock_scheduler, session_factory, approved_clip):
+        project_id, approved_id = approved_clip
+        db = session_factory()
+        pending = SuggestedClip(project_id=project_id, timestamp_inicio_segundos=11, timestamp_fim_segundos=40)
+        db.add(pending)
+        db.commit()
+        pending_id = pending.id
+        db.close()
+
+        result = tasks.build_scene_index_task(project_id)
+
+        assert result["snapped_clips"] == 1
+        db = session_factory()
+        snapped = db.get(SuggestedClip, pending_id)
+        assert (snapped.timestamp_inicio_segundos, snapped.timestamp_fim_segundos) == (13, 41)
+        approved = db.get(SuggestedClip, approved_id)
+        assert (approved.timestamp_inicio_segundos, approved.timestamp_fim_segundos) == (10, 40)
+        db.close()
+
+
+class TestLoudnessTrackTask:
+
+    @patch('app.workers.tasks.get_render_scheduler')
+    @patch('app.workers.tasks.build_loudness_track')
+    def test_rescores_only_pending_clips(self, mock_build, mock_scheduler, session_factory, approved_clip):
+        project_id, approved_id = approved_clip
+        db = session_factory()
+        db.get(Project, project_id).retention_data_json = [[t, 50.0] for t in range(0, 100, 5)]
+        quiet = SuggestedClip(project_id=project_id, timestamp_inicio_segundos=10, timestamp_fim_segundos=30, score_viralidade_inicial=50.0)
+        loud = SuggestedClip(project_id=project_id, timestamp_inicio_segundos=60, timestamp_fim_segundos=80, score_viralidade_inicial=50.0)
+        db.add_all([quiet, loud])
+        db.commit()
+        quiet_id, loud_id = quiet.id, loud.id
+        db.close()
+        mock_build.return_value = {"loudness": [-30.0] * 50 + [-12.0] * 50, "true_peak": [-6.0] * 100}
+
+        result = tasks.build_loudness_track_task(project_id)
+
+        assert result["rescored_clips"] == 2
+        db = session_factory()
+        assert db.get(SuggestedClip, loud_id).score_viralidade_inicial > db.get(SuggestedClip, quiet_id).score_viralidade_inicial
+        assert db.get(SuggestedClip, approved_id).score_viralidade_inicial is None
+        db.close()
+
+
+class TestAutoRender:
+
+    @pytest.fixture
+    def auto_project(self, session_factory, approved_clip):
+        project_id, approved_id = approved_clip
+        db = session_factory()
+        project = db.get(Project, project_id)
+        project.auto_render_top_n = 2
+        project.original_video_path = "/media/original_video.mp4"
+        clips = [
+            SuggestedClip(project_id=project_id, timestamp_inicio_segundos=60, timestamp_fim_segundos=80, score_viralidade_inicial=40.0),
+            SuggestedClip(project_id=project_id, timestamp_inicio_segundos=100, timestamp_fim_segundos=130, score_viralidade_inicial=90.0),
+            SuggestedClip(project_id=project_id, timestamp_inicio_segundos=150, timestamp_fim_segundos=170, score_viralidade_inicial=70.0),
+            SuggestedClip(project_id=project_id, timestamp_inicio_segundos=200, timestamp_fim_segundos=230, score_viralidade_inicial=99.0,
+                          status_aprovacao="rejected"),
+        ]
+        db.add_all(clips)
+        db.commit()
+        ids = project_id, [clip.id for clip in clips]
+        db.close()
+        return ids
+
+    @patch('app.workers.tasks.chord')
+    def test_finalizer_chains_auto_render_after_source_analyses(self, mock_chord, session_factory, auto_project):
+        project_id, _ = auto_project
+
+        tasks.finalize_project_pipeline_task([{"project_id": project_id}, {"project_id": project_id}])
+
+        header, body = mock_chord.call_args.args
+        assert [signature.task for signature in header] == [
+            "app.workers.tasks.build_scene_index_task", "app.workers.tasks.build_loudness_track_task"
+        ]
+        assert body.task == "app.workers.tasks.auto_render_project_clips_task"
+        mock_chord.return_value.delay.assert_called_once()
+
+    @patch('app.workers.tasks.chord')
+    def test_fans_out_top_n_clips_once(self, mock_chord, session_factory, auto_project):
+        project_id, (_, best, second, _) = auto_project
+
+        first = tasks.auto_render_project_clips_task(project_id)
+        again = tasks.auto_render_project_clips_task(project_id)
+
+        assert first["dispatched_clip_ids"] == [best, second] # A rejeitada fica de fora mesmo com o maior score
+        assert again["dispatched_clip_ids"] # O aprovado ainda não enfileirado sobra para a segunda rodada
+        assert not set(again["dispatched_clip_ids"]) & {best, second}
+        header, callback = mock_chord.call_args_list[0].args
+        assert [signature.args for signature in header] == [(best,), (second,)]
+        assert all(signature.kwargs["auto_render"] for signature in header)
+        assert callback.task == "app.workers.tasks.mark_project_clips_rendered_task"
+        db = session_factory()
+        assert db.get(Project, project_id).status == "rendering_clips"
+        db.close()
+
+    @patch('app.workers.tasks.chord')
+    @patch('app.workers.tasks.get_render_scheduler')
+    @patch('app.workers.tasks.build_loudness_track', return_value={"loudness": [-14.0] * 300, "true_peak": [-3.0] * 300})
+    @patch('app.workers.tasks.build_scene_index', side_effect=Exception("ffmpeg exited with code 1"))
+    def test_failed_source_analysis_still_renders(self, mock_scene_index, mock_loudness, mock_scheduler, mock_chord,
+                                                  session_factory, auto_project):
+        project_id, (_, best, second, _) = auto_project
+
+        # Cabeçalho do chord: uma análise falha, a outra termina; nenhuma levanta exceção
+        header_results = [tasks.build_scene_index_task(project_id), tasks.build_loudness_track_task(project_id)]
+        assert header_results[0] == {"project_id": project_id, "status": "failed",
+                                     "error": "ffmpeg exited with code 1", "scene_cuts": None}
+        assert header_results[1]["seconds"] == 300
+
+        rendered = tasks.auto_render_project_clips_task(project_id)
+        assert set(rendered["dispatched_clip_ids"]) == {best, second}
+        db = session_factory()
+        clip = db.get(SuggestedClip, best)
+        assert (clip.timestamp_inicio_segundos, clip.timestamp_fim_segundos) == (100, 130) # Sem ajuste de corte
+        db.close()
+
+    @patch('app.workers.tasks.get_render_scheduler')
+    @patch('app.workers.tasks.ensure_clip_segments')
+    @patch('app.workers.tasks.process_clip', side_effect=Exception("ffmpeg failed"))
+    def test_failed_preview_does_not_break_the_chord(self, mock_process_clip, mock_segments, mock_scheduler,
+                                                     session_factory, auto_project):
+        project_id, (_, best, _, _) = auto_project
+
+        result = tasks.process_video_clip_task(best, auto_render=True)
+
+        assert result == {"clip_id": best, "status": "processing_failed", "error": "ffmpeg failed"}
+        mock_process_clip.assert_called_once()
+
+        callback = tasks.mark_project_clips_rendered_task([result, {"clip_id": 1, "status": "processing_complete"}], project_id)
+        assert callback["status"] == "clips_rendered"
+        assert callback["failed_clip_ids"] == [best]
+
+
+class TestPublicationSchedulerTask:
+
+    @patch('app.workers.tasks.settings')
+    @patch('app.workers.tasks.publish_publications_batch_task.apply_async')
+    def test_dispatches_due_publications_with_eta(self, mock_apply_async, mock_settings, session_factory, approved_clip):
+        from datetime import datetime, timedelta
+        from app.db.models import ScheduledPublication
+        mock_settings.PUBLICATION_SCHEDULER_LOOKAHEAD_SECONDS = 60
+        mock_settings.PUBLICATION_SCHEDULER_BATCH_SIZE = 2
+        mock_settings.PUBLICATION_ETA_BUCKET_SECONDS = 3600
+        mock_settings.PUBLICATION_QUEUED_STALE_SECONDS = 900
+        mock_settings.PUBLISH_MAX_CONCURRENT_UPLOADS = 10
+        _, clip_id = approved_clip
+        db = session_factory()
+        due = datetime.utcnow() - timedelta(minutes=1)
+        for scheduled_at in (due, due, due, datetime.utcnow() + timedelta(days=1)):
+            db.add(ScheduledPublication(suggested_clip_id=clip_id, plataforma_destino="youtube_shorts", data_agendamento=scheduled_at))
+        db.commit()
+        db.close()
+
+        result = tasks.schedule_due_publications_task()
+
+        assert result["dispatched"] == 3 # Duas rodadas de SELECT (lote de 2)
+        dispatched_ids = [i for call in mock_apply_async.call_args_list for i in call.kwargs["args"][0]]
+        assert sorted(dispatched_ids) == [1, 2, 3]
+        assert all(call.kwargs["eta"] == due for call in mock_apply_async.call_args_list)
+
+    @patch('app.workers.tasks.settings')
+    @patch('app.workers.tasks.publish_publications_batch_task.apply_async')
+    def test_redispatches_publication_stuck_in_queued(self, mock_apply_async, mock_settings, session_factory, approved_clip):
+        from datetime import datetime, timedelta
+        from app.db.models import ScheduledPublication
+        mock_settings.PUBLICATION_SCHEDULER_LOOKAHEAD_SECONDS = 60
+        mock_settings.PUBLICATION_SCHEDULER_BATCH_SIZE = 10
+        mock_settings.PUBLICATION_ETA_BUCKET_SECONDS = 10
+        mock_settings.PUBLICATION_QUEUED_STALE_SECONDS = 900
+        _, clip_id = approved_clip
+        db = session_factory()
+        long_ago = datetime.utcnow() - timedelta(hours=2)
+        db.add(ScheduledPublication(suggested_clip_id=clip_id, plataforma_destino="youtube_shorts", data_agendamento=long_ago,
+                                    status_publicacao="queued", updated_at=long_ago))
+        db.commit()
+        db.close()
+
+        result = tasks.schedule_due_publications_task()
+
+        assert (result["requeued"], result["dispatched"]) == (1, 1)
+        assert mock_apply_async.call_args.kwargs["args"][0] == [1]
+
+
+class TestStageEvents:
+
+    def test_download_records_stage_event_with_bytes(self, session_factory, approved_clip, tmp_path):
+        from app.db.models import StageEvent
+        project_id, _ = approved_clip
+        source = tmp_path / "original_video.mp4"
+        source.write_bytes(b"x" * 2048)
+
+        with patch('app.workers.tasks.download_video', return_value=(str(source), 300)):
+            tasks.download_youtube_video_task(project_id, "https://youtu.be/dQw4w9WgXcQ")
+
+        db = session_factory()
+        event = db.query(StageEvent).filter(StageEvent.stage == "download").one()
+        assert (event.project_id, event.status, event.bytes_transferred) == (project_id, "ok", 2048)
+        db.close()
+
+    @patch('app.workers.tasks.process_clip', side_effect=Exception("ffmpeg failed"))
+    def test_failed_render_records_failed_span(self, mock_process_clip, session_factory, approved_clip):
+        from app.db.models import StageEvent
+        project_id, clip_id = approved_clip
+        db = session_factory()
+        db.get(Project, project_id).original_video_path = "/media/original_video.mp4"
+        db.commit()
+        db.close()
+
+        with pytest.raises(Exception):
+            tasks.process_video_clip_task(clip_id)
+
+        db = session_factory()
+        event = db.query(StageEvent).filter(StageEvent.stage == "render").one()
+        assert (event.clip_id, event.status) == (clip_id, "failed")
+        db.close()
+
+
+class TestReanalysis:
+
+    @patch('app.workers.tasks.YouTubeAnalyzerService')
+    def test_reanalysis_replaces_pending_suggestions_only(self, mock_analyzer_cls, session_factory, approved_clip):
+        project_id, clip_id = approved_clip
+        analyzer = mock_analyzer_cls.return_value
+        analyzer.get_cached_audience_retention_data.return_value = [(t, 50.0) for t in range(0, 300, 5)]
+        payload = {"project_id": project_id, "youtube_url": "u", "duration_seconds": 300}
+
+        with patch('app.workers.tasks.rank_clip_candidates', return_value=[(12, 42, 0.9), (100, 130, 0.8), (200, 230, 0.7)]):
+            first = tasks.analyze_retention_task(payload)
+        with patch('app.workers.tasks.rank_clip_candidates', return_value=[(12, 42, 0.9), (101, 131, 0.8)]):
+            second = tasks.analyze_retention_task(payload)
+
+        assert (first["status"], first["clips_added"]) == ("clips_suggested", 2) # 12-42 é o clipe aprovado
+        assert (second["clips_added"], second["clips_removed"]) == (0, 1)
+        db = session_factory()
+        clips = db.query(SuggestedClip).filter(SuggestedClip.project_id == project_id).order_by(SuggestedClip.timestamp_inicio_segundos).all()
+        assert [(c.id == clip_id, c.timestamp_inicio_segundos, c.status_aprovacao) for c in clips] == [
+            (True, 10, "approved"), (False, 100, "pending")
+        ]
+        db.close()
@@ -0,0 +1,27 @@
+from app.workers import tasks
+
+
+class TestTaskRouting:
+
+    def test_every_task_has_a_queue(self):
+        registered = {name for name in tasks.celery_app.tasks if name.startswith("app.workers.tasks.")}
+        assert registered == set(tasks.TASK_QUEUES)
+
+    def test_workloads_are_separated(self):
+        routes = tasks.celery_app.conf.task_routes
+        assert routes["app.workers.tasks.process_video_clip_task"] == {"queue": tasks.QUEUE_RENDER}
+        assert routes["app.workers.tasks.download_youtube_video_task"] == {"queue": tasks.QUEUE_DOWNLOADS}
+        assert routes["app.workers.tasks.analyze_retention_task"] == {"queue": tasks.QUEUE_ANALYSIS}
+        assert routes["app.workers.tasks.publish_publications_batch_task"] == {"queue": tasks.QUEUE_PUBLISH}
+
+    def test_source_store_gc_runs_periodically(self):
+        schedule = tasks.celery_app.conf.beat_schedule["collect-unreferenced-sources"]
+        assert schedule["task"] == "app.workers.tasks.collect_unreferenced_sources_task"
+        assert schedule["task"] in tasks.celery_app.tasks
+        assert schedule["schedule"] == float(tasks.settings.SOURCE_STORE_GC_INTERVAL_SECONDS)
+
+    def test_long_tasks_ack_late_but_publish_does_not(self):
+        assert tasks.celery_app.conf.task_acks_late is True
+        assert tasks.celery_app.conf.worker_prefetch_multiplier == 1
+        assert tasks.process_video_clip_task.acks_late is True
+        assert tasks.publish_publications_batch_task.acks_late is False
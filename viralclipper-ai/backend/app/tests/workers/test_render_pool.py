@@ -0,0 +1,87 @@
+import threading
+import time
+import pytest
+from app.workers.render_pool import RenderScheduler, cgroup_cpu_quota, available_cpus, with_thread_budget
+
+
+class TestCpuDetection:
+
+    def test_cgroup_v2_quota(self, tmp_path):
+        (tmp_path / "cpu.max").write_text("250000 100000\n")
+        assert cgroup_cpu_quota(tmp_path) == 2.5
+
+    def test_cgroup_v2_unlimited(self, tmp_path):
+        (tmp_path / "cpu.max").write_text("max 100000\n")
+        assert cgroup_cpu_quota(tmp_path) is None
+
+    def test_cgroup_v1_quota(self, tmp_path):
+        (tmp_path / "cpu").mkdir()
+        (tmp_path / "cpu" / "cpu.cfs_quota_us").write_text("200000")
+        (tmp_path / "cpu" / "cpu.cfs_period_us").write_text("100000")
+        assert cgroup_cpu_quota(tmp_path) == 2.0
+
+    def test_available_cpus_capped_by_quota(self, tmp_path):
+        (tmp_path / "cpu.max").write_text("100000 100000\n")
+        assert available_cpus(tmp_path) == 1
+
+
+class TestRenderScheduler:
+
+    def test_thread_budget_is_applied_to_inputs_and_outputs(self):
+        command = ['ffmpeg', '-ss', '10', '-i', 'in.mp4', '-t', '5', '-vf', 'scale=720:-2',
+                   '-c:a', 'aac', '-strict', '-2', '-y', 'out.mp4']
+        budgeted = with_thread_budget(command, 3)
+
+        assert budgeted[:5] == ['ffmpeg', '-filter_threads', '3', '-filter_complex_threads', '3']
+        assert budgeted[budgeted.index('-i') - 2:budgeted.index('-i')] == ['-threads', '3']
+        assert budgeted[-3:] == ['-threads', '3', 'out.mp4']
+        # Option values that look like flags are left untouched
+        assert budgeted[budgeted.index('-strict') + 1] == '-2'
+
+    @pytest.mark.parametrize("flags", [['-an'], ['-vn'], ['-sn', '-dn'], ['-an', '-sn', '-dn'], ['-re', '-vn']])
+    def test_stream_disable_flags_take_no_value(self, flags):
+        command = ['ffmpeg', '-i', 'in.mp4', *flags, '-vf', 'scale=320:-2', '-f', 'null', '-']
+        budgeted = with_thread_budget(command, 2)
+
+        assert budgeted[budgeted.index('-vf') + 1] == 'scale=320:-2'
+        assert budgeted[budgeted.index(flags[-1]) + 1] == '-vf'
+        assert budgeted[-3:] == ['-threads', '2', '-'] # Saída "-" também recebe o orçamento
+
+    def test_stream_specifiers_and_multiple_outputs(self):
+        command = ['ffmpeg', '-i', 'in.mp4', '-map', '[v0]', '-c:v', 'libx264', '-profile:v', 'high', 'a.mp4',
+                   '-map', '[v1]', '-b:a', '128k', 'b.mp4']
+        budgeted = with_thread_budget(command, 2)
+
+        assert budgeted.count('-threads') == 3 # Entrada + duas saídas
+        assert budgeted[budgeted.index('-profile:v') + 1] == 'high'
+        assert budgeted[budgeted.index('a.mp4') - 2:budgeted.index('a.mp4')] == ['-threads', '2']
+
+    def test_sizing_from_cores(self):
+        scheduler = RenderScheduler(cpus=8, runner=lambda command: None)
+        assert scheduler.max_jobs * scheduler.threads_per_job <= 8
+        assert scheduler.max_jobs >= 1
+
+    def test_concurrent_jobs_never_exceed_pool_size(self):
+        running = 0
+        peak = 0
+        lock = threading.Lock()
+
+        def fake_runner(command):
+            nonlocal running, peak
+            with lock:
+                running += 1
+                peak = max(peak, running)
+            time.sleep(0.02)
+            with lock:
+                running -= 1
+
+        scheduler = RenderScheduler(cpus=4, max_jobs=2, runner=fake_runner)
+        # Simulates six worker threads (celery -P threads) rendering at the same time
+        threads = [threading.Thread(target=scheduler.run, args=(['ffmpeg', '-i', 'in.mp4', f'out_{i}.mp4'],)) for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert peak == 2
+        assert scheduler.threads_per_job == 2
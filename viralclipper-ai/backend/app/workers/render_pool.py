@@ -0,0 +1,135 @@
+import math
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional
+from app.core.config import settings
+from app.services.video_processor import run_ffmpeg_command
+
+CGROUP_ROOT = Path("/sys/fs/cgroup")
+
+# Opções do ffmpeg que consomem o argumento seguinte, sem o especificador de stream
+# ("-c:a" -> "-c"). Qualquer outra opção é tratada como booleana (-y, -an, -vn, -sn, -dn, -re...).
+# Uma opção nova com valor usada num comando precisa entrar aqui, senão o valor vira "saída".
+FFMPEG_VALUE_OPTIONS = {
+    "-ss", "-sseof", "-t", "-to", "-itsoffset", "-stream_loop", "-f", "-fs",
+    "-c", "-codec", "-vcodec", "-acodec", "-scodec", "-tag", "-bsf",
+    "-b", "-crf", "-q", "-qscale", "-preset", "-tune", "-profile", "-level", "-pix_fmt", "-g",
+    "-maxrate", "-bufsize", "-x264-params", "-x264opts", "-r", "-s", "-aspect", "-ar", "-ac",
+    "-vf", "-af", "-filter", "-filter_complex", "-lavfi", "-filter_script", "-filter_complex_script",
+    "-map", "-map_metadata", "-map_chapters", "-metadata", "-disposition", "-frames", "-vframes", "-aframes",
+    "-strict", "-avoid_negative_ts", "-movflags", "-fflags", "-vsync", "-fps_mode", "-video_track_timescale",
+    "-max_muxing_queue_size", "-safe", "-progress", "-v", "-loglevel", "-threads",
+    "-filter_threads", "-filter_complex_threads", "-timecode",
+}
+
+
+def takes_value(option: str) -> bool:
+    return option.split(":", 1)[0] in FFMPEG_VALUE_OPTIONS
+
+
+def cgroup_cpu_quota(cgroup_root: Path = CGROUP_ROOT) -> Optional[float]:
+    """Returns the CPU quota of the container in cores, or None when unlimited."""
+    cpu_max = cgroup_root / "cpu.max" # cgroup v2: "<quota> <period>" ou "max <period>"
+    if cpu_max.exists():
+        quota, _, period = cpu_max.read_text().strip().partition(" ")
+        if quota != "max" and period:
+            return int(quota) / int(period)
+        return None
+
+    quota_file = cgroup_root / "cpu" / "cpu.cfs_quota_us" # cgroup v1
+    period_file = cgroup_root / "cpu" / "cpu.cfs_period_us"
+    if quota_file.exists() and period_file.exists():
+        quota = int(quota_file.read_text().strip())
+        period = int(period_file.read_text().strip())
+        if quota > 0 and period > 0:
+            return quota / period
+    return None
+
+
+def available_cpus(cgroup_root: Path = CGROUP_ROOT) -> int:
+    """Cores this process may actually use: CPU affinity capped by the cgroup quota."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    quota = cgroup_cpu_quota(cgroup_root)
+    if quota:
+        cpus = min(cpus, math.ceil(quota))
+    return max(1, cpus)
+
+
+def with_thread_budget(command: list[str], threads: int) -> list[str]:
+    """
+    Adds explicit thread limits to an ffmpeg command.
+
+    `-filter_threads`/`-filter_complex_threads` are global, and `-threads` is inserted
+    before every input (decoder threads) and every output file (encoder threads).
+    """
+    budget = str(threads)
+    budgeted = [command[0], '-filter_threads', budget, '-filter_complex_threads', budget]
+    i = 1
+    while i < len(command):
+        arg = command[i]
+        if arg == '-i':
+            budgeted += ['-threads', budget, arg, command[i + 1]]
+            i += 2
+        elif arg != '-' and arg.startswith('-') and takes_value(arg):
+            budgeted += command[i:i + 2]
+            i += 2
+        elif arg != '-' and arg.startswith('-'):
+            budgeted.append(arg)
+            i += 1
+        else:
+            # Argumento posicional: arquivo de saída ("-" = stdout, ex: "-f null -")
+            budgeted += ['-threads', budget, arg]
+            i += 1
+    return budgeted
+
+
+class RenderScheduler:
+    """
+    Bounds the number of concurrent ffmpeg processes in a worker and gives each one
+    an explicit thread budget, so raising worker concurrency never oversubscribes cores.
+
+    Jobs beyond `max_jobs` wait (FIFO on the semaphore) until a slot frees up.
+    """
+
+    def __init__(self, cpus: Optional[int] = None, max_jobs: Optional[int] = None,
+                 threads_per_job: Optional[int] = None,
+                 runner: Callable[..., None] = run_ffmpeg_command):
+        self.cpus = cpus or available_cpus()
+        self.max_jobs = max_jobs or settings.RENDER_MAX_CONCURRENT_JOBS or max(1, self.cpus // settings.RENDER_THREADS_PER_JOB)
+        self.threads_per_job = threads_per_job or max(1, self.cpus // self.max_jobs)
+        self._runner = runner
+        self._slots = threading.BoundedSemaphore(self.max_jobs)
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def run(self, command: list[str], *args, **kwargs):
+        """Runs an ffmpeg command once a render slot is free (blocking)."""
+        with self._slots:
+            return self._runner(with_thread_budget(command, self.threads_per_job), *args, **kwargs)
+
+    def submit(self, command: list[str], *args, **kwargs) -> Future:
+        """Queues an ffmpeg command and returns a Future for its completion."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_jobs, thread_name_prefix="render")
+        return self._executor.submit(self.run, command, *args, **kwargs)
+
+    def __repr__(self):
+        return f"RenderScheduler(cpus={self.cpus}, max_jobs={self.max_jobs}, threads_per_job={self.threads_per_job})"
+
+
+_scheduler: Optional[RenderScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_render_scheduler() -> RenderScheduler:
+    """Process-wide scheduler shared by every task running in this worker."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RenderScheduler()
+            print(f"Render scheduler initialised: {_scheduler}")
+        return _scheduler
@@ -1,34 +1,191 @@
-from celery import Celery
+import heapq
+import json
+from datetime import datetime
+from pathlib import Path
 from typing import Optional # Add Optional
+from celery import Celery, chord
+from celery.signals import before_task_publish, worker_process_shutdown
 from app.core.config import settings
 from app.db.database import SessionLocal
 from app.db import models # Import models
-from app.services.video_downloader import download_video
-from app.services.youtube_analyzer import YouTubeAnalyzerService
-from app.services.video_processor import process_clip
+from app.services.video_downloader import download_video, fetch_video_metadata, download_video_segments, ensure_clip_segments, pad_and_merge_ranges, resolve_video_format
+from app.services.youtube_analyzer import (
+    YouTubeAnalyzerService, StreamingPeakDetector, CLIP_MIN_DURATION_SECONDS
+)
+from app.services.video_processor import process_clip, process_project_clips, RENDER_MODE_VERTICAL
 from app.services.youtube_publisher import YouTubePublishingService # Adicionar
-import json
+from app.services.task_leases import render_lease_key, render_params_hash, acquire_lease, complete_lease, fail_lease, new_owner
+from app.services.publication_scheduler import claim_due_publications, requeue_stale_publications, bucket_by_eta, scheduler_horizon
+from app.services.clip_scoring import rank_clip_candidates, score_clip_candidates
+from app.services.clip_suggestions import sync_suggested_clips
+from app.services.retention_store import append_retention_chunk, load_retention_since, retention_series, consolidate_retention_chunks
+from app.services.audio_analysis import build_loudness_track
+from app.services.scene_index import build_scene_index, snap_clip_bounds
+from app.services.source_store import collect_unreferenced_sources
+from app.services.stage_metrics import StageSpan, stamp_enqueue_time, mark_process_dead, task_enqueued_at
+from app.workers.render_pool import get_render_scheduler
 
 celery_app = Celery(
     "tasks",
     broker=settings.CELERY_BROKER_URL,
     backend=settings.CELERY_RESULT_BACKEND
 )
+# Filas por classe de carga; cada uma tem seu serviço de worker no docker-compose:
+# downloads (I/O: yt-dlp), render (CPU: ffmpeg), analysis (tarefas curtas), publish (rede: upload)
+QUEUE_DOWNLOADS = "downloads"
+QUEUE_RENDER = "render"
+QUEUE_ANALYSIS = "analysis"
+QUEUE_PUBLISH = "publish"
+
+TASK_QUEUES = {
+    "app.workers.tasks.fetch_video_metadata_task": QUEUE_DOWNLOADS,
+    "app.workers.tasks.download_youtube_video_task": QUEUE_DOWNLOADS,
+    "app.workers.tasks.download_clip_segments_task": QUEUE_DOWNLOADS,
+    "app.workers.tasks.process_video_clip_task": QUEUE_RENDER,
+    "app.workers.tasks.process_project_clips_task": QUEUE_RENDER,
+    "app.workers.tasks.build_scene_index_task": QUEUE_RENDER, # Decodifica o vídeo inteiro com ffmpeg
+    "app.workers.tasks.build_loudness_track_task": QUEUE_RENDER,
+    "app.workers.tasks.analyze_retention_task": QUEUE_ANALYSIS,
+    "app.workers.tasks.ingest_retention_chunk_task": QUEUE_ANALYSIS,
+    "app.workers.tasks.finalize_project_pipeline_task": QUEUE_ANALYSIS,
+    "app.workers.tasks.auto_render_project_clips_task": QUEUE_ANALYSIS,
+    "app.workers.tasks.mark_project_clips_rendered_task": QUEUE_ANALYSIS,
+    "app.workers.tasks.collect_unreferenced_sources_task": QUEUE_ANALYSIS,
+    "app.workers.tasks.schedule_due_publications_task": QUEUE_ANALYSIS,
+    "app.workers.tasks.publish_publications_batch_task": QUEUE_PUBLISH,
+}
+
 celery_app.conf.update(
     task_serializer="json",
     accept_content=["json"],
     result_serializer="json",
     timezone="UTC",
     enable_utc=True,
+    task_routes={name: {"queue": queue} for name, queue in TASK_QUEUES.items()},
+    task_default_queue=QUEUE_ANALYSIS, # Tarefas sem rota são as leves
+    # Tarefas longas: confirmar só ao terminar (um worker que morre devolve a mensagem à fila)
+    # e não reservar mensagens extras, que ficariam presas atrás de um render de minutos
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+    worker_prefetch_multiplier=1,
 )
+celery_app.conf.beat_schedule = {
+    "schedule-due-publications": {
+        "task": "app.workers.tasks.schedule_due_publications_task",
+        "schedule": float(settings.PUBLICATION_SCHEDULER_INTERVAL_SECONDS),
+    },
+    "collect-unreferenced-sources": {
+        "task": "app.workers.tasks.collect_unreferenced_sources_task",
+        "schedule": float(settings.SOURCE_STORE_GC_INTERVAL_SECONDS),
+    },
+}
+
+
+@before_task_publish.connect
+def _stamp_enqueue_time(headers=None, **kwargs):
+    # Tempo de fila das métricas de estágio (vale também para mensagens publicadas pela API)
+    if headers is not None:
+        stamp_enqueue_time(headers)
+
+@worker_process_shutdown.connect
+def _mark_metrics_process_dead(pid=None, **kwargs):
+    if pid:
+        mark_process_dead(pid)
+
+# Status que a análise de retenção (rodando em paralelo ao download) não deve sobrescrever
+PIPELINE_FAILED_STATUSES = ("download_failed", "metadata_failed")
+
+
+def _source_ready(project: models.Project) -> bool:
+    """True once the project's media can be rendered: full download done or segments strategy set up."""
+    return bool(project.original_video_path) or project.source_segments_json is not None
+
+
+def _claim_waiting_clip(db, clip_id: int) -> bool:
+    """Atomically moves a clip out of waiting_for_source; only one caller gets True."""
+    claimed = db.query(models.SuggestedClip).filter(
+        models.SuggestedClip.id == clip_id,
+        models.SuggestedClip.processing_status == "waiting_for_source"
+    ).update({"processing_status": "processing_queued"}, synchronize_session=False)
+    db.commit()
+    return claimed == 1
+
+
+def dispatch_clips_waiting_for_source(project_id: int, db) -> list[int]:
+    """Queues the render of every clip approved while the project's source was still downloading."""
+    waiting = db.query(models.SuggestedClip).filter(
+        models.SuggestedClip.project_id == project_id,
+        models.SuggestedClip.processing_status == "waiting_for_source"
+    ).all()
+    dispatched = []
+    for clip in waiting:
+        render_mode = clip.requested_render_mode or RENDER_MODE_VERTICAL
+        if _claim_waiting_clip(db, clip.id):
+            process_video_clip_task.delay(clip.id, render_mode=render_mode)
+            dispatched.append(clip.id)
+    if dispatched:
+        print(f"Project {project_id}: source ready, dispatched waiting clips {dispatched}")
+    return dispatched
+
+
+def fail_clips_waiting_for_source(project_id: int, db, error: str):
+    db.query(models.SuggestedClip).filter(
+        models.SuggestedClip.project_id == project_id,
+        models.SuggestedClip.processing_status == "waiting_for_source"
+    ).update({"processing_status": "processing_failed", "processing_error_detail": f"Source download failed: {error}"},
+             synchronize_session=False)
+    db.commit()
+
+
+def dispatch_source_analyses(project: models.Project):
+    """
+    Starts the one-time analyses of a freshly available source (scene index, loudness
+    track). In auto mode the top-N render fan-out is chained after both, so previews
+    are rendered with the snapped bounds and loudnorm of the final render. Both tasks
+    return a "failed" result instead of raising, so a failed analysis never keeps the
+    chord body from rendering.
+    """
+    if project.auto_render_top_n:
+        chord(
+            [build_scene_index_task.si(project.id), build_loudness_track_task.si(project.id)],
+            auto_render_project_clips_task.si(project.id)
+        ).delay()
+    else:
+        build_scene_index_task.delay(project.id)
+        build_loudness_track_task.delay(project.id)
+
+
+def claim_clips_for_auto_render(db, project_id: int, top_n: int) -> list[int]:
+    """
+    Picks the top_n best-scored suggestions never queued for render (not rejected) and
+    atomically marks them processing_queued; a concurrent dispatch never claims the same clip.
+    """
+    candidates = db.query(models.SuggestedClip).filter(
+        models.SuggestedClip.project_id == project_id,
+        models.SuggestedClip.status_aprovacao != "rejected",
+        models.SuggestedClip.processing_status.is_(None)
+    ).all()
+    best = heapq.nlargest(top_n, candidates, key=lambda clip: (clip.score_viralidade_inicial or 0.0, -clip.id))
+    claimed = []
+    for clip in best:
+        updated = db.query(models.SuggestedClip).filter(
+            models.SuggestedClip.id == clip.id,
+            models.SuggestedClip.processing_status.is_(None)
+        ).update({"processing_status": "processing_queued"}, synchronize_session=False)
+        if updated == 1:
+            claimed.append(clip.id)
+    db.commit()
+    return claimed
 
 @celery_app.task(name="app.workers.tasks.download_youtube_video_task", bind=True, max_retries=3)
 def download_youtube_video_task(self, project_id: int, youtube_url: str):
     db = SessionLocal()
+    span = StageSpan("download", self, project_id=project_id)
     try:
         print(f"Starting download for project {project_id}, URL: {youtube_url}")
         downloaded_path, duration_seconds = download_video(youtube_url, project_id, db)
         print(f"Video for project {project_id} downloaded to: {downloaded_path}, Duration: {duration_seconds}s")
+        span.bytes_transferred = Path(downloaded_path).stat().st_size
 
         # Return data for the next task in the chain
         return {
@@ -37,6 +194,7 @@ def download_youtube_video_task(self, project_id: int, youtube_url: str):
             "duration_seconds": duration_seconds
         }
     except Exception as e:
+        span.fail()
         print(f"Download failed for project {project_id}: {e}")
         # self.retry(exc=e, countdown=60) # Example of retry
         project = db.query(models.Project).filter(models.Project.id == project_id).first()
@@ -44,12 +202,103 @@ def download_youtube_video_task(self, project_id: int, youtube_url: str):
             project.status = "download_failed"
             project.processing_error = str(e)
             db.commit()
+        fail_clips_waiting_for_source(project_id, db, str(e)) # O chord não chega ao finalizador
         raise
     finally:
+        span.finish(SessionLocal)
+        db.close()
+
+@celery_app.task(name="app.workers.tasks.collect_unreferenced_sources_task")
+def collect_unreferenced_sources_task():
+    db = SessionLocal()
+    try:
+        deleted = collect_unreferenced_sources(db)
+        return {"deleted_sources": len(deleted)}
+    finally:
+        db.close()
+
+@celery_app.task(name="app.workers.tasks.fetch_video_metadata_task", bind=True, max_retries=3)
+def fetch_video_metadata_task(self, project_id: int, youtube_url: str):
+    db = SessionLocal()
+    span = StageSpan("metadata", self, project_id=project_id)
+    try:
+        print(f"Fetching metadata for project {project_id}, URL: {youtube_url}")
+        info_dict = fetch_video_metadata(youtube_url)
+        duration = info_dict.get('duration')
+        duration_seconds = int(duration) if duration else None
+
+        project = db.query(models.Project).filter(models.Project.id == project_id).first()
+        if project:
+            project.duracao_video_original_segundos = duration_seconds
+            project.source_format = resolve_video_format(info_dict)
+            project.status = "metadata_fetched"
+            db.commit()
+
+        # Mesmo formato de retorno de download_youtube_video_task, para encadear analyze_retention_task
+        return {
+            "project_id": project_id,
+            "youtube_url": youtube_url,
+            "duration_seconds": duration_seconds
+        }
+    except Exception as e:
+        span.fail()
+        print(f"Metadata fetch failed for project {project_id}: {e}")
+        project = db.query(models.Project).filter(models.Project.id == project_id).first()
+        if project:
+            project.status = "metadata_failed"
+            project.processing_error = str(e)
+            db.commit()
+        raise
+    finally:
+        span.finish(SessionLocal)
+        db.close()
+
+@celery_app.task(name="app.workers.tasks.download_clip_segments_task", bind=True, max_retries=3)
+def download_clip_segments_task(self, analysis_result: dict):
+    project_id = analysis_result["project_id"]
+    db = SessionLocal()
+    span = StageSpan("download_segments", self, project_id=project_id)
+    try:
+        project = db.query(models.Project).filter(models.Project.id == project_id).first()
+        if not project:
+            return {"project_id": project_id, "status": "project_not_found"}
+
+        clips = db.query(models.SuggestedClip).filter(
+            models.SuggestedClip.project_id == project_id,
+            models.SuggestedClip.status_aprovacao != "rejected"
+        ).all()
+        if not clips:
+            print(f"Project {project_id} has no suggested clips; no segments to download.")
+            return {"project_id": project_id, "status": project.status, "segments": 0}
+
+        ranges = pad_and_merge_ranges(
+            [(clip.timestamp_inicio_segundos, clip.timestamp_fim_segundos) for clip in clips],
+            settings.SEGMENT_PADDING_SECONDS,
+            project.duracao_video_original_segundos,
+        )
+        print(f"Downloading {len(ranges)} segments for project {project_id}: {ranges}")
+        previous_paths = {segment["path"] for segment in project.source_segments_json or []}
+        segments = download_video_segments(project.youtube_url, project_id, ranges, db)
+        span.bytes_transferred = sum(Path(segment["path"]).stat().st_size for segment in segments
+                                     if segment["path"] not in previous_paths)
+
+        # Os clipes já sugeridos continuam disponíveis para aprovação
+        project.status = "clips_suggested"
+        db.commit()
+        dispatch_clips_waiting_for_source(project_id, db)
+        dispatch_source_analyses(project)
+        return {"project_id": project_id, "status": project.status, "segments": len(segments)}
+    except Exception as e:
+        span.fail()
+        print(f"Segment download failed for project {project_id}: {e}")
+        fail_clips_waiting_for_source(project_id, db, str(e))
+        raise
+    finally:
+        span.finish(SessionLocal)
         db.close()
 
 @celery_app.task(name="app.workers.tasks.process_video_clip_task", bind=True, max_retries=2) # Menos retries para tasks pesadas
-def process_video_clip_task(self, clip_id: int):
+def process_video_clip_task(self, clip_id: int, render_mode: str = RENDER_MODE_VERTICAL, auto_render: bool = False):
     db = SessionLocal()
     clip = db.query(models.SuggestedClip).filter(models.SuggestedClip.id == clip_id).first()
     if not clip:
@@ -57,75 +306,203 @@ def process_video_clip_task(self, clip_id: int):
         db.close() # Close session
         return {"clip_id": clip_id, "status": "clip_not_found"}
 
-    # Só processar se aprovado
-    if clip.status_aprovacao != "approved":
+    # Só processar se aprovado (no modo automático, sugestões pendentes viram previews)
+    if clip.status_aprovacao != "approved" and not (auto_render and clip.status_aprovacao == "pending"):
         print(f"Clip {clip_id} is not approved. Current status: {clip.status_aprovacao}. Skipping processing.")
         clip.processing_status = "skipped_not_approved"
         db.commit()
         db.close()
         return {"clip_id": clip_id, "status": "skipped_not_approved"}
 
+    if not _source_ready(clip.project):
+        # Download ainda em andamento (roda em paralelo à análise): o finalizador do pipeline despacha o clipe
+        clip.processing_status = "waiting_for_source"
+        clip.requested_render_mode = render_mode
+        db.commit()
+        # Re-checar após o commit: o download pode ter terminado entre a primeira leitura e o commit
+        if not _source_ready(clip.project) or not _claim_waiting_clip(db, clip_id):
+            print(f"Clip {clip_id} is waiting for the source video of project {clip.project_id}.")
+            db.close()
+            return {"clip_id": clip_id, "status": "waiting_for_source"}
+
+    # Uma lease por clip_{id}.mp4: nunca dois renders gravando o mesmo arquivo. Duplo clique ou redelivery
+    # com os mesmos parâmetros colapsa no render em andamento; com outros parâmetros (re-aprovação com novos
+    # limites) espera ele terminar. Renders já concluídos não bloqueiam um novo (o cache de render devolve o arquivo).
+    lease_key = render_lease_key(clip_id)
+    params_hash = render_params_hash(clip.timestamp_inicio_segundos, clip.timestamp_fim_segundos, render_mode)
+    lease_owner = self.request.id or new_owner()
+    lease = acquire_lease(db, lease_key, lease_owner, reuse_done=False, params_hash=params_hash)
+    if not lease.acquired:
+        db.close()
+        if lease.params_hash == params_hash:
+            print(f"Clip {clip_id} is already being rendered with these parameters by task {lease.owner}; skipping duplicate.")
+            return {"clip_id": clip_id, "status": "duplicate_in_flight", "lease_owner": lease.owner}
+        print(f"Clip {clip_id} is being rendered with other parameters by task {lease.owner}; retrying once it finishes.")
+        raise self.retry(countdown=settings.RENDER_LEASE_RETRY_SECONDS, max_retries=None) # Limitado pelo TTL da lease
+
+    span = StageSpan("render", self, project_id=clip.project_id, clip_id=clip_id)
     try:
-        print(f"Starting video processing for clip {clip_id}")
+        print(f"Starting video processing for clip {clip_id} (mode: {render_mode})")
         clip.processing_status = "processing_queued" # Ou diretamente "processing"
         db.commit() # Commit status antes de chamar a função síncrona longa
 
-        processed_path = process_clip(clip_id, db) # process_clip já faz commits de status interno
+        ensure_clip_segments(clip.project, [clip], db) # Só baixa algo se o clipe saiu dos segmentos existentes
+        processed_path = process_clip(clip_id, db, render_mode=render_mode, run_command=get_render_scheduler().run) # process_clip já faz commits de status interno
 
         print(f"Clip {clip_id} processed successfully. Output: {processed_path}")
-        return {"clip_id": clip_id, "status": "processing_complete", "path": processed_path}
+        span.media_seconds = clip.timestamp_fim_segundos - clip.timestamp_inicio_segundos
+        result = {"clip_id": clip_id, "status": "processing_complete", "path": processed_path}
+        complete_lease(db, lease_key, lease_owner, result)
+        return result
     except Exception as e:
         # The underlying process_clip service is responsible for setting the 'processing_failed' status in the DB.
         # This task's responsibility is to log the failure and re-raise the exception so Celery marks it as FAILED.
         print(f"Video processing task failed for clip {clip_id}: {e}")
+        if clip.processing_status != "processing_failed": # Falhou antes do process_clip (ex.: download do segmento)
+            clip.processing_status = "processing_failed"
+            clip.processing_error_detail = str(e)
+            db.commit()
+        span.fail()
+        fail_lease(db, lease_key, lease_owner) # A próxima submissão pode tentar de novo
+        if auto_render: # Parte de um chord: um preview com falha não pode impedir o callback do projeto
+            return {"clip_id": clip_id, "status": "processing_failed", "error": str(e)}
         raise # Re-raise to ensure Celery marks the task as FAILED.
     finally:
+        span.finish(SessionLocal)
         if db.is_active:
             db.close()
 
-@celery_app.task(name="app.workers.tasks.publish_scheduled_video_task", bind=True, max_retries=1)
-def publish_scheduled_video_task(self, publication_id: int):
+@celery_app.task(name="app.workers.tasks.process_project_clips_task", bind=True, max_retries=1)
+def process_project_clips_task(self, project_id: int):
     db = SessionLocal()
+    span = StageSpan("render_batch", self, project_id=project_id)
+    lease_owner = self.request.id or new_owner()
+    leased = [] # Clipes cuja lease de render este lote detém
     try:
-        print(f"Starting publication task for publication ID: {publication_id}")
-        publisher_service = YouTubePublishingService(db_session=db)
-        success = publisher_service.publish_short_to_youtube(publication_id)
+        print(f"Starting batch render of approved clips for project {project_id}")
+        project = db.query(models.Project).filter(models.Project.id == project_id).first()
+        if not project:
+            raise ValueError(f"Project with id {project_id} not found.")
+        approved_clips = [clip for clip in project.suggested_clips if clip.status_aprovacao == "approved"]
+        if not _source_ready(project):
+            for clip in approved_clips:
+                clip.processing_status = "waiting_for_source"
+                clip.requested_render_mode = RENDER_MODE_VERTICAL
+            db.commit()
+            print(f"Project {project_id} source not downloaded yet; {len(approved_clips)} clips wait for the pipeline.")
+            return {"project_id": project_id, "status": "waiting_for_source", "processed": 0, "failed_clip_ids": [], "skipped_clip_ids": []}
 
-        if success:
-            print(f"Publication {publication_id} processed successfully by task.")
-            return {"publication_id": publication_id, "status": "published"}
-        else:
-            # The service handles updating the DB status to 'failed'.
-            # We raise an exception to ensure the Celery task is marked as FAILED for monitoring.
-            publication = db.query(models.ScheduledPublication).filter(models.ScheduledPublication.id == publication_id).first()
-            error_message = f"Publication {publication_id} failed as indicated by the publishing service."
-            if publication and publication.publication_error:
-                error_message += f" Reason: {publication.publication_error}"
-            raise Exception(error_message)
+        # Mesma lease por clip_{id}.mp4 que process_video_clip_task: o lote nunca grava um arquivo
+        # que outro render está gravando. Com os mesmos parâmetros o clipe só sai do lote; com
+        # outros, vai para um render individual, que espera a lease ser liberada
+        skipped = []
+        for clip in approved_clips:
+            params_hash = render_params_hash(clip.timestamp_inicio_segundos, clip.timestamp_fim_segundos, RENDER_MODE_VERTICAL)
+            lease = acquire_lease(db, render_lease_key(clip.id), lease_owner, reuse_done=False, params_hash=params_hash)
+            if lease.acquired:
+                leased.append(clip)
+                continue
+            skipped.append(clip.id)
+            if lease.params_hash != params_hash:
+                process_video_clip_task.delay(clip.id, RENDER_MODE_VERTICAL)
+            print(f"Clip {clip.id} is being rendered by task {lease.owner}; left out of the batch.")
 
+        results = {}
+        if leased:
+            ensure_clip_segments(project, leased, db)
+            results = process_project_clips(project_id, db, run_command=get_render_scheduler().run,
+                                            clip_ids=[clip.id for clip in leased])
+        for clip in leased:
+            path = results.get(clip.id)
+            if path is None:
+                fail_lease(db, render_lease_key(clip.id), lease_owner)
+            else:
+                complete_lease(db, render_lease_key(clip.id), lease_owner,
+                               {"clip_id": clip.id, "status": "processing_complete", "path": path})
+        leased = []
+        failed = [clip_id for clip_id, path in results.items() if path is None]
+        span.media_seconds = sum(clip.timestamp_fim_segundos - clip.timestamp_inicio_segundos
+                                 for clip in db.query(models.SuggestedClip).filter(models.SuggestedClip.id.in_(
+                                     [clip_id for clip_id, path in results.items() if path is not None])))
+        print(f"Project {project_id} batch render finished: {len(results) - len(failed)} processed, {len(failed)} failed, "
+              f"{len(skipped)} already rendering elsewhere.")
+        return {"project_id": project_id, "status": "batch_processing_complete", "processed": len(results) - len(failed),
+                "failed_clip_ids": failed, "skipped_clip_ids": skipped}
     except Exception as e:
-        # The service or the logic above should handle DB state.
-        # We just log and re-raise to ensure Celery marks the task as failed.
-        print(f"Error in publish_scheduled_video_task for publication {publication_id}: {e}")
+        span.fail()
+        print(f"Batch render task failed for project {project_id}: {e}")
+        db.rollback()
+        for clip in leased: # A próxima submissão pode tentar de novo
+            fail_lease(db, render_lease_key(clip.id), lease_owner)
         raise
     finally:
+        span.finish(SessionLocal)
         db.close()
 
-# Opcional: Tarefa periódica para verificar agendamentos (adiada para pós-MVP)
-# @celery_app.task(name="app.workers.tasks.check_scheduled_publications_task")
-# def check_scheduled_publications_task():
-#     db = SessionLocal()
-#     now = datetime.utcnow()
-#     due_publications = db.query(models.ScheduledPublication).filter(
-#         models.ScheduledPublication.data_agendamento <= now,
-#         models.ScheduledPublication.status_publicacao == "pending"
-#     ).all()
-#
-#     for pub in due_publications:
-#         print(f"Found due publication: {pub.id}, dispatching publish_scheduled_video_task.")
-#         publish_scheduled_video_task.delay(pub.id)
-#     db.close()
-#     return {"due_publications_found": len(due_publications)}
+# acks_late desligado: reentregar após uma queda no meio do upload publicaria o vídeo duas vezes
+@celery_app.task(name="app.workers.tasks.publish_publications_batch_task", bind=True, acks_late=False)
+def publish_publications_batch_task(self, publication_ids: list):
+    """Uploads a batch of publications concurrently from this one task (async upload engine)."""
+    db = SessionLocal()
+    try:
+        outcome = YouTubePublishingService(db_session=db).publish_many(publication_ids, owner=self.request.id,
+                                                                       enqueued_at=task_enqueued_at(self))
+        published = [publication_id for publication_id, ok in outcome.items() if ok]
+        failed = [publication_id for publication_id, ok in outcome.items() if not ok]
+        print(f"Publication batch finished: {len(published)} published, {len(failed)} failed.")
+        return {"published": published, "failed": failed}
+    finally:
+        db.close()
+
+@celery_app.task(name="app.workers.tasks.schedule_due_publications_task", bind=True)
+def schedule_due_publications_task(self):
+    """
+    Periodic (beat) scheduler: claims the publications due before the next round in
+    indexed batches and dispatches them as ETA-bucketed batch uploads. Safe to run on
+    several replicas at once (rows are claimed with FOR UPDATE SKIP LOCKED).
+
+    Publications left queued by a dispatch that never reached the broker are returned
+    to pending first, so this same round claims them again.
+    """
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        requeued = requeue_stale_publications(db, now, settings.PUBLICATION_QUEUED_STALE_SECONDS)
+        if requeued:
+            print(f"Scheduler: {requeued} publications were stuck in queued; returned to pending.")
+        until = scheduler_horizon(now, settings.PUBLICATION_SCHEDULER_LOOKAHEAD_SECONDS)
+        dispatched = 0
+        tasks_sent = 0
+        while True:
+            claimed = claim_due_publications(db, until, settings.PUBLICATION_SCHEDULER_BATCH_SIZE)
+            for eta, batches in bucket_by_eta(claimed, settings.PUBLICATION_ETA_BUCKET_SECONDS,
+                                              settings.PUBLISH_MAX_CONCURRENT_UPLOADS).items():
+                for publication_ids in batches:
+                    publish_publications_batch_task.apply_async(args=[publication_ids], eta=eta)
+                    tasks_sent += 1
+            dispatched += len(claimed)
+            if len(claimed) < settings.PUBLICATION_SCHEDULER_BATCH_SIZE:
+                break
+        if dispatched:
+            print(f"Scheduler: dispatched {dispatched} publications in {tasks_sent} tasks.")
+        return {"dispatched": dispatched, "tasks": tasks_sent, "requeued": requeued}
+    finally:
+        db.close()
+
+def trim_pending_clips_to_top_k(db, project_id: int, k: int) -> int:
+    """Deletes the lowest-scored pending suggestions beyond the k best. Returns how many were removed."""
+    pending = db.query(models.SuggestedClip).filter(
+        models.SuggestedClip.project_id == project_id,
+        models.SuggestedClip.status_aprovacao == "pending"
+    ).all()
+    if len(pending) <= k:
+        return 0
+    keep = {clip.id for clip in heapq.nlargest(k, pending, key=lambda clip: clip.score_viralidade_inicial or 0.0)}
+    removed = [clip for clip in pending if clip.id not in keep]
+    for clip in removed:
+        db.delete(clip)
+    return len(removed)
+
 
 @celery_app.task(name="app.workers.tasks.analyze_retention_task", bind=True, max_retries=3)
 def analyze_retention_task(self, download_result: dict):
@@ -134,17 +511,20 @@ def analyze_retention_task(self, download_result: dict):
     duration_seconds = download_result["duration_seconds"]
 
     db = SessionLocal()
-    project = db.query(models.Project).filter(models.Project.id == project_id).first()
-    if not project:
-        print(f"Project {project_id} not found for retention analysis.")
-        return {"project_id": project_id, "status": "project_not_found"}
+    span = StageSpan("analysis", self, project_id=project_id)
+    project = None
     try:
+        project = db.query(models.Project).filter(models.Project.id == project_id).first()
+        if not project:
+            print(f"Project {project_id} not found for retention analysis.")
+            return {"project_id": project_id, "status": "project_not_found"}
         print(f"Starting retention analysis for project {project_id}")
-        project.status = "processing_retention"
+        if project.status not in PIPELINE_FAILED_STATUSES:
+            project.status = "processing_retention"
         db.commit()
 
         analyzer = YouTubeAnalyzerService(video_id=youtube_url, project_id=project_id)
-        retention_data = analyzer.get_audience_retention_data()
+        retention_data = analyzer.get_cached_audience_retention_data() # Compartilhado entre projetos do mesmo vídeo
 
         serializable_retention_data = [list(item) for item in retention_data]
         project.retention_data_json = json.loads(json.dumps(serializable_retention_data))
@@ -152,47 +532,224 @@ def analyze_retention_task(self, download_result: dict):
         detected_peaks_timestamps = analyzer.detect_retention_peaks(retention_data)
         print(f"Project {project_id} - Detected retention peaks (timestamps): {detected_peaks_timestamps}")
 
-        # Delete only old clips that are still pending approval.
-        # This preserves clips that have been approved or rejected by the user.
-        db.query(models.SuggestedClip).filter(
-            models.SuggestedClip.project_id == project_id,
-            models.SuggestedClip.status_aprovacao == 'pending_approval'
-        ).delete(synchronize_session=False)
+        # Só os top-k candidatos por score chegam à aprovação/render
+        ranked_clips = rank_clip_candidates(retention_data, detected_peaks_timestamps,
+                                            loudness=project.audio_loudness_json)
+        if project.scene_cuts_json: # Reanálise: a fonte já foi indexada
+            ranked_clips = [(*snap_clip_bounds(start, end, project.scene_cuts_json, min_duration=CLIP_MIN_DURATION_SECONDS), score)
+                            for start, end, score in ranked_clips]
+        print(f"Project {project_id} - Top {len(ranked_clips)} scored clips: {ranked_clips}")
+        # Uma transação: diff por intervalo com os clipes existentes (aprovados/rejeitados ficam
+        # intactos, pendentes reencontrados não são duplicados) e um único INSERT dos novos
+        synced = sync_suggested_clips(db, project_id, ranked_clips)
+        # Condicional: o download em paralelo pode ter falhado enquanto analisávamos
+        db.query(models.Project).filter(
+            models.Project.id == project_id,
+            models.Project.status.notin_(PIPELINE_FAILED_STATUSES)
+        ).update({"status": "clips_suggested" if synced.total else "retention_analyzed"}, synchronize_session=False)
         db.commit()
 
-        # Create new instances of SuggestedClip
-        for start_time, end_time in detected_peaks_timestamps:
-            # Aplicar filtros básicos de duração do clipe aqui (Ex: Passo C do briefing)
-            clip_duration = end_time - start_time
-            if not (10 <= clip_duration <= 180): # Ex: clipes entre 10s e 3 minutos
-                print(f"Skipping peak ({start_time}-{end_time}) for project {project_id} due to duration: {clip_duration}s")
-                continue
+        return {"project_id": project_id, "status": project.status, "peaks_found": len(detected_peaks_timestamps),
+                "clips_added": synced.inserted, "clips_removed": synced.deleted}
+    except Exception as e:
+        span.fail()
+        print(f"Retention analysis failed for project {project_id}: {e}")
+        if project:
+            project.status = "retention_analysis_failed"
+            project.processing_error = str(e)
+            db.commit()
+        raise
+    finally:
+        span.finish(SessionLocal)
+        db.close()
 
-            suggested_clip = models.SuggestedClip(
-                project_id=project_id,
-                timestamp_inicio_segundos=start_time,
-                timestamp_fim_segundos=end_time,
-                # score_viralidade_inicial pode ser preenchido aqui se o algoritmo o calcular
-            )
-            db.add(suggested_clip)
+@celery_app.task(name="app.workers.tasks.finalize_project_pipeline_task", bind=True)
+def finalize_project_pipeline_task(self, branch_results: list):
+    """Chord body: runs once both the source download and the retention analysis finished."""
+    project_id = branch_results[0]["project_id"]
+    db = SessionLocal()
+    try:
+        project = db.query(models.Project).filter(models.Project.id == project_id).first()
+        if not project:
+            return {"project_id": project_id, "status": "project_not_found"}
+        dispatched = dispatch_clips_waiting_for_source(project_id, db)
+        dispatch_source_analyses(project) # Índice de cenas e loudness só depois que a fonte existe
+        print(f"Project {project_id} pipeline finished (status: {project.status}).")
+        return {"project_id": project_id, "status": project.status, "dispatched_clip_ids": dispatched}
+    finally:
+        db.close()
+
+@celery_app.task(name="app.workers.tasks.ingest_retention_chunk_task", bind=True, max_retries=3)
+def ingest_retention_chunk_task(self, project_id: int, retention_chunk: list, final: bool = False):
+    """
+    Feeds a chunk of freshly arrived retention points to the project's streaming peak
+    detector and suggests the clips of the peaks it finalized. `final` marks the end
+    of the series (flushes peaks still open).
+
+    Chunks of the same project run one at a time (the project row is locked until the
+    commit), and points the detector has already received are ignored, so a redelivered
+    or late chunk cannot rewind the detector state.
+    """
+    db = SessionLocal()
+    try:
+        project = db.query(models.Project).filter(models.Project.id == project_id).with_for_update().first()
+        if not project:
+            return {"project_id": project_id, "status": "project_not_found"}
+
+        if project.retention_stream_state:
+            detector = StreamingPeakDetector.from_dict(project.retention_stream_state)
+        else:
+            detector = StreamingPeakDetector()
+        last_received = detector.last_received_timestamp()
+        points = [tuple(point) for point in retention_chunk if last_received is None or point[0] > last_received]
+        if len(points) < len(retention_chunk):
+            print(f"Project {project_id}: ignored {len(retention_chunk) - len(points)} retention points already ingested.")
+        peaks = detector.feed(points)
+        if final:
+            peaks += detector.close()
+
+        # Só os pontos novos são gravados; a série inteira é montada uma vez, no chunk final
+        append_retention_chunk(db, project_id, points)
+        project.retention_stream_state = None if final else detector.to_dict()
+        scored_peaks = []
+        if peaks:
+            # Pontuar só com o trecho recente que cobre os picos (e a janela da média móvel antes deles):
+            # mesmo score que sobre a série inteira, sem reler o histórico a cada chunk
+            recent = load_retention_since(db, project_id, min(start for start, _ in peaks) - detector.context_seconds())
+            scored_peaks = rank_clip_candidates(recent, peaks, top_k=len(peaks), loudness=project.audio_loudness_json)
+        if final:
+            consolidate_retention_chunks(db, project)
+        added = sync_suggested_clips(db, project_id, scored_peaks, replace_pending=False).inserted
+        trimmed = trim_pending_clips_to_top_k(db, project_id, settings.CLIP_TOP_K)
+        if added and project.status not in PIPELINE_FAILED_STATUSES:
+            project.status = "clips_suggested"
+        db.commit()
+        print(f"Project {project_id}: ingested {len(points)} retention points, {len(peaks)} peaks finalized, "
+              f"{added} clips suggested, {trimmed} lower-scored pending clips trimmed.")
+        return {"project_id": project_id, "status": project.status, "peaks_found": len(peaks),
+                "clips_added": added, "clips_trimmed": trimmed}
+    except Exception as e:
+        print(f"Retention chunk ingestion failed for project {project_id}: {e}")
+        raise
+    finally:
+        db.close()
 
-        project.status = "retention_analyzed"
+@celery_app.task(name="app.workers.tasks.build_scene_index_task", bind=True, max_retries=1)
+def build_scene_index_task(self, project_id: int):
+    """Indexes the scene cuts of the project's source once and snaps the pending suggestions to them."""
+    db = SessionLocal()
+    span = StageSpan("scene_index", self, project_id=project_id)
+    try:
+        project = db.query(models.Project).filter(models.Project.id == project_id).first()
+        if not project:
+            return {"project_id": project_id, "status": "project_not_found"}
+        cuts = build_scene_index(project, db, run_command=get_render_scheduler().run)
+
+        snapped = 0
+        for clip in project.suggested_clips:
+            if clip.status_aprovacao != "pending": # Aprovados/rejeitados mantêm os limites escolhidos pelo usuário
+                continue
+            start, end = snap_clip_bounds(clip.timestamp_inicio_segundos, clip.timestamp_fim_segundos, cuts,
+                                          min_duration=CLIP_MIN_DURATION_SECONDS)
+            if (start, end) != (clip.timestamp_inicio_segundos, clip.timestamp_fim_segundos):
+                clip.timestamp_inicio_segundos, clip.timestamp_fim_segundos = start, end
+                snapped += 1
         db.commit()
+        print(f"Project {project_id}: snapped {snapped} pending clips to scene cuts.")
+        return {"project_id": project_id, "scene_cuts": len(cuts), "snapped_clips": snapped}
+    except Exception as e:
+        span.fail()
+        db.rollback()
+        # Falha não bloqueia o projeto (nem o chord do modo automático): os clipes apenas ficam sem ajuste de corte
+        print(f"Scene index failed for project {project_id}: {e}")
+        return {"project_id": project_id, "status": "failed", "error": str(e), "scene_cuts": None}
+    finally:
+        span.finish(SessionLocal)
+        db.close()
 
-        # TODO: Próximo passo seria disparar uma tarefa para gerar os clipes com base nesses picos.
-        # Se houver clipes sugeridos, pode-se mudar status para "clips_suggested"
-        if db.query(models.SuggestedClip).filter(models.SuggestedClip.project_id == project_id).count() > 0:
-            project.status = "clips_suggested" # Novo status
+@celery_app.task(name="app.workers.tasks.build_loudness_track_task", bind=True, max_retries=1)
+def build_loudness_track_task(self, project_id: int):
+    """
+    Measures the per-second loudness of the project's source once, then rescores the
+    pending suggestions with the audio feature. Renders reuse the same track for
+    single-pass loudnorm.
+    """
+    db = SessionLocal()
+    span = StageSpan("loudness", self, project_id=project_id)
+    try:
+        project = db.query(models.Project).filter(models.Project.id == project_id).first()
+        if not project:
+            return {"project_id": project_id, "status": "project_not_found"}
+        track = build_loudness_track(project, db, run_command=get_render_scheduler().run)
+
+        pending = [clip for clip in project.suggested_clips if clip.status_aprovacao == "pending"]
+        series = retention_series(db, project) if pending else []
+        if series:
+            scores = score_clip_candidates(
+                series,
+                [(clip.timestamp_inicio_segundos, clip.timestamp_fim_segundos) for clip in pending],
+                loudness=track,
+            )
+            for clip, score in zip(pending, scores):
+                clip.score_viralidade_inicial = float(score)
             db.commit()
+        print(f"Project {project_id}: rescored {len(pending)} pending clips with the loudness track.")
+        return {"project_id": project_id, "seconds": len(track["loudness"]), "rescored_clips": len(pending)}
+    except Exception as e:
+        span.fail()
+        db.rollback()
+        # Falha não bloqueia o projeto (nem o chord do modo automático): clipes ficam com o score só de retenção e sem loudnorm
+        print(f"Loudness analysis failed for project {project_id}: {e}")
+        return {"project_id": project_id, "status": "failed", "error": str(e), "seconds": None}
+    finally:
+        span.finish(SessionLocal)
+        db.close()
 
+@celery_app.task(name="app.workers.tasks.auto_render_project_clips_task", bind=True)
+def auto_render_project_clips_task(self, project_id: int):
+    """
+    Auto mode: fans the project's top-N suggestions out as a group of render tasks
+    (any worker of the fleet picks them up); the chord callback marks the project
+    clips_rendered once every render finished.
+    """
+    db = SessionLocal()
+    try:
+        project = db.query(models.Project).filter(models.Project.id == project_id).first()
+        if not project:
+            return {"project_id": project_id, "status": "project_not_found"}
+        if not project.auto_render_top_n or not _source_ready(project) or project.status in PIPELINE_FAILED_STATUSES:
+            return {"project_id": project_id, "status": project.status, "dispatched_clip_ids": []}
 
-        return {"project_id": project_id, "status": project.status, "peaks_found": len(detected_peaks_timestamps)}
-    except Exception as e:
-        print(f"Retention analysis failed for project {project_id}: {e}")
-        if project:
-            project.status = "retention_analysis_failed"
-            project.processing_error = str(e)
+        clip_ids = claim_clips_for_auto_render(db, project_id, project.auto_render_top_n)
+        if not clip_ids:
+            print(f"Project {project_id}: no clips left to auto-render.")
+            return {"project_id": project_id, "status": project.status, "dispatched_clip_ids": []}
+
+        project.status = "rendering_clips"
+        db.commit()
+        chord(
+            [process_video_clip_task.si(clip_id, render_mode=RENDER_MODE_VERTICAL, auto_render=True) for clip_id in clip_ids],
+            mark_project_clips_rendered_task.s(project_id)
+        ).delay()
+        print(f"Project {project_id}: auto-rendering clips {clip_ids}")
+        return {"project_id": project_id, "status": project.status, "dispatched_clip_ids": clip_ids}
+    finally:
+        db.close()
+
+@celery_app.task(name="app.workers.tasks.mark_project_clips_rendered_task", bind=True)
+def mark_project_clips_rendered_task(self, render_results: list, project_id: int):
+    """Chord callback of the auto-render fan-out."""
+    db = SessionLocal()
+    try:
+        project = db.query(models.Project).filter(models.Project.id == project_id).first()
+        if not project:
+            return {"project_id": project_id, "status": "project_not_found"}
+        rendered = [result["clip_id"] for result in render_results if result.get("status") == "processing_complete"]
+        failed = [result["clip_id"] for result in render_results if result.get("status") == "processing_failed"]
+        if project.status not in PIPELINE_FAILED_STATUSES:
+            project.status = "clips_rendered"
             db.commit()
-        raise
+        print(f"Project {project_id} auto-render finished: {len(rendered)} rendered, {len(failed)} failed.")
+        return {"project_id": project_id, "status": project.status, "rendered_clip_ids": rendered, "failed_clip_ids": failed}
     finally:
         db.close()
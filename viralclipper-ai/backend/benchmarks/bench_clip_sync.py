@@ -0,0 +1,104 @@
+"""
+Suggested clip persistence benchmark: hundreds of projects re-analyzed back to back, the
+legacy path (delete + commit, one db.add per clip, commit, count(), commit) against
+sync_suggested_clips (interval diff and one multi-row INSERT in a single transaction).
+
+Runs on a temporary SQLite file by default (commits pay a real fsync); set
+BENCH_DATABASE_URL to measure against Postgres. The legacy path is measured with its
+delete filter fixed ('pending'); as shipped it matched nothing and only piled up rows.
+"""
+import os
+import random
+import tempfile
+from pathlib import Path
+
+from benchmarks.harness import run_isolated, timed
+
+DEFAULT_PROJECTS = [100, 500]
+EXISTING_PENDING = 10 # Sugestões pendentes de uma análise anterior
+EXISTING_DECIDED = 3 # Aprovadas/rejeitadas pelo usuário
+CANDIDATES = 10 # Metade reencontra clipes existentes (levemente deslocados), metade é nova
+
+
+def _seed(session_factory, projects: int) -> dict:
+    from app.db.models import User, Project, SuggestedClip
+    random.seed(projects)
+    db = session_factory()
+    user = User(email="bench@example.com", hashed_password="x")
+    db.add(user)
+    db.commit()
+    candidates = {}
+    for project_index in range(projects):
+        project = Project(youtube_url=f"https://youtu.be/{project_index}", owner_id=user.id, status="clips_suggested")
+        db.add(project)
+        db.flush()
+        starts = random.sample(range(0, 3600, 60), EXISTING_PENDING + EXISTING_DECIDED + CANDIDATES // 2)
+        existing, new = starts[:EXISTING_PENDING + EXISTING_DECIDED], starts[EXISTING_PENDING + EXISTING_DECIDED:]
+        for i, start in enumerate(existing):
+            db.add(SuggestedClip(project_id=project.id, timestamp_inicio_segundos=start, timestamp_fim_segundos=start + 30,
+                                 status_aprovacao="pending" if i < EXISTING_PENDING else random.choice(["approved", "rejected"]),
+                                 score_viralidade_inicial=random.random()))
+        shifted = [start + random.randint(-2, 2) for start in existing[:CANDIDATES - len(new)]]
+        candidates[project.id] = [(start, start + 30, random.random()) for start in shifted + new]
+    db.commit()
+    db.close()
+    return candidates
+
+
+def _legacy_reanalysis(db, project_id: int, candidates: list):
+    from app.db import models
+    db.query(models.SuggestedClip).filter(
+        models.SuggestedClip.project_id == project_id,
+        models.SuggestedClip.status_aprovacao == "pending"
+    ).delete(synchronize_session=False)
+    db.commit()
+    for start_time, end_time, score in candidates:
+        db.add(models.SuggestedClip(project_id=project_id, timestamp_inicio_segundos=start_time,
+                                    timestamp_fim_segundos=end_time, score_viralidade_inicial=score))
+    db.commit()
+    db.query(models.SuggestedClip).filter(models.SuggestedClip.project_id == project_id).count()
+    db.commit()
+
+
+def _bulk_reanalysis(db, project_id: int, candidates: list):
+    from app.services.clip_suggestions import sync_suggested_clips
+    sync_suggested_clips(db, project_id, candidates)
+    db.commit()
+
+
+def reanalysis_case(projects: int, strategy: str) -> dict:
+    from sqlalchemy import create_engine, event
+    from sqlalchemy.orm import sessionmaker
+    from app.db.database import Base
+    from app.db.models import SuggestedClip
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(os.environ.get("BENCH_DATABASE_URL") or f"sqlite:///{Path(tmp) / 'bench.db'}")
+        Base.metadata.drop_all(engine)
+        Base.metadata.create_all(engine)
+        session_factory = sessionmaker(autoflush=False, bind=engine)
+        candidates = _seed(session_factory, projects) # Fora da medição
+
+        statements = []
+        event.listen(engine, "before_cursor_execute", lambda *args: statements.append(1))
+        reanalyze = _legacy_reanalysis if strategy == "legacy" else _bulk_reanalysis
+        result = {"projects": projects, "strategy": strategy}
+        db = session_factory()
+        with timed(result):
+            for project_id, project_candidates in candidates.items():
+                reanalyze(db, project_id, project_candidates)
+        result["statements"] = len(statements)
+        result["clips_after"] = db.query(SuggestedClip).count()
+        db.close()
+        engine.dispose()
+    result["projects_per_second"] = round(projects / result["wall_seconds"], 1)
+    return result
+
+
+def run(projects=None) -> list[dict]:
+    results = []
+    for count in projects or DEFAULT_PROJECTS:
+        for strategy in ("legacy", "bulk"):
+            results.append(run_isolated(f"clip_reanalysis_{strategy}[{count}]", reanalysis_case,
+                                        projects=count, strategy=strategy))
+    return results
@@ -0,0 +1,50 @@
+"""
+Retention peak detection benchmark: detect_retention_peaks and _merge_peaks over mock
+retention series (get_mock_audience_retention) from 1k to 10M points.
+"""
+import random
+
+from benchmarks.harness import run_isolated, best_of
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000, 10_000_000]
+SEGMENT_SECONDS = 5 # get_mock_audience_retention gera um ponto a cada 5s
+
+
+def _mock_series(points: int):
+    from app.services.youtube_analyzer import get_mock_audience_retention
+    random.seed(points)
+    return get_mock_audience_retention(video_duration_seconds=points * SEGMENT_SECONDS)
+
+
+def detect_peaks_case(points: int, repeat: int) -> dict:
+    from app.services.youtube_analyzer import YouTubeAnalyzerService
+    series = _mock_series(points) # Geração fora da medição
+    analyzer = YouTubeAnalyzerService()
+    result = {"points": len(series)}
+    peaks = best_of(result, lambda: analyzer.detect_retention_peaks(series), repeat)
+    result["peaks"] = len(peaks)
+    return result
+
+
+def merge_peaks_case(points: int, repeat: int) -> dict:
+    from app.services.youtube_analyzer import (
+        YouTubeAnalyzerService, pad_retention_series, moving_average_matrix, peak_state_matrix, raw_peak_arrays
+    )
+    series = _mock_series(points)
+    timestamps, values, lengths = pad_retention_series([series])
+    state = peak_state_matrix(values, moving_average_matrix(values, lengths, 12), lengths, 1.15)
+    _, starts, ends = raw_peak_arrays(timestamps, state, lengths)
+    raw_peaks = list(zip(starts.tolist(), ends.tolist()))
+    result = {"points": len(series), "raw_peaks": len(raw_peaks)}
+    merged = best_of(result, lambda: YouTubeAnalyzerService()._merge_peaks(raw_peaks, 15), repeat)
+    result["merged_peaks"] = len(merged)
+    return result
+
+
+def run(sizes=None) -> list[dict]:
+    results = []
+    for points in sizes or DEFAULT_SIZES:
+        repeat = 5 if points <= 1_000_000 else 1 # As séries grandes já dominam o ruído do timer
+        results.append(run_isolated(f"detect_retention_peaks[{points}]", detect_peaks_case, points=points, repeat=repeat))
+        results.append(run_isolated(f"merge_peaks[{points}]", merge_peaks_case, points=points, repeat=repeat))
+    return results
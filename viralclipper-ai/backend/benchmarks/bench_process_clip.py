@@ -0,0 +1,79 @@
+"""
+process_clip benchmark over synthetic sources (ffmpeg lavfi testsrc2) at 720p, 1080p
+and 4K. Reports the render speed ratio (clip seconds rendered per wall second).
+
+Sources are generated in the parent process before the cases run, so neither the
+timing nor the peak RSS of a case includes the ffmpeg that builds its fixture. Without
+ffmpeg in PATH every case is reported as skipped.
+"""
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+
+from benchmarks.harness import run_isolated, skipped_case, timed
+
+RESOLUTIONS = {"720p": "1280x720", "1080p": "1920x1080", "4k": "3840x2160"}
+
+
+def make_source(path: Path, seconds: int, size: str):
+    subprocess.run([
+        'ffmpeg', '-y', '-v', 'error',
+        '-f', 'lavfi', '-i', f'testsrc2=size={size}:rate=30:duration={seconds}',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds}',
+        '-c:v', 'libx264', '-preset', 'veryfast', '-g', '60', '-c:a', 'aac', '-shortest', str(path)
+    ], check=True)
+
+
+def process_clip_case(source: str, clip_seconds: int, render_mode: str) -> dict:
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from app.core.config import settings
+    from app.db.database import Base
+    from app.db import models
+    from app.services.video_processor import process_clip
+
+    with tempfile.TemporaryDirectory() as tmp:
+        media_root = Path(tmp)
+        settings.MEDIA_ROOT_PATH = str(media_root) # Cache de render vazio: todo caso é um render real
+
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        db = sessionmaker(bind=engine)()
+        project = models.Project(youtube_url="https://youtu.be/benchmark00", original_video_path=source)
+        db.add(project)
+        db.commit()
+        clip = models.SuggestedClip(project_id=project.id, timestamp_inicio_segundos=1,
+                                    timestamp_fim_segundos=1 + clip_seconds, status_aprovacao="approved")
+        db.add(clip)
+        db.commit()
+
+        result = {"clip_seconds": clip_seconds}
+        with timed(result):
+            process_clip(clip.id, db, render_mode=render_mode)
+        result["render_speed_ratio"] = round(clip_seconds / result["wall_seconds"], 3)
+        db.close()
+        return result
+
+
+def run(resolutions=None, clip_seconds: int = 10, render_modes=("vertical", "straight_cut")) -> list[dict]:
+    cases = [(resolution, render_mode) for resolution in resolutions or list(RESOLUTIONS) for render_mode in render_modes]
+    if not shutil.which("ffmpeg"):
+        # Não aborta a suíte: os outros benchmarks (peaks, clips, publish) seguem
+        return [skipped_case(f"process_clip[{resolution},{render_mode}]", "ffmpeg not found in PATH",
+                             resolution=resolution, clip_seconds=clip_seconds, render_mode=render_mode)
+                for resolution, render_mode in cases]
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        sources = {}
+        for resolution, render_mode in cases:
+            if resolution not in sources:
+                sources[resolution] = Path(tmp) / f"source_{resolution}.mp4"
+                make_source(sources[resolution], clip_seconds + 2, RESOLUTIONS[resolution])
+            result = run_isolated(
+                f"process_clip[{resolution},{render_mode}]", process_clip_case,
+                source=str(sources[resolution]), clip_seconds=clip_seconds, render_mode=render_mode
+            )
+            result["params"] = {"resolution": resolution, "clip_seconds": clip_seconds, "render_mode": render_mode}
+            results.append(result)
+    return results
@@ -0,0 +1,48 @@
+"""
+Publishing throughput benchmark: AsyncUploadEngine against the local fake upload
+server (benchmarks/fake_upload_server.py), concurrent vs one upload at a time.
+"""
+import asyncio
+import os
+import tempfile
+from pathlib import Path
+
+from benchmarks.harness import run_isolated, timed
+
+DEFAULT_CASES = [(16, 8), (64, 8)] # (uploads, MiB por arquivo)
+CHUNK_BYTES = 1024 * 1024
+LATENCY_SECONDS = 0.02 # RTT simulado por requisição
+ACCOUNTS = 8
+
+
+def publish_case(uploads: int, size_mb: int, max_concurrent: int) -> dict:
+    from app.services.upload_engine import AsyncUploadEngine, UploadJob
+    from benchmarks.fake_upload_server import start_fake_upload_server
+
+    server = start_fake_upload_server(latency=LATENCY_SECONDS)
+    with tempfile.TemporaryDirectory() as tmp:
+        source = Path(tmp) / "clip.mp4"
+        source.write_bytes(os.urandom(size_mb * 1024 * 1024))
+        jobs = [UploadJob(publication_id=i, account_id=i % ACCOUNTS, access_token="token", file_path=source,
+                          metadata={"snippet": {"title": f"clip {i}"}, "status": {"privacyStatus": "private"}})
+                for i in range(uploads)]
+        engine = AsyncUploadEngine(server.upload_url, max_concurrent=max_concurrent,
+                                   per_account_limit=max_concurrent, chunk_size=CHUNK_BYTES)
+        result = {"uploads": uploads, "size_mb": size_mb}
+        with timed(result):
+            results = asyncio.run(engine.upload_many(jobs))
+    server.shutdown()
+    result["failed"] = sum(1 for upload in results if not upload.ok)
+    result["uploads_per_second"] = round(uploads / result["wall_seconds"], 2)
+    result["throughput_mb_s"] = round(uploads * size_mb / result["wall_seconds"], 1)
+    return result
+
+
+def run(cases=None) -> list[dict]:
+    results = []
+    for uploads, size_mb in cases or DEFAULT_CASES:
+        results.append(run_isolated(f"publish_sequential[{uploads}x{size_mb}MiB]", publish_case,
+                                    uploads=uploads, size_mb=size_mb, max_concurrent=1))
+        results.append(run_isolated(f"publish_concurrent[{uploads}x{size_mb}MiB]", publish_case,
+                                    uploads=uploads, size_mb=size_mb, max_concurrent=32))
+    return results
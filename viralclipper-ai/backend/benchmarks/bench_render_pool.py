@@ -0,0 +1,107 @@
+"""
+Throughput benchmark for the RenderScheduler: clips rendered per minute as the
+number of cores available to the worker grows.
+
+Usage (from viralclipper-ai/backend; without ffmpeg in PATH every core count is reported as skipped):
+    python -m benchmarks.bench_render_pool --clips 8 --clip-seconds 10 --output render_pool.json
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import wait
+from pathlib import Path
+
+from app.services.video_processor import build_vertical_filter, VERTICAL_ENCODER_ARGS
+from app.workers.render_pool import RenderScheduler, available_cpus
+
+
+def make_source(path: Path, seconds: int, size: str):
+    subprocess.run([
+        'ffmpeg', '-y', '-v', 'error',
+        '-f', 'lavfi', '-i', f'testsrc2=size={size}:rate=30:duration={seconds}',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds}',
+        '-c:v', 'libx264', '-preset', 'veryfast', '-c:a', 'aac', '-shortest', str(path)
+    ], check=True)
+
+
+def clip_command(source: Path, start: int, seconds: int, output: Path) -> list[str]:
+    return [
+        'ffmpeg', '-v', 'error',
+        '-ss', str(start), '-i', str(source), '-t', str(seconds),
+        '-vf', build_vertical_filter(), *VERTICAL_ENCODER_ARGS, '-y', str(output)
+    ]
+
+
+def run_for_cores(cores: int, source: Path, work_dir: Path, clips: int, clip_seconds: int) -> dict:
+    all_cpus = sorted(os.sched_getaffinity(0))
+    os.sched_setaffinity(0, all_cpus[:cores]) # ffmpeg herda a afinidade do processo
+    try:
+        scheduler = RenderScheduler(cpus=cores)
+        started = time.perf_counter()
+        futures = [
+            scheduler.submit(clip_command(source, i * clip_seconds, clip_seconds, work_dir / f"clip_{cores}_{i}.mp4"))
+            for i in range(clips)
+        ]
+        wait(futures)
+        for future in futures:
+            future.result()
+        elapsed = time.perf_counter() - started
+    finally:
+        os.sched_setaffinity(0, all_cpus)
+    return {
+        "cores": cores,
+        "max_jobs": scheduler.max_jobs,
+        "threads_per_job": scheduler.threads_per_job,
+        "clips": clips,
+        "seconds": round(elapsed, 3),
+        "clips_per_minute": round(clips * 60 / elapsed, 2),
+    }
+
+
+def run(core_counts: list[int], clips: int, clip_seconds: int, source_size: str) -> list[dict]:
+    """One result per core count; all of them skipped (not an error) without ffmpeg in PATH."""
+    if not shutil.which("ffmpeg"):
+        return [{"cores": cores, "clips": clips, "skipped": "ffmpeg not found in PATH"} for cores in core_counts]
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(tmp)
+        source = work_dir / "source.mp4"
+        make_source(source, clips * clip_seconds, source_size) # Fora da medição de cada contagem de núcleos
+        for cores in core_counts:
+            results.append(run_for_cores(cores, source, work_dir, clips, clip_seconds))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clips", type=int, default=8)
+    parser.add_argument("--clip-seconds", type=int, default=10)
+    parser.add_argument("--source-size", default="1920x1080")
+    parser.add_argument("--cores", default=None, help="Comma separated core counts (default: 1,2,4,... up to available)")
+    parser.add_argument("--output", default=None, help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    max_cores = available_cpus()
+    if args.cores:
+        core_counts = [int(c) for c in args.cores.split(",")]
+    else:
+        core_counts = [c for c in (1, 2, 4, 8, 16, 32, 64) if c < max_cores] + [max_cores]
+
+    results = run(core_counts, args.clips, args.clip_seconds, args.source_size)
+    for result in results:
+        if "skipped" in result:
+            print(f"cores={result['cores']:>3} SKIPPED {result['skipped']}")
+            continue
+        print(f"cores={result['cores']:>3} jobs={result['max_jobs']:>2} threads/job={result['threads_per_job']:>2} "
+              f"{result['clips_per_minute']:>8.2f} clips/min")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps({"benchmark": "render_pool", "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
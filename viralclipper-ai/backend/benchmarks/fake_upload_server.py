@@ -0,0 +1,105 @@
+"""
+Local stand-in for the YouTube resumable upload endpoint, so publishing throughput
+can be measured without touching YouTube. Uploaded bytes are counted and discarded.
+
+Usage (from viralclipper-ai/backend):
+    python -m benchmarks.fake_upload_server --port 8765 --latency 0.05 --failure-rate 0.02
+    # YOUTUBE_UPLOAD_URL=http://localhost:8765/upload/youtube/v3/videos PUBLISH_SIMULATE=false
+"""
+import argparse
+import itertools
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+UPLOAD_PATH = "/upload/youtube/v3/videos"
+CONTENT_RANGE = re.compile(r"bytes (\*|(\d+)-(\d+))/(\d+)")
+
+
+class FakeUploadServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency: float = 0.0, failure_rate: float = 0.0):
+        super().__init__(address, FakeUploadHandler)
+        self.latency = latency # Atraso por requisição (simula RTT + processamento)
+        self.failure_rate = failure_rate # Fração de chunks respondidos com 503
+        self.sessions = {} # session_id -> bytes recebidos
+        self.completed = 0
+        self.lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    @property
+    def upload_url(self) -> str:
+        return f"http://{self.server_address[0]}:{self.server_address[1]}{UPLOAD_PATH}"
+
+
+class FakeUploadHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive: o cliente reaproveita conexões como faria com o YouTube
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, headers: dict = None, body: bytes = b""):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0))) # Metadados do vídeo
+        time.sleep(self.server.latency)
+        with self.server.lock:
+            session_id = next(self.server._ids)
+            self.server.sessions[session_id] = 0
+        self._reply(200, {"Location": f"{self.server.upload_url}?upload_id={session_id}"})
+
+    def do_PUT(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.server.latency)
+        session_id = int(self.path.rsplit("upload_id=", 1)[1])
+        match = CONTENT_RANGE.match(self.headers.get("Content-Range", ""))
+        if session_id not in self.server.sessions or not match:
+            self._reply(404)
+            return
+        total = int(match.group(4))
+        if match.group(1) != "*": # Consulta de status ("bytes */total") nunca falha
+            if random.random() < self.server.failure_rate:
+                self._reply(503)
+                return
+            with self.server.lock:
+                received = self.server.sessions[session_id]
+                if int(match.group(2)) == received: # Chunk fora de ordem é ignorado; o 308 diz onde retomar
+                    self.server.sessions[session_id] = received + len(body)
+        received = self.server.sessions[session_id]
+        if received >= total:
+            with self.server.lock:
+                self.server.completed += 1
+            self._reply(200, {"Content-Type": "application/json"}, f'{{"id": "fake_{session_id}"}}'.encode())
+        else:
+            self._reply(308, {"Range": f"bytes=0-{received - 1}"} if received else {})
+
+
+def start_fake_upload_server(latency: float = 0.0, failure_rate: float = 0.0, port: int = 0) -> FakeUploadServer:
+    """Starts the server on a daemon thread (port 0 = any free port). Stop it with server.shutdown()."""
+    server = FakeUploadServer(("127.0.0.1", port), latency, failure_rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every request")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of chunks answered with 503")
+    args = parser.parse_args(argv)
+    server = FakeUploadServer(("0.0.0.0", args.port), args.latency, args.failure_rate)
+    print(f"Fake upload server listening on {server.upload_url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
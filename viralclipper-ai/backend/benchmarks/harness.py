@@ -0,0 +1,156 @@
+"""
+Shared pieces of the benchmark suite: isolated case execution (wall time and peak
+RSS), JSON result files and baseline comparison.
+"""
+import contextlib
+import io
+import json
+import multiprocessing
+import platform
+import queue as queue_module
+import resource
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+# Métricas comparadas com o baseline e o sentido em que piorar é regressão
+METRIC_DIRECTIONS = {
+    "wall_seconds": "lower_is_better",
+    "peak_rss_mb": "lower_is_better",
+    "render_speed_ratio": "higher_is_better",
+    "uploads_per_second": "higher_is_better",
+    "projects_per_second": "higher_is_better",
+}
+
+CASE_TIMEOUT_SECONDS = 1800 # Um caso travado (ffmpeg preso, servidor fake parado) não trava a suíte inteira
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss é em KiB no Linux; inclui processos filhos (ffmpeg)
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(max(self_rss, children_rss) / 1024, 1)
+
+
+def _run_case(case: Callable[..., dict], kwargs: dict, queue):
+    try:
+        with contextlib.redirect_stdout(io.StringIO()): # Os serviços logam com print
+            result = case(**kwargs)
+        result["peak_rss_mb"] = _peak_rss_mb()
+        queue.put(result)
+    except Exception as e:
+        queue.put({"error": f"{type(e).__name__}: {e}"})
+
+
+def _wait_result(process, queue, timeout_seconds: float) -> dict:
+    deadline = time.monotonic() + timeout_seconds
+    while True:
+        try:
+            return queue.get(timeout=1)
+        except queue_module.Empty:
+            pass
+        if not process.is_alive():
+            try: # O resultado pode ter sido enviado logo antes do processo sair
+                return queue.get(timeout=1)
+            except queue_module.Empty:
+                # Morreu sem resultado (OOM kill, segfault): exitcode negativo = sinal
+                return {"error": f"case process exited with code {process.exitcode} without a result"}
+        if time.monotonic() > deadline:
+            process.terminate()
+            return {"error": f"timed out after {timeout_seconds}s"}
+
+
+def run_isolated(name: str, case: Callable[..., dict], timeout_seconds: float = CASE_TIMEOUT_SECONDS, **kwargs) -> dict:
+    """
+    Runs one benchmark case in a fresh (spawned) process, so the peak RSS belongs to
+    that case alone. The case must time its own hot path and return
+    {"wall_seconds": ...} plus any extra metrics. A case that dies or exceeds
+    timeout_seconds is reported as an error instead of blocking the run.
+    """
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_run_case, args=(case, kwargs, queue))
+    process.start()
+    result = _wait_result(process, queue, timeout_seconds)
+    process.join()
+    return {"name": name, "params": kwargs, **result}
+
+
+def skipped_case(name: str, reason: str, **kwargs) -> dict:
+    """Result of a case that could not run here (e.g. ffmpeg missing); never a regression."""
+    return {"name": name, "params": kwargs, "skipped": reason}
+
+
+@contextlib.contextmanager
+def timed(result: dict):
+    """Stores the wall time of the with-block in result["wall_seconds"]."""
+    started = time.perf_counter()
+    yield
+    result["wall_seconds"] = round(time.perf_counter() - started, 4)
+
+
+def best_of(result: dict, fn: Callable, repeat: int = 5):
+    """Runs fn `repeat` times and stores the fastest wall time; returns fn's last result."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        value = fn()
+        timings.append(time.perf_counter() - started)
+    result["wall_seconds"] = round(min(timings), 6)
+    result["repeat"] = repeat
+    return value
+
+
+def write_results(path: Path, results: list[dict]):
+    payload = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "processor": platform.processor()},
+        "results": results,
+    }
+    Path(path).write_text(json.dumps(payload, indent=2))
+
+
+def load_results(path: Path) -> list[dict]:
+    return json.loads(Path(path).read_text())["results"]
+
+
+def compare_with_baseline(results: list[dict], baseline: list[dict], tolerance: float = 0.2,
+                          min_wall_seconds: float = 0.005) -> list[str]:
+    """
+    Returns a description of every metric that got worse than the baseline by more
+    than `tolerance` (relative). Cases are matched by name; new cases are ignored.
+    Wall times where both runs are below min_wall_seconds are timer noise and skipped.
+    """
+    baseline_by_name = {case["name"]: case for case in baseline}
+    regressions = []
+    for result in results:
+        reference = baseline_by_name.get(result["name"])
+        if not reference or any(key in case for case in (result, reference) for key in ("error", "skipped")):
+            continue
+        for metric, direction in METRIC_DIRECTIONS.items():
+            current, previous = result.get(metric), reference.get(metric)
+            if current is None or not previous:
+                continue
+            if metric == "wall_seconds" and max(current, previous) < min_wall_seconds:
+                continue
+            change = (current - previous) / previous
+            if direction == "higher_is_better":
+                change = -change
+            if change > tolerance:
+                regressions.append(f"{result['name']}: {metric} {previous} -> {current} ({change:+.0%} worse)")
+    return regressions
+
+
+def print_result(result: dict):
+    if "error" in result:
+        print(f"{result['name']:<40} ERROR {result['error']}")
+        return
+    if "skipped" in result:
+        print(f"{result['name']:<40} SKIPPED {result['skipped']}")
+        return
+    extra = f" speed={result['render_speed_ratio']:.2f}x" if "render_speed_ratio" in result else ""
+    if "uploads_per_second" in result:
+        extra = f" {result['uploads_per_second']:.2f} uploads/s {result['throughput_mb_s']:.1f} MiB/s"
+    if "projects_per_second" in result:
+        extra = f" {result['projects_per_second']:.1f} projects/s {result['statements']} statements"
+    print(f"{result['name']:<40} {result['wall_seconds']:>10.6f}s {result['peak_rss_mb']:>9.1f} MiB{extra}")
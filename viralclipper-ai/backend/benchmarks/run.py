@@ -0,0 +1,90 @@
+"""
+Benchmark suite for the analysis, rendering, clip persistence and publishing hot paths.
+Runs offline (mock retention data, lavfi test sources, a temporary SQLite database and a
+local fake upload server), writes JSON results and compares them to a baseline.
+
+Usage (from viralclipper-ai/backend; the render suite needs ffmpeg in PATH and is reported as skipped without it):
+    python -m benchmarks.run --suites peaks,render --output results.json
+    python -m benchmarks.run --suites publish
+    python -m benchmarks.run --suites clips --projects 100,500     # BENCH_DATABASE_URL=postgresql://... para Postgres
+    python -m benchmarks.run --suites peaks --save-baseline           # grava benchmarks/baseline.json
+    python -m benchmarks.run --baseline other_results.json            # compara com outro arquivo
+    python -m benchmarks.run --no-compare                             # só mede
+
+Every run is compared to benchmarks/baseline.json (when it exists) and exits with code 1
+on a regression; cases missing from the baseline are ignored. The committed baseline
+covers the peaks, clips and publish suites (render needs ffmpeg on the recording machine),
+and absolute timings only mean something on the machine that recorded it: re-record it
+with --save-baseline before comparing on another machine.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+from benchmarks import bench_peaks, bench_process_clip, bench_publish, bench_clip_sync
+from benchmarks.harness import write_results, load_results, compare_with_baseline, print_result
+
+DEFAULT_BASELINE = Path(__file__).parent / "baseline.json"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--suites", default="peaks,render", help="Comma separated: peaks, render, clips, publish")
+    parser.add_argument("--sizes", default=None, help="Retention series sizes in points (default: 1k..10M)")
+    parser.add_argument("--resolutions", default=None, help="Comma separated: 720p, 1080p, 4k (default: all)")
+    parser.add_argument("--clip-seconds", type=int, default=10)
+    parser.add_argument("--projects", default=None, help="Projects re-analyzed by the clips suite (default: 100,500)")
+    parser.add_argument("--output", default=None, help="Write results as JSON to this path")
+    parser.add_argument("--baseline", default=None, help=f"Compare against this results file (default: {DEFAULT_BASELINE})")
+    parser.add_argument("--no-compare", action="store_true", help="Skip the baseline comparison")
+    parser.add_argument("--save-baseline", action="store_true", help=f"Also write the results to {DEFAULT_BASELINE}")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    suites = [suite.strip() for suite in args.suites.split(",")]
+    results = []
+    if "peaks" in suites:
+        sizes = [int(size) for size in args.sizes.split(",")] if args.sizes else None
+        for result in bench_peaks.run(sizes):
+            print_result(result)
+            results.append(result)
+    if "render" in suites:
+        resolutions = args.resolutions.split(",") if args.resolutions else None
+        for result in bench_process_clip.run(resolutions, args.clip_seconds):
+            print_result(result)
+            results.append(result)
+    if "clips" in suites:
+        projects = [int(count) for count in args.projects.split(",")] if args.projects else None
+        for result in bench_clip_sync.run(projects):
+            print_result(result)
+            results.append(result)
+    if "publish" in suites:
+        for result in bench_publish.run():
+            print_result(result)
+            results.append(result)
+
+    if args.output:
+        write_results(Path(args.output), results)
+    if args.save_baseline:
+        write_results(DEFAULT_BASELINE, results)
+        print(f"Baseline saved to {DEFAULT_BASELINE}")
+
+    baseline_path = Path(args.baseline) if args.baseline else DEFAULT_BASELINE
+    if args.save_baseline or args.no_compare:
+        return
+    if not baseline_path.exists():
+        if args.baseline:
+            sys.exit(f"Baseline file not found: {baseline_path}")
+        print(f"No baseline at {baseline_path}; run with --save-baseline to record one.")
+        return
+    regressions = compare_with_baseline(results, load_results(baseline_path), args.tolerance)
+    if regressions:
+        print(f"Regressions against {baseline_path}:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print(f"No regressions against {baseline_path}.")
+
+
+if __name__ == "__main__":
+    main()